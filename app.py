@@ -8,7 +8,7 @@ create_app関数が定義されています。
 import os
 import logging
 from logging.handlers import RotatingFileHandler
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, render_template, request, redirect, url_for, jsonify
 from flask_debugtoolbar import DebugToolbarExtension
 from flask_mail import Mail
 from flask_migrate import Migrate
@@ -36,6 +36,9 @@ def create_app(config_name=None):
                 template_folder='apps/templates',
                 static_folder='apps/static',
                 static_url_path='/static')
+    # 検知アップロードはファイル部分を一時ファイルへ直接ストリーミング（apps/detector/uploads.py）
+    from apps.detector.uploads import StreamingUploadRequest
+    app.request_class = StreamingUploadRequest
     
     # 設定の読み込み
     from config import config
@@ -88,6 +91,9 @@ def create_app(config_name=None):
     # ログ設定（早めに初期化して以降のログを残す）
     configure_logging(app)
     
+    # 物体検知モデルの事前ロード（DETECTOR_PRELOAD_MODEL で opt-in）
+    configure_detector_warmup(app)
+    
     # ルートの登録
     register_routes(app)
     
@@ -168,6 +174,12 @@ def configure_logging(app):
     app.logger.info('アプリケーション起動 - ログ設定完了')
 
 
+def configure_detector_warmup(app):
+    """物体検知モデルの事前ロード・ウォームアップを構成"""
+    from apps.detector.warmup import init_detector_warmup
+    init_detector_warmup(app)
+
+
 def register_routes(app):
     """ルートを登録"""
     
@@ -185,6 +197,14 @@ def register_routes(app):
         app.logger.info(f'認証済みユーザー {current_user.username} - ダッシュボード表示')
         return render_template("index.html")
 
+    @app.route('/readyz')
+    def readyz():
+        """readiness確認（検知モデルのウォームアップ完了まで503）"""
+        warmup = app.extensions.get('detector_warmup')
+        ready = warmup.check() if warmup else True
+        body = warmup.to_dict() if warmup else {'ready': True}
+        return jsonify(body), (200 if ready else 503)
+
     @app.route('/uploads/<filename>')
     def uploaded_file(filename):
         """アップロードされた画像を配信（検知用）"""
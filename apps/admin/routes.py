@@ -1,4 +1,4 @@
-from flask import render_template, request, session, current_app, flash, redirect, url_for, abort
+from flask import render_template, request, session, current_app, flash, redirect, url_for, abort, jsonify
 from flask_login import login_required, current_user
 from functools import wraps
 import platform
@@ -165,6 +165,68 @@ def sys_info():
         return redirect(url_for('admin.admin_users'))
 
 
+@admin_bp.route('/detector/metrics', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def detector_metrics():
+    """物体検知のステージ別処理時間ヒストグラム（JSON、プロセス単位の集計）
+
+    POST でこのプロセスの集計をリセットする。
+    """
+    from apps.detector.timing import get_stage_metrics
+
+    metrics = get_stage_metrics(current_app)
+    if request.method == 'POST':
+        metrics.reset()
+    data = metrics.to_dict()
+    data['pid'] = os.getpid()
+    jobs = current_app.extensions.get('detector_jobs')
+    if jobs is not None:
+        data['job_queue_depth'] = jobs.depth()
+    cache = current_app.extensions.get('detector_cache')
+    if cache is not None:
+        data['cache'] = cache.stats()
+    registry = current_app.extensions.get('detector_models')
+    if registry is not None:
+        data['models'] = registry.stats()
+    admission = current_app.extensions.get('detector_admission')
+    if admission is not None:
+        data['admission'] = admission.stats()
+    flights = current_app.extensions.get('detector_singleflight')
+    if flights is not None:
+        data['single_flight'] = flights.stats()
+    ownership = current_app.extensions.get('detector_ownership')
+    if ownership is not None:
+        data['image_ownership_cache'] = ownership.stats()
+    return jsonify(data)
+
+
+@admin_bp.route('/detector/analytics')
+@login_required
+@admin_required
+def detector_analytics():
+    """サイト全体の検知結果の集計（``format=json`` で JSON）"""
+    from apps.detector.analytics import parse_period, rollup, top_users
+
+    try:
+        days, bucket = parse_period(request.args)
+    except ValueError as e:
+        if request.args.get('format') == 'json':
+            return jsonify({'success': False, 'error': str(e)}), 400
+        flash(str(e), 'danger')
+        return redirect(url_for('admin.detector_analytics'))
+    report = rollup(None, days, bucket)
+    ranking = top_users(days)
+    names = dict(db.session.query(User.id, User.username).filter(User.id.in_([r[0] for r in ranking])))
+    report['top_users'] = [
+        {'user_id': user_id, 'username': names.get(user_id), 'images': n_images, 'detections': n_detections}
+        for user_id, n_images, n_detections in ranking
+    ]
+    if request.args.get('format') == 'json':
+        return jsonify({'success': True, **report})
+    return render_template('admin/detector_analytics.html', report=report)
+
+
 @admin_bp.route('/admin_users', methods=['GET', 'POST'])
 @login_required
 @admin_required
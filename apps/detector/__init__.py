@@ -34,5 +34,6 @@ def jst(dt: datetime, fmt: str = '%Y/%m/%d %H:%M') -> str:
         except Exception:
             return str(dt)
 
-# ルートのインポート
+# ルート・CLIコマンドのインポート
 from . import routes
+from . import commands
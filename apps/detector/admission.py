@@ -0,0 +1,162 @@
+"""
+検知リクエストの受付制御（同時実行数の上限と待ち行列）
+
+リクエストスレッド上で推論する API（``/detector/api/detect``、動画のフレーム検知）の
+同時実行数をプロセス単位・ユーザー単位で制限します。上限に達している間は有界の
+待ち行列（到着順）で待たせ、次の場合は推論を始めずにすぐ断ります。
+
+- ユーザーの実行中 + 待機中が上限に達している: 429（Too Many Requests）
+- 待ち行列が満杯、または期限（DETECTOR_ADMISSION_TIMEOUT_MS）までに順番が来ない: 503
+
+どちらも直近の処理時間から見積もった Retry-After を付けます。推論を同時に詰め込んで
+全員の応答が遅くなるより、あふれた分を早く断る方が全体のスループットが保たれます。
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class AdmissionRejected(Exception):
+    """受付を断った（status は HTTP ステータス、retry_after は再試行までの秒数）"""
+
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """プロセス単位の同時実行数制御（スレッドセーフ）
+
+    Args:
+        max_concurrent (int): 同時に実行できる数
+        max_per_user (int): 1ユーザーが同時に実行・待機できる数（0 で無制限）
+        max_waiting (int): 待ち行列の長さ（0 で待たせずに断る）
+        timeout (float): 待ち行列で待つ最大秒数
+    """
+
+    def __init__(self, max_concurrent=2, max_per_user=2, max_waiting=8, timeout=10.0):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_per_user = max(0, int(max_per_user))
+        self.max_waiting = max(0, int(max_waiting))
+        self.timeout = max(0.0, float(timeout))
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiters = deque()
+        self._by_user = {}  # ユーザーID -> 実行中 + 待機中の数
+        self._service_time = None  # 処理時間の指数移動平均（秒）
+        self.admitted = 0
+        self.rejected = {'user_limit': 0, 'queue_full': 0, 'timeout': 0}
+
+    def _retry_after_locked(self, position):
+        """待ち順 position の要求が実行されるまでの見積もり秒数（最低1秒）"""
+        service = self._service_time or 1.0
+        return max(1, math.ceil(service * position / self.max_concurrent))
+
+    def _reject_locked(self, status, reason, position):
+        self.rejected[reason] += 1
+        raise AdmissionRejected(status, reason, self._retry_after_locked(position))
+
+    def _leave_locked(self, user_id):
+        if user_id is None:
+            return
+        n = self._by_user.get(user_id, 0) - 1
+        if n > 0:
+            self._by_user[user_id] = n
+        else:
+            self._by_user.pop(user_id, None)
+
+    def acquire(self, user_id=None):
+        """実行枠を取得して開始時刻を返す（release に渡す）。断る場合は AdmissionRejected"""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            if user_id is not None and self.max_per_user and self._by_user.get(user_id, 0) >= self.max_per_user:
+                self._reject_locked(429, 'user_limit', 1)
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+            else:
+                if len(self._waiters) >= self.max_waiting:
+                    self._reject_locked(503, 'queue_full', len(self._waiters) + 1)
+                ticket = object()
+                self._waiters.append(ticket)
+                try:
+                    if user_id is not None:
+                        self._by_user[user_id] = self._by_user.get(user_id, 0) + 1
+                    # 到着順: 先頭になり、かつ空きがあるまで待つ
+                    while self._waiters[0] is not ticket or self._active >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject_locked(503, 'timeout', self._waiters.index(ticket) + 1)
+                        self._cond.wait(remaining)
+                except BaseException:
+                    self._waiters.remove(ticket)
+                    self._leave_locked(user_id)
+                    self._cond.notify_all()
+                    raise
+                self._waiters.popleft()
+                self._active += 1
+                self._leave_locked(user_id)
+                # 次の待機者も空きがあれば続けて入れる
+                self._cond.notify_all()
+            if user_id is not None:
+                self._by_user[user_id] = self._by_user.get(user_id, 0) + 1
+            self.admitted += 1
+        return time.monotonic()
+
+    def release(self, user_id=None, started=None):
+        """実行枠を返す"""
+        with self._cond:
+            self._active -= 1
+            self._leave_locked(user_id)
+            if started is not None:
+                elapsed = time.monotonic() - started
+                self._service_time = elapsed if self._service_time is None else (
+                    0.8 * self._service_time + 0.2 * elapsed)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, user_id=None):
+        """``with controller.slot(user_id):`` の間だけ実行枠を持つ"""
+        started = self.acquire(user_id)
+        try:
+            yield
+        finally:
+            self.release(user_id, started)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'active': self._active,
+                'queue_depth': len(self._waiters),
+                'max_concurrent': self.max_concurrent,
+                'max_per_user': self.max_per_user,
+                'max_waiting': self.max_waiting,
+                'timeout_seconds': self.timeout,
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected),
+                'avg_service_ms': round(self._service_time * 1000.0, 1) if self._service_time is not None else None,
+            }
+
+
+_CREATE_LOCK = threading.Lock()
+
+
+def get_admission_controller(app):
+    """アプリ単位の受付制御（未作成なら設定値から生成）"""
+    controller = app.extensions.get('detector_admission')
+    if controller is not None:
+        return controller
+    with _CREATE_LOCK:
+        controller = app.extensions.get('detector_admission')
+        if controller is None:
+            controller = app.extensions['detector_admission'] = AdmissionController(
+                max_concurrent=app.config.get('DETECTOR_ADMISSION_MAX_CONCURRENT', 2),
+                max_per_user=app.config.get('DETECTOR_ADMISSION_MAX_PER_USER', 2),
+                max_waiting=app.config.get('DETECTOR_ADMISSION_QUEUE_SIZE', 8),
+                timeout=app.config.get('DETECTOR_ADMISSION_TIMEOUT_MS', 10000) / 1000.0,
+            )
+    return controller
@@ -0,0 +1,268 @@
+"""
+検知結果の集計（ダッシュボード用）
+
+検知結果の保存・削除のたびに ``detection_daily_stats``（ユーザー × 日 × クラス）を
+SQL の加算で増分更新します。ダッシュボードはこの集計表を期間で GROUP BY した行だけを
+読み、日・週の集計やクラス別・信頼度分布の計算を numpy でまとめて行うため、
+処理量は「期間 × クラス数」で決まり、保存済みの画像数や検出数には依存しません。
+
+- 集計日は検知結果の保存日（UTC）。再検知すると旧結果の分を引いて新しい日に加算する
+- class_name が '*' の行は画像単位の合計（検出0件の画像も images に数える）
+- 既存データからの作成・作り直しは ``flask --app run detector rebuild-analytics``
+"""
+
+import datetime
+
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+
+TOTAL = '*'
+CONFIDENCE_BINS = 10
+BIN_COLUMNS = [f'bin_{i}' for i in range(CONFIDENCE_BINS)]
+# 集計値の列（images, detections, confidence_sum, bin_0..bin_9 の順で配列化する）
+VALUE_COLUMNS = ['images', 'detections', 'confidence_sum'] + BIN_COLUMNS
+BUCKETS = ('day', 'week')
+
+
+def stat_day(updated_at):
+    """検知結果の保存日時から集計日を求める（日時がなければ None = 集計対象外）"""
+    if updated_at is None:
+        return None
+    return updated_at.date() if isinstance(updated_at, datetime.datetime) else updated_at
+
+
+def summarize(classes, confidences):
+    """1画像分の検出をクラス別の集計値にまとめる
+
+    Args:
+        classes: 検出ごとのクラス名
+        confidences: 検出ごとの信頼度
+
+    Returns:
+        dict: クラス名 -> VALUE_COLUMNS 順の numpy 配列（TOTAL は画像全体）
+    """
+    names = np.asarray([str(c) for c in classes], dtype=object)
+    conf = np.clip(np.asarray(confidences, dtype=np.float64).reshape(-1), 0.0, 1.0)
+    bins = np.minimum((conf * CONFIDENCE_BINS).astype(np.int64), CONFIDENCE_BINS - 1)
+
+    total = np.zeros(len(VALUE_COLUMNS))
+    total[0] = 1
+    total[1] = len(conf)
+    total[2] = conf.sum()
+    total[3:] = np.bincount(bins, minlength=CONFIDENCE_BINS)
+    summary = {TOTAL: total}
+    if not len(conf):
+        return summary
+
+    labels, inverse = np.unique(names, return_inverse=True)
+    values = np.zeros((len(labels), len(VALUE_COLUMNS)))
+    values[:, 0] = 1
+    values[:, 1] = np.bincount(inverse, minlength=len(labels))
+    values[:, 2] = np.bincount(inverse, weights=conf, minlength=len(labels))
+    np.add.at(values, (inverse, 3 + bins), 1)
+    for label, row in zip(labels, values):
+        summary[str(label)[:64]] = row
+    return summary
+
+
+def _row_key(table, user_id, day, class_name):
+    return (table.c.user_id == user_id) & (table.c.day == day) & (table.c.class_name == class_name)
+
+
+def apply_summary(user_id, day, summary, sign=1):
+    """集計表に1画像分を加算（sign=-1 で減算）する（コミットは呼び出し側）
+
+    行があれば ``UPDATE ... SET col = col + :delta`` で更新し、なければ挿入する。
+    同じ行を別プロセスが先に挿入した場合は更新をやり直す。
+    """
+    from apps.models.model import DetectionDailyStat, db
+
+    if user_id is None or day is None:
+        return
+    table = DetectionDailyStat.__table__
+    for class_name, values in summary.items():
+        deltas = {col: (int(v) if col != 'confidence_sum' else float(v)) * sign
+                  for col, v in zip(VALUE_COLUMNS, values)}
+        key = _row_key(table, user_id, day, class_name)
+        update = table.update().where(key).values({col: table.c[col] + d for col, d in deltas.items()})
+        if sign < 0:
+            # 行がない（集計表の作成前の結果）場合は何もしない。画像数が0になった行は消す
+            db.session.execute(update)
+            db.session.execute(table.delete().where(key & (table.c.images <= 0)))
+            continue
+        if db.session.execute(update).rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(user_id=user_id, day=day, class_name=class_name, **deltas))
+        except IntegrityError:
+            db.session.execute(update)
+
+
+def record_result(user_id, updated_at, classes, confidences, sign=1):
+    """検知結果1件分を集計表へ反映する（sign=-1 で取り消し）"""
+    apply_summary(user_id, stat_day(updated_at), summarize(classes, confidences), sign)
+
+
+def parse_period(args, default_days=90, max_days=366):
+    """クエリ文字列から (日数, 'day'|'week') を取り出す。不正なら ValueError"""
+    days = int(args.get('days') or default_days)
+    if not 1 <= days <= max_days:
+        raise ValueError(f'days は 1〜{max_days} で指定してください')
+    bucket = args.get('bucket') or 'day'
+    if bucket not in BUCKETS:
+        raise ValueError("bucket は 'day' か 'week' で指定してください")
+    return days, bucket
+
+
+def rollup(user_id=None, days=90, bucket='day', today=None, top_classes=5):
+    """期間内の集計（user_id=None でサイト全体）
+
+    SQL では (日, クラス) 単位に合計した行だけを取得し、期間バケットへの振り分けと
+    クラス別・信頼度分布の集計は numpy でまとめて行う。週は月曜始まり。
+
+    Returns:
+        dict: totals / series（期間別の画像数・検出数）/ classes（クラス別）/
+            confidence_histogram / class_series（上位クラスの期間別検出数）
+    """
+    from sqlalchemy import func, select
+
+    from apps.models.model import DetectionDailyStat, db
+
+    today = today or datetime.datetime.utcnow().date()
+    start = today - datetime.timedelta(days=days - 1)
+    if bucket == 'week':
+        start -= datetime.timedelta(days=start.weekday())
+    step = 7 if bucket == 'week' else 1
+    periods = [start + datetime.timedelta(days=d) for d in range(0, (today - start).days + 1, step)]
+
+    # ORM の行オブジェクトは作らず Core の select で取得する
+    table = DetectionDailyStat.__table__
+    query = select(
+        table.c.day, table.c.class_name, *[func.sum(table.c[col]) for col in VALUE_COLUMNS],
+    ).where(table.c.day >= start, table.c.day <= today)
+    if user_id is not None:
+        query = query.where(table.c.user_id == user_id)
+    rows = db.session.execute(query.group_by(table.c.day, table.c.class_name)).all()
+
+    period_index = np.asarray([(row[0] - start).days // step for row in rows], dtype=np.int64)
+    names = np.asarray([row[1] for row in rows], dtype=object)
+    values = np.asarray([row[2:] for row in rows], dtype=np.float64).reshape(len(rows), len(VALUE_COLUMNS))
+    is_total = names == TOTAL
+
+    # 期間別の画像数・検出数（画像単位の合計行から）
+    totals = values[is_total]
+    images = np.bincount(period_index[is_total], weights=totals[:, 0], minlength=len(periods))
+    detections = np.bincount(period_index[is_total], weights=totals[:, 1], minlength=len(periods))
+    overall = totals.sum(axis=0) if len(totals) else np.zeros(len(VALUE_COLUMNS))
+
+    # クラス別の合計
+    labels, inverse = np.unique(names[~is_total].astype(str), return_inverse=True)
+    per_class = np.zeros((len(labels), len(VALUE_COLUMNS)))
+    np.add.at(per_class, inverse, values[~is_total])
+    order = np.lexsort((labels, -per_class[:, 1])) if len(labels) else np.zeros(0, dtype=np.int64)
+    class_grid = np.zeros((len(labels), len(periods)))
+    np.add.at(class_grid, (inverse, period_index[~is_total]), values[~is_total, 1])
+
+    def mean_confidence(v):
+        return round(float(v[2] / v[1]), 4) if v[1] else None
+
+    return {
+        'scope': 'user' if user_id is not None else 'site',
+        'bucket': bucket,
+        'days': days,
+        'start': start.isoformat(),
+        'end': today.isoformat(),
+        'totals': {
+            'images': int(overall[0]),
+            'detections': int(overall[1]),
+            'mean_confidence': mean_confidence(overall),
+        },
+        'series': [
+            {'period': period.isoformat(), 'images': int(n_images), 'detections': int(n_detections)}
+            for period, n_images, n_detections in zip(periods, images, detections)
+        ],
+        'classes': [
+            {
+                'class': str(labels[i]),
+                'images': int(per_class[i, 0]),
+                'detections': int(per_class[i, 1]),
+                'mean_confidence': mean_confidence(per_class[i]),
+                'histogram': per_class[i, 3:].astype(int).tolist(),
+            }
+            for i in order
+        ],
+        'confidence_histogram': [
+            {'lower': i / CONFIDENCE_BINS, 'upper': (i + 1) / CONFIDENCE_BINS, 'count': int(n)}
+            for i, n in enumerate(overall[3:])
+        ],
+        'class_series': {str(labels[i]): class_grid[i].astype(int).tolist() for i in order[:top_classes]},
+    }
+
+
+def top_users(days=90, limit=10, today=None):
+    """期間内の検出数が多いユーザー（[(ユーザーID, 画像数, 検出数), ...]）"""
+    from sqlalchemy import func
+
+    from apps.models.model import DetectionDailyStat, db
+
+    today = today or datetime.datetime.utcnow().date()
+    start = today - datetime.timedelta(days=days - 1)
+    detections = func.sum(DetectionDailyStat.detections)
+    rows = db.session.query(
+        DetectionDailyStat.user_id, func.sum(DetectionDailyStat.images), detections,
+    ).filter(
+        DetectionDailyStat.class_name == TOTAL,
+        DetectionDailyStat.day >= start,
+        DetectionDailyStat.day <= today,
+    ).group_by(DetectionDailyStat.user_id).order_by(detections.desc()).limit(limit).all()
+    return [(user_id, int(n_images or 0), int(n_detections or 0)) for user_id, n_images, n_detections in rows]
+
+
+def rebuild(chunk_size=1000):
+    """集計表を検知結果から作り直す（作成行数を返す）
+
+    有効な画像の検知結果を ID 順に chunk_size 件ずつ読み、メモリ上で合計してから一括挿入する。
+    """
+    from apps.models.model import Detection, DetectionDailyStat, DetectionResult, UserImage, db
+
+    totals = {}  # (ユーザーID, 日, クラス名) -> 集計値
+    last_id = 0
+    while True:
+        results = db.session.query(DetectionResult.id, DetectionResult.user_id, DetectionResult.updated_at).join(
+            UserImage, DetectionResult.image_id == UserImage.id
+        ).filter(
+            DetectionResult.id > last_id,
+            UserImage.is_active == True,  # noqa: E712
+        ).order_by(DetectionResult.id).limit(chunk_size).all()
+        if not results:
+            break
+        last_id = results[-1][0]
+        detections = {}
+        for result_id, class_name, confidence in db.session.query(
+                Detection.result_id, Detection.class_name, Detection.confidence
+        ).filter(Detection.result_id.in_([r[0] for r in results])):
+            detections.setdefault(result_id, ([], []))
+            detections[result_id][0].append(class_name)
+            detections[result_id][1].append(confidence)
+        for result_id, user_id, updated_at in results:
+            day = stat_day(updated_at)
+            if day is None:
+                continue
+            classes, confidences = detections.get(result_id, ([], []))
+            for class_name, values in summarize(classes, confidences).items():
+                key = (user_id, day, class_name)
+                totals[key] = totals[key] + values if key in totals else values
+
+    db.session.query(DetectionDailyStat).delete()
+    rows = [
+        {
+            'user_id': user_id, 'day': day, 'class_name': class_name,
+            **{col: (float(v) if col == 'confidence_sum' else int(v)) for col, v in zip(VALUE_COLUMNS, values)},
+        }
+        for (user_id, day, class_name), values in totals.items()
+    ]
+    for i in range(0, len(rows), chunk_size):
+        db.session.execute(DetectionDailyStat.__table__.insert(), rows[i:i + chunk_size])
+    db.session.commit()
+    return len(rows)
@@ -0,0 +1,115 @@
+"""
+推論バッチ処理
+
+複数スレッドから届いた推論要求を最大バッチサイズ／最大待ち時間で束ね、
+1回の ``predict`` 呼び出しで処理して各呼び出し元へ結果を返します。
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_STOP = object()  # ディスパッチャ停止の番兵
+
+
+class BatchPredictor:
+    """推論要求を束ねて一括実行するディスパッチャ
+
+    Args:
+        predict_fn: 入力のリストを受け取り、同じ順序・同じ長さの結果リストを返す関数
+        max_batch_size (int): 1回の呼び出しで束ねる最大件数
+        max_wait (float): 先頭要求の到着から追加要求を待つ最大秒数
+    """
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait=0.02):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait))
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_dispatcher(self):
+        """ディスパッチャスレッドを遅延起動（fork後は作り直す）"""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._dispatch, name='detector-batcher', daemon=True)
+            self._thread.start()
+
+    def submit(self, item):
+        """推論要求を登録し、結果を受け取る Future を返す"""
+        self._ensure_dispatcher()
+        fut = Future()
+        self._queue.put((item, fut))
+        return fut
+
+    def predict(self, item, timeout=None):
+        """1件を推論（他スレッドの要求とまとめて実行される）"""
+        return self.submit(item).result(timeout=timeout)
+
+    def predict_many(self, items, timeout=None):
+        """複数件をまとめて登録し、入力順に結果を返す（一括再検知用）"""
+        futures = [self.submit(item) for item in items]
+        return [f.result(timeout=timeout) for f in futures]
+
+    def close(self):
+        """ディスパッチャを停止（登録済みの要求は処理してから止まる。以降の submit で再起動する）"""
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                return
+            self._thread = None
+        self._queue.put(_STOP)
+
+    def _collect(self):
+        """先頭1件を待ち、以降は上限件数か待ち時間に達するまで集める
+
+        Returns:
+            (batch, stop): stop は停止の番兵を受け取ったかどうか
+        """
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    entry = self._queue.get_nowait()
+                else:
+                    entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _dispatch(self):
+        stop = False
+        while not stop:
+            batch, stop = self._collect()
+            batch = [(item, fut) for item, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                outputs = list(self.predict_fn([item for item, _ in batch]))
+                if len(outputs) != len(batch):
+                    raise RuntimeError(f'batch size mismatch: {len(outputs)} != {len(batch)}')
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, fut), out in zip(batch, outputs):
+                fut.set_result(out)
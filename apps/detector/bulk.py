@@ -0,0 +1,144 @@
+"""
+一括アップロード
+
+ZIP アーカイブまたは複数ファイルをまとめて受け付けます。ZIP はエントリごとに
+チャンク単位で展開しながら一時ファイルへ書き出し（アーカイブ全体をメモリに
+展開しない）、検証・知覚ハッシュ計算をスレッドプールで並列に行います。
+画像行（UserImage）と実体の参照カウントは1回のコミットで作成します。
+
+検知は共有のスレッドプールで並列に実行します。推論は検知ジョブキューのワーカーと
+同じ枠（DETECTOR_JOB_WORKERS）を取ってから行うため、一括アップロードが増えても
+プロセス全体の同時推論数は変わりません（類似画像の結果の再利用は枠を取りません）。
+進捗は ``/detector/api/upload/bulk/<bulk_id>`` で参照できます。
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BulkUpload:
+    """一括アップロード1件分の進捗"""
+
+    STORED = 'stored'
+    DETECTING = 'detecting'
+    DONE = 'done'
+
+    def __init__(self, user_id, image_ids, rejected):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.image_ids = list(image_ids)
+        self.rejected = list(rejected)
+        self.detected = 0
+        self.reused = 0
+        self.failed = 0
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def completed(self):
+        return self.detected + self.reused + self.failed
+
+    @property
+    def status(self):
+        if self.finished_at is not None:
+            return self.DONE
+        return self.DETECTING if self.completed else self.STORED
+
+    def to_dict(self):
+        """API応答用の辞書を返す"""
+        total = len(self.image_ids)
+        return {
+            'bulk_id': self.id,
+            'status': self.status,
+            'total': total,
+            'stored': total,
+            'rejected': self.rejected,
+            'detected': self.detected,
+            'reused': self.reused,
+            'failed': self.failed,
+            'progress': round(self.completed / total, 3) if total else 1.0,
+            'image_ids': self.image_ids,
+            'elapsed_seconds': round((self.finished_at or time.time()) - self.created_at, 3),
+        }
+
+
+class BulkUploadTracker:
+    """一括アップロードの検知実行と進捗管理
+
+    Args:
+        app: ワーカー内でアプリケーションコンテキストを張るためのFlaskアプリ
+        detect_one: ``detect_one(image_id, model_id)`` で検知（または類似画像の結果の再利用）と保存を行い、
+            再利用したら 'reused' を返す関数
+        workers (int): 同時に検知する画像数（検知ジョブキューのワーカー数に合わせる）
+        keep (int): 進捗照会用に保持する一括アップロード数
+    """
+
+    def __init__(self, app, detect_one, workers=2, keep=200):
+        self.app = app
+        self.detect_one = detect_one
+        self.workers = max(1, int(workers))
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._uploads = OrderedDict()
+        self._executor = None
+        self._pid = None
+
+    def _pool(self):
+        """スレッドプールを遅延作成（fork後の子プロセスでは作り直す）"""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='detector-bulk')
+            return self._executor
+
+    def start(self, user_id, image_ids, rejected, model_id=None):
+        """保存済み画像の検知を開始し、進捗オブジェクトを返す"""
+        upload = BulkUpload(user_id, image_ids, rejected)
+        with self._lock:
+            self._uploads[upload.id] = upload
+            while len(self._uploads) > self.keep:
+                self._uploads.popitem(last=False)
+        if not upload.image_ids:
+            upload.finished_at = time.time()
+            return upload
+        pool = self._pool()
+        for image_id in upload.image_ids:
+            pool.submit(self._run, upload, image_id, model_id)
+        return upload
+
+    def _run(self, upload, image_id, model_id):
+        try:
+            with self.app.app_context():
+                outcome = self.detect_one(image_id, model_id)
+            field = 'reused' if outcome == 'reused' else 'detected'
+        except Exception as e:
+            self.app.logger.error(f"一括アップロードの検知に失敗: image_id={image_id}: {e}")
+            field = 'failed'
+        with self._lock:
+            setattr(upload, field, getattr(upload, field) + 1)
+            if upload.completed >= len(upload.image_ids):
+                upload.finished_at = time.time()
+
+    def get(self, bulk_id):
+        """一括アップロードIDから進捗を取得（存在しなければNone）"""
+        with self._lock:
+            return self._uploads.get(bulk_id)
+
+
+_CREATE_LOCK = threading.Lock()
+
+
+def get_bulk_tracker(app, detect_one, workers=2):
+    """アプリ単位の一括アップロード管理（未作成なら生成）"""
+    tracker = app.extensions.get('detector_bulk')
+    if tracker is not None:
+        return tracker
+    with _CREATE_LOCK:
+        tracker = app.extensions.get('detector_bulk')
+        if tracker is None:
+            tracker = app.extensions['detector_bulk'] = BulkUploadTracker(app, detect_one, workers=workers)
+    return tracker
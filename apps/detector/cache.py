@@ -0,0 +1,143 @@
+"""
+検知結果キャッシュ
+
+画像バイト列のハッシュ + モデル識別子 + 推論パラメータをキーに、
+検知結果をディスク上へ保存します。同一画像の再アップロードや
+別ユーザーによる同一画像は推論せずに結果を返します。
+総サイズが上限を超えたら最終参照の古い順（LRU）に削除します。
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """ファイル内容のSHA-256（16進）をチャンク読みで計算"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def make_cache_key(content_hash, model_id, params=None):
+    """内容ハッシュ・モデル識別子・推論パラメータから決定的なキーを作る"""
+    raw = json.dumps([content_hash, model_id, params or {}], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class DetectionCache:
+    """ディスク上のLRU検知結果キャッシュ
+
+    Args:
+        directory (str): キャッシュファイルの保存先（<key[:2]>/<key>.json で分散）
+        max_bytes (int): キャッシュ総サイズの上限
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._index = None  # key -> size（先頭ほど古い）
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def _load_index_locked(self):
+        """既存ファイルを最終参照時刻順に読み込んでLRU順序を復元"""
+        if self._index is not None:
+            return
+        entries = []
+        if os.path.isdir(self.directory):
+            for root, _dirs, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith('.json'):
+                        continue
+                    try:
+                        st = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, name[:-5], st.st_size))
+        entries.sort()
+        self._index = OrderedDict((key, size) for _mtime, key, size in entries)
+        self._total = sum(self._index.values())
+
+    def get(self, key):
+        """キャッシュ済み結果を返す（なければNone）"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+                if self._index is not None and key in self._index:
+                    self._total -= self._index.pop(key)
+            return None
+        with self._lock:
+            self.hits += 1
+            self._load_index_locked()
+            if key in self._index:
+                self._index.move_to_end(key)
+        try:
+            os.utime(path)  # 再起動後もLRU順序を保つため最終参照時刻を更新
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """結果を保存（一時ファイル経由で置換）し、上限超過分を追い出す"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._load_index_locked()
+            self._total -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._total += len(data)
+            self._evict_locked()
+
+    def _evict_locked(self):
+        while self._total > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        """ヒット数・ミス数・件数・総サイズ"""
+        with self._lock:
+            self._load_index_locked()
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._index), 'bytes': self._total}
+
+
+_CREATE_LOCK = threading.Lock()
+
+
+def get_detection_cache(app):
+    """アプリ単位の検知結果キャッシュを取得（DETECTOR_CACHE_FOLDER 未設定なら None）"""
+    cache = app.extensions.get('detector_cache')
+    if cache is not None:
+        return cache
+    directory = app.config.get('DETECTOR_CACHE_FOLDER')
+    if not directory:
+        return None
+    with _CREATE_LOCK:
+        cache = app.extensions.get('detector_cache')
+        if cache is None:
+            cache = DetectionCache(directory, app.config.get('DETECTOR_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+            app.extensions['detector_cache'] = cache
+    return cache
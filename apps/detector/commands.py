@@ -0,0 +1,172 @@
+"""
+物体検知機能のCLIコマンド
+
+``flask --app run detector <command>`` で実行します。
+"""
+
+import click
+from . import detector_bp
+
+
+@detector_bp.cli.command('import-sidecars')
+def import_sidecars_command():
+    """既存の検知結果サイドカーJSON（*.det.json）を detection_results テーブルへ取り込む"""
+    from .routes import ensure_upload_dirs, import_sidecar_results
+
+    imported, skipped = import_sidecar_results(ensure_upload_dirs())
+    click.echo(f'取り込み: {imported} 件 / スキップ: {skipped} 件')
+
+
+@detector_bp.cli.command('migrate-storage')
+@click.option('--limit', type=int, default=None, help='移行する最大件数')
+def migrate_storage_command(limit):
+    """旧形式（フラットなファイル名）の画像をコンテンツアドレス形式の保存先へ移行する"""
+    from .routes import ensure_thumb_dir, ensure_upload_dirs, result_json_path
+    from .storage import migrate_legacy_images
+
+    counts = migrate_legacy_images(
+        ensure_upload_dirs(),
+        ensure_thumb_dir(),
+        lambda img: result_json_path(img.filename, img.id),
+        limit=limit,
+    )
+    click.echo(f"移行: {counts['migrated']} 件（うち重複 {counts['deduplicated']} 件） / "
+               f"ファイルなし: {counts['missing']} 件")
+
+
+@detector_bp.cli.command('backfill-phash')
+@click.option('--batch-size', type=int, default=200, show_default=True, help='コミット間隔（件数）')
+def backfill_phash_command(batch_size):
+    """知覚ハッシュ未計算の画像について計算し、ほぼ重複の画像を関連付ける"""
+    import os
+    from apps.models.model import UserImage, db
+    from .routes import compute_perceptual_hash, ensure_upload_dirs, find_near_duplicates
+
+    upload_dir = ensure_upload_dirs()
+    hashed = linked = failed = 0
+    after_id = 0
+    while True:
+        rows = UserImage.query.filter(
+            UserImage.id > after_id,
+            UserImage.is_active == True,  # noqa: E712
+            UserImage.perceptual_hash.is_(None),
+        ).order_by(UserImage.id).limit(batch_size).all()
+        if not rows:
+            break
+        for img in rows:
+            after_id = img.id
+            perceptual_hash = compute_perceptual_hash(os.path.join(upload_dir, img.filename))
+            if perceptual_hash is None:
+                failed += 1
+                continue
+            img.update_columns(perceptual_hash=perceptual_hash)
+            hashed += 1
+        # 索引は DB から取り込むため、ハッシュを先にコミットしてから関連付ける
+        db.session.commit()
+        for img in rows:
+            if img.perceptual_hash and find_near_duplicates(img) and img.duplicate_of_id:
+                linked += 1
+        db.session.commit()
+    click.echo(f'計算: {hashed} 件 / 重複の関連付け: {linked} 件 / 失敗: {failed} 件')
+
+
+@detector_bp.cli.command('rebuild-analytics')
+@click.option('--chunk-size', type=int, default=1000, show_default=True, help='一度に読み込む検知結果の件数')
+def rebuild_analytics_command(chunk_size):
+    """検知結果の集計表（detection_daily_stats）を保存済みの検知結果から作り直す"""
+    from .analytics import rebuild
+
+    click.echo(f'集計行: {rebuild(chunk_size=chunk_size)} 件')
+
+
+@detector_bp.cli.command('redetect-stale')
+@click.option('--workers', type=int, default=2, show_default=True, help='同時に再検知する件数')
+@click.option('--model', 'model_id', default=None, help='再検知に使うモデルID（省略時は保存済みのモデル、使えなければ既定モデル）')
+@click.option('--checkpoint', 'checkpoint_path', default=None,
+              help='進捗ファイル（既定: <アップロード先>/.redetect-checkpoint.json）')
+@click.option('--resume/--no-resume', default=True, show_default=True, help='チェックポイントから再開する')
+@click.option('--retry-failed', is_flag=True, help='前回失敗した画像も再試行する')
+@click.option('--include-missing', is_flag=True, help='検知結果がない画像も対象にする')
+@click.option('--limit', type=int, default=None, help='処理する最大件数')
+@click.option('--dry-run', is_flag=True, help='対象件数の表示のみ')
+def redetect_stale_command(workers, model_id, checkpoint_path, resume, retry_failed, include_missing, limit, dry_run):
+    """モデル指紋が現在と異なる（古い）検知結果だけを再検知する"""
+    import itertools
+    import os
+    import time
+    from flask import current_app
+    from apps.models.model import UserImage, db
+    from .redetect import RedetectCheckpoint, count_stale, current_fingerprints, iter_stale, run_redetect
+    from .routes import (
+        FallbackResults, _get_yolo_model, available_models, default_model_id, ensure_upload_dirs,
+        resolve_model_id, save_detection_results, simulate_object_detection,
+    )
+
+    try:
+        target = resolve_model_id(model_id) if model_id else None
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    models = available_models()
+    if not dry_run:
+        # シミュレーション結果で上書きしないよう、使うモデルが読み込めることを先に確認する
+        for m in [target] if target else models:
+            if _get_yolo_model(m) is None:
+                raise click.ClickException(f'モデルを読み込めません: {m}')
+
+    # 重みファイルはロード時に取得される場合があるため、指紋はロード後に計算する
+    fingerprints = current_fingerprints(models)
+    checkpoint = RedetectCheckpoint(
+        checkpoint_path or os.path.join(ensure_upload_dirs(), '.redetect-checkpoint.json'))
+    if resume and checkpoint.load(fingerprints):
+        click.echo(f'チェックポイントから再開: 画像ID {checkpoint.last_id} まで処理済み'
+                   f'（完了 {checkpoint.done} 件 / 失敗 {len(checkpoint.failed)} 件）')
+    checkpoint.fingerprints = fingerprints
+    if retry_failed:
+        checkpoint.last_id = 0
+        checkpoint.failed = []
+
+    total = count_stale(fingerprints, checkpoint.last_id, include_missing)
+    if limit is not None:
+        total = min(total, limit)
+    click.echo(f'再検知対象: {total} 件（モデル: {", ".join(f"{m}={v}" for m, v in fingerprints.items())}）')
+    if dry_run or total == 0:
+        return
+
+    def pick_model(saved_model):
+        return target or (saved_model if saved_model in models else default_model_id())
+
+    items = ((image_id, filename, pick_model(saved_model)) for image_id, filename, saved_model
+             in iter_stale(fingerprints, checkpoint.last_id, include_missing))
+    if limit is not None:
+        items = itertools.islice(items, limit)
+
+    upload_dir = ensure_upload_dirs()
+
+    def detect_one(image_id, filename, m):
+        # 画像ファイルがないと検知は空の結果を返すため、保存せず失敗として記録させる
+        if not os.path.exists(os.path.join(upload_dir, filename)):
+            raise FileNotFoundError(f'画像ファイルが見つかりません: image_id={image_id}')
+        results = simulate_object_detection(filename, model_id=m)
+        if isinstance(results, FallbackResults):
+            # 推論に失敗した（シミュレーション結果）: 保存済みの結果は残し、失敗として記録させる
+            raise RuntimeError(f'推論に失敗しました: image_id={image_id}')
+        user_image = db.session.get(UserImage, image_id)
+        if user_image is None:
+            raise RuntimeError(f'画像が見つかりません: image_id={image_id}')
+        save_detection_results(user_image, results, model_id=m)
+
+    last_report = [0.0]
+
+    def progress(done, failed, total, elapsed):
+        processed = done + failed
+        if processed < total and time.monotonic() - last_report[0] < 2:
+            return
+        last_report[0] = time.monotonic()
+        rate = processed / elapsed if elapsed > 0 else 0
+        eta = (total - processed) / rate if rate else 0
+        click.echo(f'[{processed:>{len(str(total))}}/{total}] {processed / total:6.1%}  '
+                   f'{rate:.1f}件/秒  残り約{eta:.0f}秒  失敗 {failed}')
+
+    done, failed = run_redetect(current_app._get_current_object(), items, detect_one, checkpoint,
+                                workers=workers, total=total, progress=progress)
+    click.echo(f'再検知完了: {done} 件 / 失敗: {failed} 件（チェックポイント: {checkpoint.path}）')
@@ -0,0 +1,200 @@
+"""
+物体検知ジョブキュー
+
+アップロード時に物体検知ジョブを登録し、プロセス内のワーカースレッドで
+バックグラウンド実行します。同時に走る推論数はワーカー数で上限を設け、
+リクエストスレッドは推論完了を待たずに応答します。
+キュー外のバックグラウンド推論（一括アップロード）も ``slot()`` で同じ枠を使います。
+"""
+
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+class DetectionJob:
+    """物体検知ジョブ1件分の状態"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, image_id, user_id, filename, model_id=None):
+        self.id = uuid.uuid4().hex
+        self.image_id = image_id
+        self.user_id = user_id
+        self.filename = filename
+        self.model_id = model_id
+        self.status = self.QUEUED
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    def to_dict(self):
+        """API応答用の辞書を返す"""
+        return {
+            'job_id': self.id,
+            'image_id': self.image_id,
+            'model': self.model_id,
+            'status': self.status,
+            'error': self.error,
+            'detection_count': (self.result or {}).get('count'),
+            'updated_at': (self.result or {}).get('updated_at'),
+            'queued_seconds': round((self.started_at or time.time()) - self.created_at, 3),
+            'run_seconds': round(self.finished_at - self.started_at, 3) if self.finished_at and self.started_at else None,
+        }
+
+
+class DetectionJobQueue:
+    """有界キュー + 固定数ワーカーによる物体検知ジョブ実行器
+
+    Args:
+        app: ワーカー内でアプリケーションコンテキストを張るためのFlaskアプリ
+        handler: ``handler(job)`` で検知と保存を行い、保存済みペイロードを返す関数
+        workers (int): ワーカースレッド数（同時推論数の上限）
+        max_queued (int): 待機ジョブ数の上限（超過時は submit が None を返す）
+        keep_finished (int): 状態照会用に保持する完了済みジョブ数
+    """
+
+    def __init__(self, app, handler, workers=2, max_queued=100, keep_finished=500):
+        self.app = app
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.keep_finished = keep_finished
+        self._queue = queue.Queue(maxsize=max(0, int(max_queued)))
+        self._slots = threading.Semaphore(self.workers)
+        self._jobs = {}
+        self._active_by_image = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self._run_time = None  # 処理時間の指数移動平均（秒）
+
+    def _ensure_workers(self):
+        """ワーカーを遅延起動（fork後の子プロセスでは作り直す）"""
+        if self._pid == os.getpid() and self._threads:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._threads:
+                return
+            self._pid = os.getpid()
+            self._threads = []
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f'detector-job-{i}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, image_id, user_id, filename, model_id=None):
+        """ジョブを登録。同じ画像の未完了ジョブがあればそれを返す。満杯ならNone"""
+        self._ensure_workers()
+        with self._lock:
+            active_id = self._active_by_image.get(image_id)
+            active = self._jobs.get(active_id) if active_id else None
+            if active and not active.is_finished:
+                return active
+            job = DetectionJob(image_id, user_id, filename, model_id)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                return None
+            self._jobs[job.id] = job
+            self._active_by_image[image_id] = job.id
+            self._prune_locked()
+            return job
+
+    @contextmanager
+    def slot(self):
+        """``with queue.slot():`` の間だけ推論枠（ワーカー数と同数）を1つ持つ"""
+        self._slots.acquire()
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def get(self, job_id):
+        """ジョブIDからジョブを取得（存在しなければNone）"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find_active(self, image_id):
+        """画像に対する未完了ジョブを取得"""
+        with self._lock:
+            job = self._jobs.get(self._active_by_image.get(image_id))
+            return job if job and not job.is_finished else None
+
+    def depth(self):
+        """待機中のジョブ数"""
+        return self._queue.qsize()
+
+    def pending(self, user_id):
+        """ユーザーの未完了（待機中・実行中）ジョブ数"""
+        with self._lock:
+            jobs = (self._jobs.get(job_id) for job_id in self._active_by_image.values())
+            return sum(1 for job in jobs if job and job.user_id == user_id and not job.is_finished)
+
+    def estimated_wait(self):
+        """今登録したジョブが完了するまでの見積もり秒数（最低1秒）"""
+        run_time = self._run_time or 1.0
+        return max(1, math.ceil(run_time * (self.depth() + 1) / self.workers))
+
+    def _prune_locked(self):
+        finished = [j for j in self._jobs.values() if j.is_finished]
+        if len(finished) <= self.keep_finished:
+            return
+        finished.sort(key=lambda j: j.finished_at or 0)
+        for job in finished[:len(finished) - self.keep_finished]:
+            self._jobs.pop(job.id, None)
+            if self._active_by_image.get(job.image_id) == job.id:
+                self._active_by_image.pop(job.image_id, None)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            job.status = DetectionJob.RUNNING
+            job.started_at = time.time()
+            try:
+                with self.app.app_context():
+                    job.result = self.handler(job)
+                job.status = DetectionJob.DONE
+            except Exception as e:
+                job.error = str(e)
+                job.status = DetectionJob.FAILED
+                self.app.logger.error(f"検知ジョブ失敗: job={job.id} image_id={job.image_id}: {e}")
+            finally:
+                job.finished_at = time.time()
+                elapsed = job.finished_at - job.started_at
+                self._run_time = elapsed if self._run_time is None else 0.8 * self._run_time + 0.2 * elapsed
+                self._queue.task_done()
+
+
+_CREATE_LOCK = threading.Lock()
+
+
+def get_job_queue(app, handler):
+    """アプリ単位のジョブキューを取得（未作成なら設定値から生成）"""
+    jq = app.extensions.get('detector_jobs')
+    if jq is not None:
+        return jq
+    with _CREATE_LOCK:
+        jq = app.extensions.get('detector_jobs')
+        if jq is None:
+            from .runtime import default_job_workers
+            jq = DetectionJobQueue(
+                app,
+                handler,
+                workers=app.config.get('DETECTOR_JOB_WORKERS', 2) or default_job_workers(app.config),
+                max_queued=app.config.get('DETECTOR_JOB_QUEUE_SIZE', 100),
+            )
+            app.extensions['detector_jobs'] = jq
+    return jq
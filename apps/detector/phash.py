@@ -0,0 +1,197 @@
+"""
+知覚ハッシュによる類似画像（ほぼ重複）の検出
+
+再エンコード・縮小された同じ写真は内容ハッシュ（SHA-256）では一致しないため、
+64bit の dHash（隣接画素の明暗差）で比較します。ハミング距離が小さい画像を
+「ほぼ重複」とみなし、保存済みの検知結果を再利用します（他ユーザーの画像の結果は
+内容ハッシュが一致する場合のみ）。
+
+索引はマルチインデックスハッシング（64bit を16bit×4ブロックに分け、ブロックごとの
+ハッシュ表を引く）です。距離 r 以内の画像は鳩の巣原理により少なくとも1ブロックで
+距離 r // 4 以内に収まるため、各ブロックの近傍値だけを引けば候補が揃います。
+数十万件でも1回の検索は辞書参照数十回 + 候補の popcount で済みます。
+"""
+
+import threading
+import time
+
+import numpy as np
+
+HASH_BITS = 64
+_BLOCKS = 4
+_BLOCK_BITS = HASH_BITS // _BLOCKS
+_BLOCK_MASK = (1 << _BLOCK_BITS) - 1
+
+
+def dhash(path, hash_size=8):
+    """画像ファイルの dHash（64bit 整数）
+
+    JPEG は draft モードで縮小デコードするため、大きな画像でも全画素は展開しない。
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as src:
+        src.draft('L', (hash_size * 16, hash_size * 16))
+        img = ImageOps.exif_transpose(src).convert('L')
+        small = np.asarray(img.resize((hash_size + 1, hash_size), Image.LANCZOS), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hash_to_hex(value):
+    """DB 保存用の16桁16進表記"""
+    return f'{value:016x}'
+
+
+def hex_to_hash(text):
+    return int(text, 16)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def _blocks(value):
+    return [(value >> (i * _BLOCK_BITS)) & _BLOCK_MASK for i in range(_BLOCKS)]
+
+
+def _neighbors(block, radius):
+    """block から距離 radius 以内の16bit値（radius は 0 か 1 を想定）"""
+    yield block
+    if radius >= 1:
+        for i in range(_BLOCK_BITS):
+            yield block ^ (1 << i)
+
+
+class NearDuplicateIndex:
+    """dHash のマルチインデックスハッシング索引（スレッドセーフ）
+
+    画像IDごとに (ハッシュ, ユーザーID) を保持する。``max_distance`` は 7 以下
+    （各ブロックの許容距離が1以下）を想定する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables = [dict() for _ in range(_BLOCKS)]  # block値 -> {image_id}
+        self._entries = {}  # image_id -> (hash, user_id)
+        self.last_id = 0  # refresh_index で DB から取り込み済みの最大画像ID
+        self.rebuilt_at = None  # DB から全件を取り込み直した時刻（time.monotonic）
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, image_id, value, user_id=None):
+        with self._lock:
+            self._remove_locked(image_id)
+            self._entries[image_id] = (value, user_id)
+            for table, block in zip(self._tables, _blocks(value)):
+                table.setdefault(block, set()).add(image_id)
+
+    def remove(self, image_id):
+        with self._lock:
+            self._remove_locked(image_id)
+
+    def reset(self, entries, last_id):
+        """索引の内容を entries（[(画像ID, ハッシュ, ユーザーID), ...]）で置き換える"""
+        tables = [dict() for _ in range(_BLOCKS)]
+        stored = {}
+        for image_id, value, user_id in entries:
+            stored[image_id] = (value, user_id)
+            for table, block in zip(tables, _blocks(value)):
+                table.setdefault(block, set()).add(image_id)
+        with self._lock:
+            self._tables, self._entries = tables, stored
+            self.last_id = last_id
+            self.rebuilt_at = time.monotonic()
+
+    def _remove_locked(self, image_id):
+        entry = self._entries.pop(image_id, None)
+        if entry is None:
+            return
+        for table, block in zip(self._tables, _blocks(entry[0])):
+            ids = table.get(block)
+            if ids is not None:
+                ids.discard(image_id)
+                if not ids:
+                    del table[block]
+
+    def query(self, value, max_distance=5, user_id=None, exclude=None):
+        """距離 max_distance 以内の画像を近い順に返す
+
+        Returns:
+            list: [(距離, 画像ID, ユーザーID), ...]
+        """
+        radius = max_distance // _BLOCKS
+        matches = []
+        with self._lock:
+            seen = set()
+            for table, block in zip(self._tables, _blocks(value)):
+                for candidate in _neighbors(block, radius):
+                    ids = table.get(candidate)
+                    if not ids:
+                        continue
+                    for image_id in ids:
+                        if image_id in seen or image_id == exclude:
+                            continue
+                        seen.add(image_id)
+                        other, owner = self._entries[image_id]
+                        if user_id is not None and owner != user_id:
+                            continue
+                        distance = hamming(value, other)
+                        if distance <= max_distance:
+                            matches.append((distance, image_id, owner))
+        matches.sort()
+        return matches
+
+
+_CREATE_LOCK = threading.Lock()
+
+
+def get_near_duplicate_index(app):
+    """アプリ単位の類似画像索引（未作成なら空で作る。DB からの取り込みは refresh_index）"""
+    index = app.extensions.get('detector_phash_index')
+    if index is not None:
+        return index
+    with _CREATE_LOCK:
+        index = app.extensions.get('detector_phash_index')
+        if index is None:
+            index = app.extensions['detector_phash_index'] = NearDuplicateIndex()
+    return index
+
+
+def _iter_rows(after_id, chunk_size):
+    """有効で知覚ハッシュのある画像の (画像ID, ハッシュ16進, ユーザーID) を画像ID順に chunk_size 件ずつ返す"""
+    from apps.models.model import UserImage, db
+
+    while True:
+        rows = db.session.query(UserImage.id, UserImage.perceptual_hash, UserImage.user_id).filter(
+            UserImage.id > after_id,
+            UserImage.is_active == True,  # noqa: E712
+            UserImage.perceptual_hash.isnot(None),
+        ).order_by(UserImage.id).limit(chunk_size).all()
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1][0]
+
+
+def refresh_index(index, chunk_size=5000, max_age=None):
+    """索引に未取り込みの画像（他プロセスでの登録分を含む）を画像ID順に取り込む
+
+    新しい画像IDだけを追加で取り込むため、既存の画像への後付けのハッシュ（backfill-phash）や
+    他プロセスでの削除は反映されない。max_age（秒）を指定すると、前回の作り直しから
+    それ以上経っていれば DB から全件を読み直して置き換える。
+    """
+    if max_age is not None and (index.rebuilt_at is None or time.monotonic() - index.rebuilt_at >= max_age):
+        entries = []
+        last_id = 0
+        for rows in _iter_rows(0, chunk_size):
+            entries.extend((image_id, hex_to_hash(text), user_id) for image_id, text, user_id in rows)
+            last_id = rows[-1][0]
+        index.reset(entries, last_id)
+        return index
+    for rows in _iter_rows(index.last_id, chunk_size):
+        for image_id, text, user_id in rows:
+            index.add(image_id, hex_to_hash(text), user_id)
+        index.last_id = rows[-1][0]
+    return index
@@ -0,0 +1,80 @@
+"""
+推論前処理（縮小デコード + レターボックス）
+
+モデル入力は imgsz（既定640px）四方しか使わないため、元画像を原寸で展開せずに
+縮小した状態でデコードします。JPEG は PIL の draft モード（DCTスケーリング）、
+その他の形式は ``Image.reduce`` で整数倍縮小してからリサイズします。
+検出枠は ``scale_boxes_to_original`` で元画像の座標系に戻します。
+"""
+
+LETTERBOX_COLOR = (114, 114, 114)  # Ultralytics と同じパディング色
+
+
+class LetterboxMeta:
+    """レターボックス変換の情報（元画像座標への逆変換用）"""
+
+    __slots__ = ('orig_width', 'orig_height', 'scale', 'pad_x', 'pad_y')
+
+    def __init__(self, orig_width, orig_height, scale, pad_x, pad_y):
+        self.orig_width = orig_width
+        self.orig_height = orig_height
+        self.scale = scale
+        self.pad_x = pad_x
+        self.pad_y = pad_y
+
+
+def decode_reduced(path, target):
+    """長辺が target 以上を保つ範囲で縮小しながらデコードし、(RGB画像, 元サイズ) を返す"""
+    from PIL import Image
+
+    img = Image.open(path)
+    orig_size = img.size
+    ratio = target / max(orig_size)
+    if ratio < 1:
+        want = (max(1, int(orig_size[0] * ratio)), max(1, int(orig_size[1] * ratio)))
+        if img.format == 'JPEG':
+            # 要求サイズ以上になる最大の 1/2, 1/4, 1/8 でデコードされる
+            img.draft('RGB', want)
+        else:
+            factor = int(1 / ratio)
+            if factor >= 2:
+                # reduce はパレット・1bit・16bit 等のモードに未対応のため、先に RGB へ変換する
+                if img.mode not in ('RGB', 'L'):
+                    img = img.convert('RGB')
+                img = img.reduce(factor)
+    return img.convert('RGB'), orig_size
+
+
+def letterbox(img, orig_size, size=640):
+    """アスペクト比を保って size 四方に収め、余白を埋めた画像と変換情報を返す"""
+    from PIL import Image
+
+    w, h = img.size
+    fit = min(size / w, size / h)
+    new_w, new_h = max(1, round(w * fit)), max(1, round(h * fit))
+    if (new_w, new_h) != (w, h):
+        img = img.resize((new_w, new_h), Image.BILINEAR)
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    canvas = Image.new('RGB', (size, size), LETTERBOX_COLOR)
+    canvas.paste(img, (pad_x, pad_y))
+    # 元画像 → レターボックス座標の倍率（縮小デコード分も含む）
+    scale = new_w / orig_size[0]
+    return canvas, LetterboxMeta(orig_size[0], orig_size[1], scale, pad_x, pad_y)
+
+
+def load_for_inference(path, size=640):
+    """推論用に縮小デコード + レターボックスした画像と変換情報を返す"""
+    img, orig_size = decode_reduced(path, size)
+    return letterbox(img, orig_size, size)
+
+
+def scale_boxes_to_original(xyxy, meta):
+    """レターボックス座標の xyxy 配列（N×4）を元画像座標に戻してクリップする"""
+    import numpy as np
+
+    boxes = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4).copy()
+    boxes[:, [0, 2]] = (boxes[:, [0, 2]] - meta.pad_x) / meta.scale
+    boxes[:, [1, 3]] = (boxes[:, [1, 3]] - meta.pad_y) / meta.scale
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, meta.orig_width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, meta.orig_height)
+    return boxes
@@ -0,0 +1,169 @@
+"""
+モデル更新時の差分再検知
+
+保存済み検知結果のモデル指紋（重みハッシュ + 推論パラメータ）を現在の値と比較し、
+古い結果だけを選んでワーカープールで再検知します。進捗はチェックポイントファイルに
+定期的に書き出し、中断しても続きから再開できます。
+
+``flask --app run detector redetect-stale`` から使います。
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import and_, or_, not_
+
+from apps.models.model import DetectionResult, UserImage, db
+
+
+def current_fingerprints(model_ids):
+    """モデルIDごとの現在の指紋一覧（通常推論・タイル推論の両方を最新とみなす）"""
+    from .routes import model_fingerprint
+
+    fingerprints = {}
+    for model_id in model_ids:
+        values = {model_fingerprint(model_id, tiled) for tiled in (False, True)}
+        values.discard(None)
+        fingerprints[model_id] = sorted(values)
+    return fingerprints
+
+
+def _stale_query(fingerprints, include_missing=False):
+    """再検知が必要な (画像ID, ファイル名, 保存済みモデル) を返すクエリ（画像ID順）"""
+    query = db.session.query(UserImage.id, UserImage.filename, DetectionResult.model).outerjoin(
+        DetectionResult, DetectionResult.image_id == UserImage.id
+    ).filter(UserImage.is_active == True)  # noqa: E712
+    fresh = [
+        and_(DetectionResult.model == model_id, DetectionResult.model_fingerprint.in_(values))
+        for model_id, values in fingerprints.items() if values
+    ]
+    stale = and_(DetectionResult.id.isnot(None), not_(or_(*fresh))) if fresh else DetectionResult.id.isnot(None)
+    if include_missing:
+        stale = or_(stale, DetectionResult.id.is_(None))
+    return query.filter(stale).order_by(UserImage.id)
+
+
+def count_stale(fingerprints, after_id=0, include_missing=False):
+    """再検知対象の件数"""
+    return _stale_query(fingerprints, include_missing).filter(UserImage.id > after_id).order_by(None).count()
+
+
+def iter_stale(fingerprints, after_id=0, include_missing=False, chunk_size=500):
+    """再検知対象を画像ID順にチャンク単位で読み出す（全件をメモリに載せない）"""
+    while True:
+        rows = _stale_query(fingerprints, include_missing).filter(UserImage.id > after_id).limit(chunk_size).all()
+        if not rows:
+            return
+        yield from rows
+        after_id = rows[-1][0]
+
+
+class RedetectCheckpoint:
+    """再検知の進捗（処理済み画像IDの境界・件数・失敗ID）をJSONで保存する"""
+
+    def __init__(self, path):
+        self.path = path
+        self.fingerprints = {}
+        self.last_id = 0
+        self.done = 0
+        self.failed = []
+
+    def load(self, fingerprints):
+        """保存済みの進捗を読む。指紋が変わっていれば（別の更新が入った）最初からやり直す"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('fingerprints') != fingerprints:
+            return False
+        self.fingerprints = fingerprints
+        self.last_id = int(data.get('last_id') or 0)
+        self.done = int(data.get('done') or 0)
+        self.failed = list(data.get('failed') or [])
+        return True
+
+    def save(self):
+        """一時ファイルへ書いてから置き換える（書き込み途中で中断しても壊れない）"""
+        if not self.path:
+            return
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({
+                'fingerprints': self.fingerprints,
+                'last_id': self.last_id,
+                'done': self.done,
+                'failed': self.failed,
+                'saved_at': time.time(),
+            }, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+def run_redetect(app, items, detect_one, checkpoint, workers=2, total=None, progress=None,
+                 checkpoint_every=20):
+    """再検知対象をワーカープールで処理する
+
+    Args:
+        app: ワーカー内でアプリケーションコンテキストを張るためのFlaskアプリ
+        items: (画像ID, ファイル名, モデルID) の反復子（画像ID昇順）
+        detect_one: ``detect_one(image_id, filename, model_id)`` で再検知と保存を行う関数
+        checkpoint (RedetectCheckpoint): 進捗の保存先
+        workers (int): 同時に処理する件数
+        total (int): 進捗表示用の総件数
+        progress: ``progress(done, failed, total, elapsed)`` で呼ばれる進捗通知（省略可）
+        checkpoint_every (int): チェックポイントを書き出す完了件数の間隔
+    """
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(max(1, workers) * 2)  # 読み出しすぎないよう投入数を制限
+    submitted = deque()  # 投入順の画像ID（境界 last_id の算出用）
+    finished = set()
+    skip = set(checkpoint.failed)
+    started = time.monotonic()
+    counts = {'done': 0, 'failed': 0, 'since_save': 0}
+
+    def _complete(image_id, ok):
+        with lock:
+            finished.add(image_id)
+            if ok:
+                counts['done'] += 1
+                checkpoint.done += 1
+            else:
+                counts['failed'] += 1
+                checkpoint.failed.append(image_id)
+            # 先頭から連続して完了した分だけ境界を進める（並列完了の順不同に対応）
+            while submitted and submitted[0] in finished:
+                checkpoint.last_id = submitted.popleft()
+                finished.discard(checkpoint.last_id)
+            counts['since_save'] += 1
+            if counts['since_save'] >= checkpoint_every:
+                counts['since_save'] = 0
+                checkpoint.save()
+            if progress:
+                progress(counts['done'], counts['failed'], total, time.monotonic() - started)
+
+    def _task(image_id, filename, model_id):
+        try:
+            with app.app_context():
+                detect_one(image_id, filename, model_id)
+            ok = True
+        except Exception as e:
+            app.logger.error(f"再検知に失敗: image_id={image_id}: {e}")
+            ok = False
+        finally:
+            slots.release()
+        _complete(image_id, ok)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='detector-redetect') as pool:
+        for image_id, filename, model_id in items:
+            if image_id in skip:
+                continue
+            slots.acquire()
+            with lock:
+                submitted.append(image_id)
+            pool.submit(_task, image_id, filename, model_id)
+
+    checkpoint.save()
+    return counts['done'], counts['failed']
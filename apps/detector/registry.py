@@ -0,0 +1,175 @@
+"""
+検知モデルレジストリ
+
+複数の重みファイル（yolov8n / yolov8s / yolov8m や用途別モデル）を要求時に読み込み、
+プロセス内に常駐させるモデル数とメモリ量に上限を設けます。上限を超えた場合は
+最も長く使われていないモデルから解放します（LRU）。モデルごとに BatchPredictor を持ち、
+解放時にはディスパッチャも停止します。
+
+モデルは要求されたときに初めて読み込むため、リクエスト単位でモデルを選べても
+全ワーカーに全モデルが載ることはありません。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_model_bytes(model):
+    """モデルのメモリ使用量の概算（パラメータ + バッファ。取れなければ0）"""
+    module = getattr(model, 'model', model)
+    try:
+        tensors = list(module.parameters()) + list(module.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        return 0
+
+
+class ResidentModel:
+    """常駐中のモデル1件"""
+
+    __slots__ = ('model_id', 'model', 'batcher', 'nbytes', 'loaded_at', 'last_used', 'uses')
+
+    def __init__(self, model_id, model, batcher, nbytes):
+        self.model_id = model_id
+        self.model = model
+        self.batcher = batcher
+        self.nbytes = nbytes
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.uses = 0
+
+    def to_dict(self):
+        return {
+            'model_id': self.model_id,
+            'bytes': self.nbytes,
+            'loaded_at': self.loaded_at,
+            'last_used': self.last_used,
+            'uses': self.uses,
+        }
+
+
+class ModelRegistry:
+    """LRU で常駐数・メモリ量を制限するモデルレジストリ
+
+    Args:
+        loader: ``loader(model_id)`` でモデルを返す関数（失敗時は None）
+        make_batcher: ``make_batcher(model)`` で BatchPredictor を返す関数
+        max_models (int): 常駐させる最大モデル数（最低1）
+        max_bytes (int): 常駐モデルの合計メモリ上限（0 は無制限）。直近に使うモデルは常に残す
+        logger: ロード・解放のログ出力先（省略可）
+    """
+
+    def __init__(self, loader, make_batcher, max_models=2, max_bytes=0, logger=None):
+        self.loader = loader
+        self.make_batcher = make_batcher
+        self.max_models = max(1, int(max_models))
+        self.max_bytes = max(0, int(max_bytes))
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._models = OrderedDict()  # model_id -> ResidentModel（末尾が最近使用）
+        self._load_locks = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, model_id):
+        """モデルを取得（未ロードならロードし、必要に応じて古いモデルを解放）。失敗時は None"""
+        with self._lock:
+            entry = self._touch_locked(model_id)
+            if entry is not None:
+                return entry
+            load_lock = self._load_locks.setdefault(model_id, threading.Lock())
+
+        # 同じモデルの同時ロードは1回にまとめる（他モデルの利用は止めない）
+        with load_lock:
+            with self._lock:
+                entry = self._touch_locked(model_id)
+                if entry is not None:
+                    return entry
+            model = self.loader(model_id)
+            if model is None:
+                return None
+            entry = ResidentModel(model_id, model, self.make_batcher(model), estimate_model_bytes(model))
+            with self._lock:
+                self._models[model_id] = entry
+                self.loads += 1
+                evicted = self._evict_locked()
+            entry.uses += 1
+        for old in evicted:
+            self._close(old)
+        if self.logger:
+            self.logger.info(f"検知モデルをロード: {model_id} ({entry.nbytes / 1e6:.1f}MB, 常駐 {len(self._models)}件)")
+        return entry
+
+    def _touch_locked(self, model_id):
+        entry = self._models.get(model_id)
+        if entry is not None:
+            self._models.move_to_end(model_id)
+            entry.last_used = time.time()
+            entry.uses += 1
+        return entry
+
+    def _evict_locked(self):
+        """上限を超えている間、最も古いモデルを外す（直近ロードした1件は残す）"""
+        evicted = []
+        while len(self._models) > 1 and (
+            len(self._models) > self.max_models
+            or (self.max_bytes and sum(e.nbytes for e in self._models.values()) > self.max_bytes)
+        ):
+            _, old = self._models.popitem(last=False)
+            self.evictions += 1
+            evicted.append(old)
+        return evicted
+
+    def _close(self, entry):
+        if entry.batcher is not None:
+            entry.batcher.close()
+        if self.logger:
+            self.logger.info(f"検知モデルを解放: {entry.model_id}")
+
+    def evict(self, model_id):
+        """指定モデルを明示的に解放"""
+        with self._lock:
+            entry = self._models.pop(model_id, None)
+        if entry is not None:
+            self.evictions += 1
+            self._close(entry)
+        return entry is not None
+
+    def resident(self):
+        """常駐中のモデル一覧（古い順）"""
+        with self._lock:
+            return [e.to_dict() for e in self._models.values()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'resident': [e.to_dict() for e in self._models.values()],
+                'resident_bytes': sum(e.nbytes for e in self._models.values()),
+                'max_models': self.max_models,
+                'max_bytes': self.max_bytes,
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
+
+
+_CREATE_LOCK = threading.Lock()
+
+
+def get_model_registry(app, loader, make_batcher):
+    """アプリ単位のモデルレジストリを取得（未作成なら設定値から生成）"""
+    registry = app.extensions.get('detector_models')
+    if registry is not None:
+        return registry
+    with _CREATE_LOCK:
+        registry = app.extensions.get('detector_models')
+        if registry is None:
+            registry = ModelRegistry(
+                loader,
+                make_batcher,
+                max_models=app.config.get('DETECTOR_MAX_RESIDENT_MODELS', 2),
+                max_bytes=int(app.config.get('DETECTOR_MODEL_MEMORY_BUDGET_MB', 0) or 0) * 1024 * 1024,
+                logger=app.logger,
+            )
+            app.extensions['detector_models'] = registry
+    return registry
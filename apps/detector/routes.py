@@ -4,15 +4,46 @@
 画像アップロード、物体検知実行、結果表示などの機能を提供します。
 """
 
-from flask import render_template, request, jsonify, current_app, flash, redirect, url_for, send_from_directory
+from flask import Response, render_template, request, jsonify, current_app, flash, redirect, stream_with_context, url_for
 from flask_login import login_required, current_user
+from werkzeug.exceptions import NotFound
 from werkzeug.utils import secure_filename
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import aliased
+from sqlalchemy.exc import IntegrityError
 import os
+import base64
 import datetime
+import io
 import uuid
 import json
+import hashlib
+import itertools
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from . import detector_bp
-from apps.models.model import UserImage, db
+from .admission import AdmissionRejected, get_admission_controller
+from .analytics import parse_period, record_result, rollup
+from .batching import BatchPredictor
+from .bulk import get_bulk_tracker
+from .cache import file_sha256, get_detection_cache, make_cache_key
+from .jobs import get_job_queue
+from .phash import dhash, get_near_duplicate_index, hash_to_hex, hex_to_hash, refresh_index
+from .registry import get_model_registry
+from .storage import acquire_blob, is_blob_key, place_blobs, release_blob, sidecar_relpath, stage_blobs
+from .preprocess import decode_reduced, letterbox, scale_boxes_to_original
+from .tiling import tiled_inference
+from .runtime import apply_inference_thread_settings
+from .serving import get_ownership_cache, send_image
+from .singleflight import get_single_flight
+from .timing import StageTimer, get_stage_metrics, span
+from .uploads import FORMAT_EXTENSIONS, HashingUploadStream, UploadRejected, is_archive
+from .thumbnails import THUMB_VARIANTS, ensure_thumbnail, generate_thumbnails, remove_thumbnails
+from .video import (VIDEO_EXTENSIONS, VideoUnsupported, batched, find_video, is_video, iter_frames,
+                    new_video_path, probe, purge_stale_videos, sse_event)
+from apps.models.model import UserImage, DetectionResult, Detection, DetectionClassIndex, db
 
 def allowed_file(filename):
     """許可されたファイル形式かチェック"""
@@ -25,28 +56,113 @@ def ensure_upload_dirs():
     os.makedirs(upload_dir, exist_ok=True)
     return upload_dir
 
-def result_json_path(filename: str) -> str:
-    """検知結果JSONのパス（画像と同階層、<filename>.det.json）"""
+def result_json_path(filename: str, image_id=None) -> str:
+    """検知結果JSONのパス
+
+    画像IDがあれば結果フォルダ配下の画像ID別パス（同じ実体を共有する画像でも別々）、
+    なければ旧形式の画像と同階層 <filename>.det.json。
+    """
+    if image_id is not None:
+        path = os.path.join(current_app.config['DETECTOR_RESULT_FOLDER'], sidecar_relpath(image_id))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
     upload_dir = ensure_upload_dirs()
     return os.path.join(upload_dir, f"{filename}.det.json")
 
-def save_detection_results(filename: str, results: list):
-    """検知結果をJSONに保存（上書き）"""
+def _upsert_detection_result(user_image, model: str, results: list, updated_at, timings=None, fingerprint=None):
+    """画像の検知結果行を作成/更新し、検出行・クラス索引・集計表を更新する（コミットは呼び出し側）"""
+    class_counts = {}
+    by_class = {}  # クラス名 -> (最大信頼度, 件数)
+    for r in results:
+        class_counts[r.get('class')] = class_counts.get(r.get('class'), 0) + 1
+        name = str(r.get('class'))
+        best, n = by_class.get(name, (0.0, 0))
+        by_class[name] = (max(best, float(r.get('confidence') or 0.0)), n + 1)
+    row = DetectionResult.query.filter_by(image_id=user_image.id).first()
+    if row is None:
+        row = DetectionResult(image_id=user_image.id, user_id=user_image.user_id)
+        db.session.add(row)
+    else:
+        # 集計表から旧結果の分を取り消す
+        record_result(row.user_id, row.updated_at, [d.class_name for d in row.detections],
+                      [d.confidence for d in row.detections], sign=-1)
+    record_result(user_image.user_id, updated_at, [str(r.get('class')) for r in results],
+                  [float(r.get('confidence') or 0.0) for r in results])
+    # クラス索引は (検知結果, クラス) が主キーのため、既存行は更新して使い回す
+    existing = {entry.class_name: entry for entry in row.class_index}
+    index = []
+    for name, (confidence, n) in by_class.items():
+        entry = existing.get(name) or DetectionClassIndex(class_name=name)
+        entry.image_id = user_image.id
+        entry.user_id = user_image.user_id
+        entry.max_confidence = confidence
+        entry.count = n
+        index.append(entry)
+    row.class_index = index
+    row.model = model
+    row.model_fingerprint = fingerprint
+    row.count = len(results)
+    row.class_counts = class_counts
+    row.updated_at = updated_at
+    row.timings = timings
+    row.detections = [Detection.from_dict(r) for r in results]
+    return row
+
+# 画像ごとの検知結果の保存を直列化するロック（画像IDで選ぶ）
+_SAVE_LOCKS = [threading.Lock() for _ in range(64)]
+
+def save_detection_results(user_image, results: list, timer=None, model_id=None, tiled=False):
+    """画像の検知結果をDB（detection_results / detections）に保存し、サイドカーJSONも上書き
+
+    コンテンツアドレス形式のファイル名は複数の画像（別ユーザーを含む）で共有されるため、
+    保存先は必ず画像（UserImage）で指定する。
+
+    model には推論に使ったモデルID（省略時は既定モデル）、model_fingerprint には
+    重みハッシュ + 推論パラメータの指紋を記録する（シミュレーション結果は None）。
+
+    timer（StageTimer）を渡すと、保存前までのステージ別時間をペイロードの timings に記録し、
+    保存時間（save）を加えた値をステージ別メトリクスへ集計する。
+    """
+    filename = user_image.filename
+    now = datetime.datetime.utcnow().replace(microsecond=0)
     payload = {
         'image_filename': filename,
-        'updated_at': datetime.datetime.utcnow().isoformat(timespec='seconds') + 'Z',
-    'model': 'yolov8n',
+        'updated_at': now.isoformat(timespec='seconds') + 'Z',
+        'model': model_id or default_model_id(),
+        'model_fingerprint': None if isinstance(results, FallbackResults) else model_fingerprint(model_id, tiled),
         'results': results,
         'count': len(results)
     }
-    path = result_json_path(filename)
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    if timer is not None:
+        payload['timings'] = timer.to_dict()
+    with span(timer, 'save'):
+        # 別モデル・タイル有無の検知が同じ画像の結果行を同時に置き換えないよう直列化（プロセス内）
+        with _SAVE_LOCKS[user_image.id % len(_SAVE_LOCKS)]:
+            _upsert_detection_result(user_image, payload['model'], results, now, payload.get('timings'),
+                                     payload['model_fingerprint'])
+            db.session.commit()
+        # 旧形式との互換のためサイドカーJSONも残す（一覧表示はDBのみを参照）。
+        # 読み手が書きかけのファイルを見ないよう、一時ファイルに書いてから置き換える
+        path = result_json_path(filename, user_image.id)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    if timer is not None:
+        get_stage_metrics(current_app).observe(timer.to_dict())
     return payload
 
-def load_detection_results(filename: str):
-    """検知結果JSONを読み込み。存在しない場合はNone"""
-    path = result_json_path(filename)
+def load_detection_results(user_image):
+    """画像の検知結果を読み込み（DB優先、未移行ならサイドカーJSON）。存在しない場合はNone"""
+    row = DetectionResult.query.filter_by(image_id=user_image.id).first()
+    if row is not None:
+        return row.to_payload(user_image.filename)
+    path = result_json_path(user_image.filename, user_image.id)
     if not os.path.exists(path):
         return None
     try:
@@ -56,12 +172,566 @@ def load_detection_results(filename: str):
         current_app.logger.warning(f"検知結果の読み込み失敗: {e}")
         return None
 
-def generate_unique_filename(original_filename):
-    """一意のファイル名を生成"""
+def load_results_meta(user_id: int, image_ids=None):
+    """ユーザーの画像ごとの検知メタ（件数・検知日時）を1回の結合クエリで取得"""
+    query = db.session.query(
+        DetectionResult.image_id, DetectionResult.count, DetectionResult.updated_at
+    ).join(UserImage, UserImage.id == DetectionResult.image_id).filter(
+        UserImage.user_id == user_id,
+        UserImage.is_active == True  # noqa: E712
+    )
+    if image_ids is not None:
+        query = query.filter(DetectionResult.image_id.in_(list(image_ids)))
+    rows = query.all()
+    return {
+        image_id: {'count': count, 'updated_at': updated_at.isoformat(timespec='seconds') + 'Z' if updated_at else None}
+        for image_id, count, updated_at in rows
+    }
+
+def encode_gallery_cursor(img: UserImage) -> str:
+    """ギャラリーのページングカーソル（uploaded_at, id）を URL 安全な文字列に変換"""
+    raw = f"{img.uploaded_at.isoformat()}|{img.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_gallery_cursor(cursor: str):
+    """カーソル文字列を (uploaded_at, id) に戻す。不正な値はNone"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        ts, image_id = raw.rsplit('|', 1)
+        return datetime.datetime.fromisoformat(ts), int(image_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def parse_class_filter(args):
+    """検索条件（classes=dog,person / min_confidence=0.7 / match=all|any）を解釈する
+
+    Returns:
+        dict: classes（重複を除いたリスト）/ min_confidence / match。不正な値は ValueError
+    """
+    classes = []
+    for value in args.getlist('classes') + args.getlist('class'):
+        for name in value.split(','):
+            name = name.strip()
+            if name and name not in classes:
+                classes.append(name)
+    if len(classes) > 10:
+        raise ValueError('指定できるクラスは10個までです')
+    try:
+        min_confidence = float(args.get('min_confidence') or 0.0)
+    except ValueError:
+        raise ValueError('min_confidence は0〜1の数値で指定してください')
+    if not 0.0 <= min_confidence <= 1.0:
+        raise ValueError('min_confidence は0〜1の数値で指定してください')
+    match = args.get('match') or 'all'
+    if match not in ('all', 'any'):
+        raise ValueError('match は all または any で指定してください')
+    return {'classes': classes, 'min_confidence': min_confidence, 'match': match}
+
+def filter_by_classes(query, user_id, classes, min_confidence=0.0, match='all'):
+    """画像クエリをクラス索引で絞り込む
+
+    all はクラスごとに索引を結合（各クラスが信頼度の下限以上で写っている画像）、
+    any はいずれかのクラスを含む画像。索引 (user_id, class_name, max_confidence, image_id) で引く。
+    """
+    if not classes:
+        return query
+    if match == 'any':
+        hit = db.session.query(DetectionClassIndex.image_id).filter(
+            DetectionClassIndex.user_id == user_id,
+            DetectionClassIndex.class_name.in_(classes),
+            DetectionClassIndex.max_confidence >= min_confidence,
+            DetectionClassIndex.image_id == UserImage.id,
+        )
+        return query.filter(hit.exists())
+    for name in classes:
+        entry = aliased(DetectionClassIndex)
+        query = query.join(entry, and_(
+            entry.image_id == UserImage.id,
+            entry.user_id == user_id,
+            entry.class_name == name,
+            entry.max_confidence >= min_confidence,
+        ))
+    return query
+
+def load_class_summary(user_id: int, image_ids=None):
+    """画像ごとのクラス別 {件数, 最大信頼度}（検索結果の表示用）"""
+    query = db.session.query(DetectionClassIndex).filter(DetectionClassIndex.user_id == user_id)
+    if image_ids is not None:
+        query = query.filter(DetectionClassIndex.image_id.in_(list(image_ids)))
+    summary = {}
+    for entry in query:
+        summary.setdefault(entry.image_id, {})[entry.class_name] = {
+            'count': entry.count, 'max_confidence': round(entry.max_confidence, 4)}
+    return summary
+
+def user_class_counts(user_id: int):
+    """ユーザーの有効画像に写っているクラスと画像数（多い順）"""
+    rows = db.session.query(
+        DetectionClassIndex.class_name, func.count(DetectionClassIndex.image_id)
+    ).join(UserImage, UserImage.id == DetectionClassIndex.image_id).filter(
+        DetectionClassIndex.user_id == user_id,
+        UserImage.is_active == True  # noqa: E712
+    ).group_by(DetectionClassIndex.class_name).order_by(func.count(DetectionClassIndex.image_id).desc()).all()
+    return [{'class': name, 'images': n} for name, n in rows]
+
+def paginate_user_images(user_id: int, after=None, limit=None, classes=None, min_confidence=0.0, match='all'):
+    """ユーザーの有効画像を新しい順にキーセットページングで取得
+
+    ix_user_images_gallery (user_id, is_active, uploaded_at, id) を降順に走査するため、
+    何ページ目でも取得コストは1ページ分で一定。classes を指定するとクラス索引で絞り込む。
+
+    Returns:
+        tuple: (画像リスト, 次ページのカーソル or None)
+    """
+    limit = limit or current_app.config.get('DETECTOR_GALLERY_PAGE_SIZE', 24)
+    query = UserImage.query.filter_by(user_id=user_id, is_active=True)
+    query = filter_by_classes(query, user_id, classes, min_confidence, match)
+    key = decode_gallery_cursor(after) if after else None
+    if key:
+        ts, image_id = key
+        query = query.filter(or_(
+            UserImage.uploaded_at < ts,
+            and_(UserImage.uploaded_at == ts, UserImage.id < image_id)
+        ))
+    rows = query.order_by(UserImage.uploaded_at.desc(), UserImage.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_gallery_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def import_sidecar_results(upload_dir: str, batch_size=500):
+    """既存のサイドカーJSONを detection_results へ取り込む（取り込み件数, スキップ件数）
+
+    画像ごとに画像ID別のサイドカー（なければ旧形式の <filename>.det.json）を読む。
+    コンテンツアドレス形式のファイル名は複数の画像で共有されるため、旧形式のパスは
+    フラットなファイル名の画像でのみ引く。
+    """
+    result_dir = current_app.config['DETECTOR_RESULT_FOLDER']
+    imported = skipped = 0
+    after_id = 0
+    while True:
+        rows = UserImage.query.filter(UserImage.id > after_id).order_by(UserImage.id).limit(batch_size).all()
+        if not rows:
+            break
+        for user_image in rows:
+            after_id = user_image.id
+            path = os.path.join(result_dir, sidecar_relpath(user_image.id))
+            if not os.path.exists(path) and not is_blob_key(user_image.filename):
+                path = os.path.join(upload_dir, f"{user_image.filename}.det.json")
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                current_app.logger.warning(f"サイドカーJSONの読み込み失敗（スキップ）: {path}: {e}")
+                skipped += 1
+                continue
+            updated_at = None
+            if data.get('updated_at'):
+                try:
+                    updated_at = datetime.datetime.fromisoformat(data['updated_at'].rstrip('Z'))
+                except ValueError:
+                    pass
+            _upsert_detection_result(
+                user_image,
+                data.get('model') or 'yolov8n',
+                data.get('results') or [],
+                updated_at or datetime.datetime.utcnow().replace(microsecond=0),
+                fingerprint=data.get('model_fingerprint'),
+            )
+            imported += 1
+        db.session.commit()
+    return imported, skipped
+
+def ensure_thumb_dir():
+    """サムネイル保存ディレクトリの存在確認・作成"""
+    thumb_dir = current_app.config['DETECTOR_THUMB_FOLDER']
+    os.makedirs(thumb_dir, exist_ok=True)
+    return thumb_dir
+
+def ensure_video_dir():
+    """動画（フレーム検知用）の一時保存ディレクトリの存在確認・作成"""
+    video_dir = current_app.config['DETECTOR_VIDEO_FOLDER']
+    os.makedirs(video_dir, exist_ok=True)
+    return video_dir
+
+def _detect_and_save(user_image, model_id, timer, slot=None):
+    """バックグラウンドでの検知＋保存処理（サムネイルも先に生成）
+
+    slot には推論の間だけ持つジョブキューの推論枠を渡す。
+    """
+    filename = user_image.filename
+    try:
+        with timer.span('thumbnail'):
+            generate_thumbnails(
+                os.path.join(ensure_upload_dirs(), filename),
+                ensure_thumb_dir(),
+                filename,
+                size=current_app.config.get('DETECTOR_THUMB_SIZE', 320),
+            )
+    except Exception as e:
+        # サムネイルは初回表示時にも遅延生成されるため、ここでの失敗は検知を止めない
+        current_app.logger.warning(f"サムネイル生成に失敗（スキップ）: {filename}: {e}")
+    return detect_and_save_once(user_image, model_id or default_model_id(), timer=timer, slot=slot)[0]
+
+def detection_single_flight():
+    """アプリ単位の検知の集約"""
+    return get_single_flight(current_app._get_current_object())
+
+def detect_and_save_once(user_image, model_id=None, tiled=False, timer=None, slot=None):
+    """画像の検知＋保存を (画像ID, モデル指紋) ごとに1回にまとめて実行する
+
+    同じ画像・同じモデル指紋（シミュレーション時はモデルID + タイル有無）の検知が実行中なら、
+    推論せずにその完了を待ち、保存されたペイロードを受け取る。
+    slot（コンテキストマネージャー）は実際に推論する呼び出しだけが推論の間保持する。
+
+    Returns:
+        (保存済みペイロード, shared): shared は実行中の検知の結果を受け取った場合 True
+    """
+    model_id = model_id or default_model_id()
+    key = (user_image.id, model_fingerprint(model_id, tiled) or f"{model_id}:{'tiled' if tiled else 'full'}")
+    filename, content_hash = user_image.filename, user_image.content_hash
+
+    def run():
+        with slot if slot is not None else nullcontext():
+            results = simulate_object_detection(filename, tiled=tiled, timer=timer, model_id=model_id,
+                                                content_hash=content_hash)
+            return save_detection_results(user_image, results, timer=timer, model_id=model_id, tiled=tiled)
+
+    payload, shared = detection_single_flight().do(key, run)
+    if shared:
+        current_app.logger.info(f"実行中の検知結果を共有しました: image_id={user_image.id} model={model_id}")
+    return payload, shared
+
+def _run_detection_job(job):
+    """ジョブキューのワーカーから呼ばれる検知＋保存処理"""
+    timer = StageTimer()
+    if job.started_at:
+        timer.add('queue_wait', (job.started_at - job.created_at) * 1000.0)
+    user_image = db.session.get(UserImage, job.image_id)
+    if user_image is None:
+        # 検知待ちの間に削除された
+        return None
+    return _detect_and_save(user_image, job.model_id, timer, slot=detection_job_queue().slot())
+
+def _detect_bulk_item(image_id, model_id=None):
+    """一括アップロードの1画像分の検知（類似画像の結果があれば再利用し 'reused' を返す）"""
+    user_image = db.session.get(UserImage, image_id)
+    if user_image is None or not user_image.is_active:
+        return None
+    matches = find_near_duplicates(user_image)
+    if user_image.duplicate_of_id:
+        db.session.commit()
+    if model_id in (None, default_model_id()) and reuse_near_duplicate_results(user_image, matches) is not None:
+        return 'reused'
+    # 推論はジョブキューと同じ枠で行い、同時推論数を DETECTOR_JOB_WORKERS に収める
+    _detect_and_save(user_image, model_id, StageTimer(), slot=detection_job_queue().slot())
+    return 'detected'
+
+def bulk_upload_tracker():
+    """アプリ単位の一括アップロード管理"""
+    return get_bulk_tracker(current_app._get_current_object(), _detect_bulk_item,
+                            workers=detection_job_queue().workers)
+
+def detection_job_queue():
+    """アプリ単位の物体検知ジョブキュー"""
+    return get_job_queue(current_app._get_current_object(), _run_detection_job)
+
+def enqueue_detection(user_image, model_id=None):
+    """画像の検知ジョブを登録（キュー満杯時はNone）"""
+    job = detection_job_queue().submit(user_image.id, user_image.user_id, user_image.filename, model_id=model_id)
+    if job is None:
+        current_app.logger.warning(f"検知ジョブキューが満杯です: image_id={user_image.id}")
+    return job
+
+def admission_controller():
+    """アプリ単位の受付制御（リクエスト内で推論するAPI用）"""
+    return get_admission_controller(current_app._get_current_object())
+
+@contextmanager
+def admission_slot(user_id, timer=None):
+    """受付制御の実行枠を with の間だけ持つ（待ち時間は timer の admission に記録）"""
+    controller = admission_controller()
+    with span(timer, 'admission'):
+        started = controller.acquire(user_id)
+    try:
+        yield
+    finally:
+        controller.release(user_id, started)
+
+def rejected_response(error, retry_after, status):
+    """受付を断った応答（JSON + Retry-After）"""
+    response = jsonify({'success': False, 'error': error, 'retry_after': retry_after})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def admission_error_message(rejected):
+    if rejected.status == 429:
+        return '実行中の検知が多すぎます。完了してから再実行してください。'
+    return '検知処理が混雑しています。しばらくしてから再実行してください。'
+
+def store_uploaded_file(file):
+    """アップロードファイルを検証して保存し、画像メタ情報を返す（不正な画像は UploadRejected）
+
+    StreamingUploadRequest 経由なら受信済みの一時ファイルをそのまま rename する。
+    それ以外のストリームはチャンク単位で一時ファイルへ写してから同じ手順で保存する。
+    保存先は内容ハッシュで決まり（storage.blob_key）、同じ内容が保存済みなら
+    参照カウントだけを増やして一時ファイルは捨てる。
+
+    Returns:
+        dict: filename / original_filename / content_hash / perceptual_hash / image_format /
+            width / height / file_size
+    """
+    upload_dir = ensure_upload_dirs()
+    stream = file.stream
+    if not isinstance(stream, HashingUploadStream):
+        stream = HashingUploadStream(upload_dir)
+        for chunk in iter(lambda: file.stream.read(1024 * 1024), b''):
+            stream.write(chunk)
+    try:
+        image_format, width, height = stream.validate(current_app.config.get('DETECTOR_MAX_IMAGE_PIXELS'))
+        original_filename = secure_filename(file.filename)
+        filename, _created = acquire_blob(upload_dir, stream.sha256, FORMAT_EXTENSIONS[image_format][0],
+                                          stream.size, place=stream.commit)
+    finally:
+        stream.close()
+    return {
+        'filename': filename,
+        'original_filename': original_filename,
+        'content_hash': stream.sha256,
+        'perceptual_hash': compute_perceptual_hash(os.path.join(upload_dir, filename)),
+        'image_format': image_format,
+        'width': width,
+        'height': height,
+        'file_size': stream.size,
+    }
+
+def _bulk_entries(files):
+    """一括アップロードの入力を (表示名, 読み出し元) の列に展開する
+
+    読み出し元は受信済みの HashingUploadStream か、ZIP エントリを開く関数。
+    ZIP はエントリ単位で読み出すため、アーカイブ全体を展開しない。
+
+    Returns:
+        tuple: (エントリのリスト, 開いた ZipFile のリスト, 拒否したエントリのリスト)
+    """
+    max_files = current_app.config.get('DETECTOR_BULK_MAX_FILES', 500)
+    max_entry = current_app.config.get('MAX_CONTENT_LENGTH') or 0
+    entries, archives, rejected = [], [], []
+    for storage in files:
+        if not storage or not storage.filename:
+            continue
+        if is_archive(storage.filename, storage.mimetype):
+            try:
+                archive = zipfile.ZipFile(storage.stream)
+            except zipfile.BadZipFile:
+                rejected.append({'name': storage.filename, 'reason': 'ZIPとして読み込めません'})
+                continue
+            archives.append(archive)
+            for info in archive.infolist():
+                name = info.filename
+                base = os.path.basename(name)
+                if info.is_dir() or not base or base.startswith('.') or name.startswith('__MACOSX/'):
+                    continue
+                if not allowed_file(base):
+                    rejected.append({'name': name, 'reason': '対応していないファイル形式です'})
+                elif max_entry and info.file_size > max_entry:
+                    # 展開後サイズで判定（圧縮率の高い不正なZIPで一時ファイルが膨らむのを防ぐ）
+                    rejected.append({'name': name, 'reason': 'ファイルが大きすぎます'})
+                else:
+                    entries.append((name, lambda archive=archive, info=info: archive.open(info)))
+        elif allowed_file(storage.filename):
+            entries.append((storage.filename, storage.stream))
+        else:
+            rejected.append({'name': storage.filename, 'reason': '対応していないファイル形式です'})
+    if len(entries) > max_files:
+        rejected.extend({'name': name, 'reason': f'一度にアップロードできるのは {max_files} 件までです'}
+                        for name, _source in entries[max_files:])
+        entries = entries[:max_files]
+    return entries, archives, rejected
+
+def _prepare_bulk_entry(upload_dir, source, max_pixels):
+    """1エントリを一時ファイルへ書き出して検証し、(stream, 形式, 幅, 高さ, 知覚ハッシュ) を返す"""
+    if isinstance(source, HashingUploadStream):
+        stream = source
+    else:
+        stream = HashingUploadStream(upload_dir)
+        try:
+            with source() as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    stream.write(chunk)
+        except Exception:
+            stream.close()
+            raise
+    try:
+        image_format, width, height = stream.validate(max_pixels)
+        try:
+            perceptual_hash = hash_to_hex(dhash(stream.temp_path))
+        except Exception:
+            perceptual_hash = None
+        stream.finish()
+    except Exception:
+        stream.close()
+        raise
+    return stream, image_format, width, height, perceptual_hash
+
+def store_bulk_files(user_id, files):
+    """一括アップロードの画像を並列に検証・保存し、UserImage 行を1回のコミットで作成する
+
+    Returns:
+        tuple: (作成した UserImage のリスト, 拒否したエントリ [{'name', 'reason'}] のリスト)
+    """
+    upload_dir = ensure_upload_dirs()
+    entries, archives, rejected = _bulk_entries(files)
+    max_pixels = current_app.config.get('DETECTOR_MAX_IMAGE_PIXELS')
+    prepared = []
+    try:
+        workers = max(1, current_app.config.get('DETECTOR_BULK_WORKERS', 4))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='detector-bulk-store') as pool:
+            futures = [(name, pool.submit(_prepare_bulk_entry, upload_dir, source, max_pixels))
+                       for name, source in entries]
+            for name, future in futures:
+                try:
+                    prepared.append((name, *future.result()))
+                except UploadRejected as e:
+                    rejected.append({'name': name, 'reason': str(e)})
+                except Exception as e:
+                    current_app.logger.warning(f"一括アップロードのエントリを読み込めません: {name}: {e}")
+                    rejected.append({'name': name, 'reason': '読み込みに失敗しました'})
+    finally:
+        for archive in archives:
+            archive.close()
+
+    try:
+        for attempt in range(2):
+            keys = stage_blobs([(stream.sha256, FORMAT_EXTENSIONS[fmt][0], stream.size)
+                                for _name, stream, fmt, _w, _h, _ph in prepared])
+            images = [
+                UserImage(
+                    user_id=user_id,
+                    image_path=f"uploads/{key}",
+                    filename=key,
+                    original_filename=secure_filename(os.path.basename(name)),
+                    content_hash=stream.sha256,
+                    perceptual_hash=perceptual_hash,
+                    image_format=fmt,
+                    width=width,
+                    height=height,
+                    file_size=stream.size,
+                )
+                for key, (name, stream, fmt, width, height, perceptual_hash) in zip(keys, prepared)
+            ]
+            db.session.add_all(images)
+            try:
+                db.session.commit()
+                break
+            except IntegrityError:
+                # 同じ内容の実体を別プロセスが先に登録した: 読み直してやり直す
+                db.session.rollback()
+                if attempt:
+                    raise
+        place_blobs(upload_dir, [(key, stream.commit) for key, (_n, stream, *_rest) in zip(keys, prepared)])
+    finally:
+        for _name, stream, *_rest in prepared:
+            stream.close()
+    return images, rejected
+
+def compute_perceptual_hash(path):
+    """類似画像検出用の知覚ハッシュ（16進）。計算できなければ None"""
+    try:
+        return hash_to_hex(dhash(path))
+    except Exception as e:
+        current_app.logger.warning(f"知覚ハッシュの計算に失敗: {os.path.basename(path)}: {e}")
+        return None
+
+def find_near_duplicates(user_image):
+    """知覚ハッシュが近い有効な画像を近い順に返し、同じユーザーの最も近い画像を duplicate_of_id に設定する
+
+    索引に自身も登録する（コミットは呼び出し側）。距離の上限は DETECTOR_NEAR_DUPLICATE_DISTANCE（0で無効）。
+    索引は DETECTOR_NEAR_DUPLICATE_REFRESH 秒ごとに DB から作り直し、候補は DB で有効なものに絞る。
+
+    Returns:
+        list: [(距離, 画像ID, ユーザーID), ...]
+    """
+    max_distance = current_app.config.get('DETECTOR_NEAR_DUPLICATE_DISTANCE', 5)
+    if not user_image.perceptual_hash or max_distance <= 0:
+        return []
+    index = refresh_index(get_near_duplicate_index(current_app),
+                          max_age=current_app.config.get('DETECTOR_NEAR_DUPLICATE_REFRESH', 300) or None)
+    value = hex_to_hash(user_image.perceptual_hash)
+    matches = index.query(value, max_distance, exclude=user_image.id)
+    if matches:
+        # 他プロセスで削除・無効化された画像は候補から除き、索引からも外す
+        active = {image_id for (image_id,) in db.session.query(UserImage.id).filter(
+            UserImage.id.in_([image_id for _distance, image_id, _owner in matches]),
+            UserImage.is_active == True,  # noqa: E712
+        )}
+        for _distance, image_id, _owner in matches:
+            if image_id not in active:
+                index.remove(image_id)
+        matches = [match for match in matches if match[1] in active]
+    index.add(user_image.id, value, user_image.user_id)
+    own = [image_id for _distance, image_id, owner in matches if owner == user_image.user_id and image_id < user_image.id]
+    if own:
+        user_image.update_columns(duplicate_of_id=own[0])
+    return matches
+
+def reuse_near_duplicate_results(user_image, matches):
+    """ほぼ重複の画像に現在のモデル指紋の検知結果があれば、座標を拡縮して保存する
+
+    再利用元は同じユーザーの画像に限る。知覚ハッシュが近いだけの他ユーザーの画像は
+    別の画像でありうるため、内容ハッシュが一致する（同じ内容の）場合だけ再利用する。
+
+    Returns:
+        dict: 保存したペイロード。再利用できなければ None
+    """
+    if not matches or not user_image.width or not user_image.height:
+        return None
+    model_id = default_model_id()
+    fingerprint = model_fingerprint(model_id)
+    if fingerprint is None:
+        return None
+    candidates = [image_id for _distance, image_id, _owner in matches]
+    same_source = UserImage.user_id == user_image.user_id
+    if user_image.content_hash:
+        same_source = or_(same_source, UserImage.content_hash == user_image.content_hash)
+    rows = DetectionResult.query.join(UserImage, DetectionResult.image_id == UserImage.id).filter(
+        DetectionResult.image_id.in_(candidates),
+        DetectionResult.model == model_id,
+        DetectionResult.model_fingerprint == fingerprint,
+        UserImage.is_active == True,  # noqa: E712
+        same_source,
+    ).all()
+    if not rows:
+        return None
+    # 最も近い画像の結果を使う
+    row = min(rows, key=lambda r: candidates.index(r.image_id))
+    source = row.image
+    if not source.width or not source.height:
+        return None
+    sx = user_image.width / source.width
+    sy = user_image.height / source.height
+    results = []
+    for d in row.detections:
+        item = d.to_dict()
+        bbox = item['bbox']
+        item['bbox'] = {
+            'x': int(round((bbox['x'] or 0) * sx)),
+            'y': int(round((bbox['y'] or 0) * sy)),
+            'width': int(round((bbox['width'] or 0) * sx)),
+            'height': int(round((bbox['height'] or 0) * sy)),
+        }
+        results.append(item)
+    current_app.logger.info(f"類似画像の検知結果を再利用: image_id={user_image.id} <- {source.id}")
+    return save_detection_results(user_image, results, model_id=model_id)
+
+def generate_unique_filename(original_filename, ext=None):
+    """一意のファイル名を生成（ext 省略時は元のファイル名の拡張子）"""
     # 拡張子を取得
-    ext = ''
-    if '.' in original_filename:
-        ext = '.' + original_filename.rsplit('.', 1)[1].lower()
+    if ext is None:
+        ext = ''
+        if '.' in original_filename:
+            ext = '.' + original_filename.rsplit('.', 1)[1].lower()
     
     # タイムスタンプ + UUID + 拡張子で一意のファイル名を生成
     timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -73,23 +743,64 @@ def generate_unique_filename(original_filename):
 def uploaded_file(filename):
     """Serve uploaded images if they belong to the current user.
 
-    Accepts either plain filename (e.g., 'abc.jpg') or a path like 'uploads/abc.jpg'.
+    Accepts a stored filename ('abc.jpg' or a content-addressed key 'ab/cd/abcd....jpg')
+    optionally prefixed with 'uploads/'.
     """
-    # Normalize to basename to avoid subdir traversal and support 'uploads/foo.jpg'
-    base_name = os.path.basename(filename)
+    # Strip the legacy 'uploads/' prefix; the DB lookup below only matches stored names,
+    # so arbitrary subpaths (and '..') never reach the filesystem
+    name = filename[len('uploads/'):] if filename.startswith('uploads/') else filename
+    if '..' in name.split('/'):
+        return ('Not Found', 404)
 
-    # Ensure the requested file belongs to current user
+    # Ensure the requested file belongs to current user (cached briefly per user)
+    ownership = get_ownership_cache(current_app)
+    owned = ownership.get(current_user.id, name)
+    if owned is None:
+        img = UserImage.query.filter_by(
+            filename=name,
+            user_id=current_user.id,
+            is_active=True
+        ).first()
+        if not img:
+            # Avoid leaking existence information
+            return ('Not Found', 404)
+        owned = (img.id, img.content_hash)
+        ownership.put(current_user.id, name, *owned)
+
+    # Content-addressed files never change, so the content hash is a strong ETag
+    upload_dir = current_app.config['DETECTOR_UPLOAD_FOLDER']
+    try:
+        return send_image(upload_dir, name, etag=owned[1],
+                          max_age=current_app.config.get('DETECTOR_IMAGE_MAX_AGE', 31536000))
+    except NotFound:
+        ownership.invalidate(current_user.id, name)
+        raise
+
+@detector_bp.route('/thumbs/<int:image_id>/<variant>')
+@login_required
+def thumbnail(image_id, variant):
+    """ギャラリー用サムネイルを配信（未生成なら初回に生成し、長期キャッシュさせる）"""
+    if variant not in THUMB_VARIANTS:
+        return ('Not Found', 404)
     img = UserImage.query.filter_by(
-        filename=base_name,
+        id=image_id,
         user_id=current_user.id,
         is_active=True
     ).first()
     if not img:
-        # Avoid leaking existence information
         return ('Not Found', 404)
-
-    upload_dir = current_app.config['DETECTOR_UPLOAD_FOLDER']
-    return send_from_directory(upload_dir, base_name)
+    source_path = os.path.join(current_app.config['DETECTOR_UPLOAD_FOLDER'], img.filename)
+    if not os.path.exists(source_path):
+        return ('Not Found', 404)
+    thumb_dir = ensure_thumb_dir()
+    try:
+        path = ensure_thumbnail(source_path, thumb_dir, img.filename, variant,
+                                size=current_app.config.get('DETECTOR_THUMB_SIZE', 320))
+    except Exception as e:
+        current_app.logger.warning(f"サムネイル生成に失敗: {img.filename}: {e}")
+        return ('Not Found', 404)
+    # 画像ファイル名は一意かつ不変のため、URL単位で長期キャッシュしてよい（ユーザー専用なのでprivate）
+    return send_image(thumb_dir, os.path.relpath(path, thumb_dir), max_age=31536000)
 
 # Reference repo compatibility aliases (no external file changes)
 @detector_bp.route('/image/<path:filename>')
@@ -114,17 +825,10 @@ def upload_image():
 @detector_bp.route('/')
 @login_required
 def index():
-    """物体検知のトップページ"""
-    images = UserImage.query.filter_by(
-        user_id=current_user.id,
-        is_active=True
-    ).order_by(UserImage.uploaded_at.desc()).all()
+    """物体検知のトップページ（最近の画像は先頭1ページ分のみ）"""
+    images, _next_cursor = paginate_user_images(current_user.id)
     # 検知メタ情報
-    results_meta = {}
-    for img in images:
-        meta = load_detection_results(img.filename)
-        if meta:
-            results_meta[img.id] = {'count': meta.get('count', 0), 'updated_at': meta.get('updated_at')}
+    results_meta = load_results_meta(current_user.id, image_ids=[img.id for img in images])
     return render_template('detector/index.html', images=images, count=len(images), results_meta=results_meta)
 
 @detector_bp.route('/upload', methods=['GET', 'POST'])
@@ -146,17 +850,21 @@ def upload():
         
         if file and allowed_file(file.filename):
             try:
-                # ディレクトリの確保
-                upload_dir = ensure_upload_dirs()
-                
-                # 一意のファイル名を生成
-                original_filename = secure_filename(file.filename)
-                unique_filename = generate_unique_filename(original_filename)
-                
-                # ファイル保存
-                filepath = os.path.join(upload_dir, unique_filename)
-                file.save(filepath)
-                
+                # 内容を検証（マジックバイト・画像サイズ）して保存。ハッシュは受信中に計算済み
+                stored = store_uploaded_file(file)
+            except UploadRejected as e:
+                current_app.logger.warning(f"アップロードを拒否: {file.filename}: {e}")
+                flash('画像ファイルとして読み込めませんでした。PNG、JPG、JPEG、GIF、BMP、WEBPファイルをアップロードしてください。', 'error')
+                return redirect(request.url)
+            except Exception as e:
+                current_app.logger.error(f"画像アップロードエラー: {e}")
+                flash('画像のアップロードに失敗しました', 'error')
+                return redirect(request.url)
+
+            try:
+                unique_filename = stored['filename']
+                original_filename = stored['original_filename']
+
                 # 相対パスを生成（Web表示用）
                 relative_path = f"uploads/{unique_filename}"
                 
@@ -164,8 +872,7 @@ def upload():
                 user_image = UserImage(
                     user_id=current_user.id,
                     image_path=relative_path,
-                    filename=unique_filename,
-                    original_filename=original_filename
+                    **stored
                 )
                 
                 db.session.add(user_image)
@@ -173,6 +880,19 @@ def upload():
                 
                 current_app.logger.info(f"画像をアップロードしました: {unique_filename} (ユーザー: {current_user.username})")
                 flash(f'画像をアップロードしました: {original_filename}', 'success')
+
+                # ほぼ重複の画像に最新モデルの結果があれば再利用し、なければバックグラウンドで検知
+                reused = None
+                try:
+                    matches = find_near_duplicates(user_image)
+                    if user_image.duplicate_of_id:
+                        db.session.commit()
+                    reused = reuse_near_duplicate_results(user_image, matches)
+                except Exception as e:
+                    db.session.rollback()
+                    current_app.logger.warning(f"類似画像の検索に失敗（スキップ）: image_id={user_image.id}: {e}")
+                if reused is None:
+                    enqueue_detection(user_image)
                 
                 # 物体検知実行ページにリダイレクト
                 target = url_for('detector.detect', image_id=user_image.id)
@@ -180,7 +900,13 @@ def upload():
                 return redirect(target)
                 
             except Exception as e:
+                db.session.rollback()
                 current_app.logger.error(f"画像アップロードエラー: {e}")
+                try:
+                    # 確保した参照を戻す（他に参照がなければ実体も削除される）
+                    release_blob(ensure_upload_dirs(), stored['content_hash'])
+                except Exception:
+                    db.session.rollback()
                 flash('画像のアップロードに失敗しました', 'error')
                 return redirect(request.url)
         else:
@@ -212,51 +938,56 @@ def detect(image_id):
         return redirect(url_for('detector.upload'))
     
     # 保存済み結果を取得
-    saved = load_detection_results(user_image.filename)
+    saved = load_detection_results(user_image)
 
-    # POST時は再検知して保存後、PRGで同ページへ
+    # POST時は再検知ジョブを登録し、PRGで同ページへ
     if request.method == 'POST':
         current_app.logger.info(f'detector.detect: POST received for image_id={image_id}')
-        detection_results = simulate_object_detection(user_image.filename)
-        saved = save_detection_results(user_image.filename, detection_results)
-        flash('物体検知を実行しました。', 'success')
-        target = url_for('detector.detect', image_id=image_id)
-        current_app.logger.info(f'detector.detect: redirect -> {target}')
-        return redirect(target)
-
-    # GET時: 未保存であれば初回検知を実行
-    if not saved:
-        detection_results = simulate_object_detection(user_image.filename)
-        saved = save_detection_results(user_image.filename, detection_results)
+        try:
+            model_id = resolve_model_id(request.form.get('model'))
+        except ValueError as e:
+            flash(str(e), 'warning')
+            return redirect(url_for('detector.detect', image_id=image_id))
+        jobs = detection_job_queue()
+        per_user = current_app.config.get('DETECTOR_ADMISSION_MAX_PER_USER', 2)
+        if per_user and jobs.find_active(user_image.id) is None and jobs.pending(current_user.id) >= per_user:
+            # 同じユーザーの未完了ジョブが多い（連打など）: 登録せずに 429
+            rejected = AdmissionRejected(429, 'user_limit', jobs.estimated_wait())
+        elif enqueue_detection(user_image, model_id=model_id) is None:
+            rejected = AdmissionRejected(503, 'queue_full', jobs.estimated_wait())
+        else:
+            flash('物体検知を開始しました。', 'success')
+            target = url_for('detector.detect', image_id=image_id)
+            current_app.logger.info(f'detector.detect: redirect -> {target}')
+            return redirect(target)
+        # 断った場合はリダイレクトせず、ステータスと Retry-After を付けてページを返す
+        flash(admission_error_message(rejected), 'warning')
+
+    # 実行中（または未保存なら新規登録した）ジョブ。完了までテンプレート側でポーリングする
+    job = detection_job_queue().find_active(user_image.id)
+    if not saved and job is None and request.method == 'GET':
+        job = enqueue_detection(user_image)
 
-    return render_template(
+    html = render_template(
         'detector/detect.html',
         user_image=user_image,
+        job=job.to_dict() if job else None,
         results=saved.get('results', []) if saved else [],
         detected_at=saved.get('updated_at') if saved else None,
-        detection_count=saved.get('count', 0) if saved else 0
+        detection_count=saved.get('count', 0) if saved else 0,
+        detected_model=saved.get('model') if saved else None,
+        models=available_models()
     )
+    if request.method == 'POST':
+        return html, rejected.status, {'Retry-After': str(rejected.retry_after)}
+    return html
 
 @detector_bp.route('/gallery')
 @login_required
 def gallery():
-    """画像ギャラリー（ユーザー別）"""
+    """画像ギャラリー（ユーザー別）。一覧本体は gallery_partial からページ単位で読み込む"""
     try:
-        # 現在のユーザーの画像のみ取得
-        images = UserImage.query.filter_by(
-            user_id=current_user.id,
-            is_active=True
-        ).order_by(UserImage.uploaded_at.desc()).all()
-        # 検知メタ
-        results_meta = {}
-        for img in images:
-            meta = load_detection_results(img.filename)
-            if meta:
-                results_meta[img.id] = {'count': meta.get('count', 0), 'updated_at': meta.get('updated_at')}
-        return render_template('detector/gallery.html', 
-                               images=images, 
-                               count=len(images),
-                               results_meta=results_meta)
+        return render_template('detector/gallery.html', class_counts=user_class_counts(current_user.id))
     except Exception as e:
         current_app.logger.error(f"ギャラリー表示エラー: {e}")
         flash('ギャラリーの表示に失敗しました', 'error')
@@ -282,9 +1013,20 @@ def api_detect():
     if not user_image:
         return jsonify({'success': False, 'error': '指定された画像が見つかりません'}), 404
     
-    # 物体検知実行（仮実装）+ 保存
-    results = simulate_object_detection(user_image.filename)
-    saved = save_detection_results(user_image.filename, results)
+    try:
+        model_id = resolve_model_id(data.get('model'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'models': available_models()}), 400
+
+    # 物体検知実行 + 保存（tiled=true でタイル分割推論）。同時実行数を超える分は待たせるか断る。
+    # 同じ画像・モデルの検知が実行中ならその結果を共有する（実行枠は使わない）
+    tiled = bool(data.get('tiled'))
+    timer = StageTimer()
+    try:
+        saved, shared = detect_and_save_once(user_image, model_id, tiled=tiled, timer=timer,
+                                             slot=admission_slot(current_user.id, timer))
+    except AdmissionRejected as e:
+        return rejected_response(admission_error_message(e), e.retry_after, e.status)
 
     return jsonify({
         'success': True,
@@ -292,9 +1034,51 @@ def api_detect():
         'filename': user_image.original_filename,
         'results': saved.get('results', []),
         'detection_count': saved.get('count', 0),
-        'updated_at': saved.get('updated_at')
+        'updated_at': saved.get('updated_at'),
+        'model': saved.get('model'),
+        'tiled': tiled,
+        'shared': shared,
+        'timings': saved.get('timings')
     })
 
+@detector_bp.route('/api/upload/bulk', methods=['POST'])
+@login_required
+def api_upload_bulk():
+    """一括アップロードAPI（ZIP または複数ファイル）
+
+    ``files``（複数可）に画像または ZIP を指定する。保存後すぐに 202 を返し、
+    検知はバックグラウンドで進む（進捗は progress_url）。
+    """
+    try:
+        model_id = resolve_model_id(request.form.get('model'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'models': available_models()}), 400
+    files = request.files.getlist('files') + request.files.getlist('archive')
+    if not any(f.filename for f in files):
+        return jsonify({'success': False, 'error': 'ファイルが選択されていません'}), 400
+    try:
+        images, rejected = store_bulk_files(current_user.id, files)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"一括アップロードエラー: {e}")
+        return jsonify({'success': False, 'error': '画像のアップロードに失敗しました'}), 500
+    current_app.logger.info(f"一括アップロード: {len(images)} 件保存 / {len(rejected)} 件拒否 (ユーザー: {current_user.username})")
+    upload = bulk_upload_tracker().start(current_user.id, [img.id for img in images], rejected, model_id)
+    return jsonify({
+        'success': True,
+        **upload.to_dict(),
+        'progress_url': url_for('detector.api_bulk_status', bulk_id=upload.id),
+    }), 202
+
+@detector_bp.route('/api/upload/bulk/<bulk_id>')
+@login_required
+def api_bulk_status(bulk_id: str):
+    """一括アップロードの進捗取得API"""
+    upload = bulk_upload_tracker().get(bulk_id)
+    if upload is None or upload.user_id != current_user.id:
+        return jsonify({'success': False, 'error': '一括アップロードが見つかりません'}), 404
+    return jsonify({'success': True, **upload.to_dict()})
+
 @detector_bp.route('/api/results/<int:image_id>')
 @login_required
 def api_get_results(image_id: int):
@@ -307,41 +1091,228 @@ def api_get_results(image_id: int):
     if not user_image:
         return jsonify({'success': False, 'error': '画像が見つかりません'}), 404
 
-    saved = load_detection_results(user_image.filename)
+    saved = load_detection_results(user_image)
     if not saved:
         return jsonify({'success': False, 'error': '検知結果がありません'}), 404
     return jsonify({'success': True, **saved})
 
-_YOLO_MODEL = None  # モデルのシングルトンキャッシュ
+@detector_bp.route('/api/jobs/<job_id>')
+@login_required
+def api_job_status(job_id: str):
+    """検知ジョブの状態取得API（detect.html からポーリング）"""
+    job = detection_job_queue().get(job_id)
+    if not job or job.user_id != current_user.id:
+        return jsonify({'success': False, 'error': 'ジョブが見つかりません'}), 404
+    return jsonify({'success': True, **job.to_dict(), 'queue_depth': detection_job_queue().depth()})
+
+# 推論パラメータ（Ultralytics の既定値を明示。キャッシュキーにも含める）
+_INFERENCE_PARAMS = {'imgsz': 640, 'conf': 0.25, 'iou': 0.7}
+
+def default_model_id():
+    """既定の検知モデルID"""
+    return current_app.config.get('DETECTOR_DEFAULT_MODEL') or 'yolov8n'
 
-def _get_yolo_model():
-    """Ultralytics YOLOv8 モデルを遅延ロードし、プロセス内で再利用"""
-    global _YOLO_MODEL
-    if _YOLO_MODEL is not None:
-        return _YOLO_MODEL
+def available_models():
+    """選択可能なモデルID一覧（DETECTOR_MODELS。既定モデルは常に含む）"""
+    ids = [m.strip() for m in str(current_app.config.get('DETECTOR_MODELS') or '').split(',') if m.strip()]
+    default = default_model_id()
+    if default not in ids:
+        ids.insert(0, default)
+    return ids
+
+def resolve_model_id(requested=None):
+    """要求されたモデルIDを検証して返す（未指定は既定モデル、未登録は ValueError）"""
+    if not requested:
+        return default_model_id()
+    if requested not in available_models():
+        raise ValueError(f'利用できないモデルです: {requested}')
+    return requested
+
+def _yolo_weights_path(model_id=None):
+    """学習済み重み（<model_id>.pt）のパスを解決"""
+    name = f"{model_id or default_model_id()}.pt"
+    # モデルディレクトリ → プロジェクト直下 → カレントディレクトリの順に探す
+    for base in (current_app.config.get('DETECTOR_MODEL_DIR'), current_app.root_path, os.getcwd()):
+        if base:
+            path = os.path.abspath(os.path.join(base, name))
+            if os.path.exists(path):
+                return path
+    # 見つからなければ名前のみ（Ultralytics が公式重みを取得する）
+    return name
+
+def _yolo_model_identity(model_id=None):
+    """キャッシュキー用のモデル識別子（重みファイル名 + サイズ）"""
+    weights_path = _yolo_weights_path(model_id)
+    try:
+        return f"{os.path.basename(weights_path)}:{os.path.getsize(weights_path)}"
+    except OSError:
+        return os.path.basename(weights_path)
+
+_WEIGHTS_HASHES = {}  # (path, size, mtime) -> sha256
+_WEIGHTS_HASH_LOCK = threading.Lock()
+
+def _weights_sha256(model_id=None):
+    """重みファイルのSHA-256（サイズ・更新時刻が変わらない限り再計算しない）。ファイルがなければ None"""
+    weights_path = _yolo_weights_path(model_id)
+    try:
+        st = os.stat(weights_path)
+    except OSError:
+        return None
+    key = (os.path.abspath(weights_path), st.st_size, st.st_mtime_ns)
+    with _WEIGHTS_HASH_LOCK:
+        digest = _WEIGHTS_HASHES.get(key)
+    if digest is None:
+        digest = file_sha256(weights_path)
+        with _WEIGHTS_HASH_LOCK:
+            _WEIGHTS_HASHES[key] = digest
+    return digest
+
+def model_fingerprint(model_id=None, tiled=False):
+    """検知結果の再現性を表す指紋（モデルID + 重みハッシュ + 推論パラメータ、16進16桁）
+
+    重みの更新や推論パラメータの変更で値が変わるため、保存済み結果が古いかどうかの
+    判定に使う。重みファイルが見つからない場合は None。
+    """
+    model_id = model_id or default_model_id()
+    weights = _weights_sha256(model_id)
+    if weights is None:
+        return None
+    raw = json.dumps([model_id, weights, _inference_params(tiled)], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+def _load_yolo_model(model_id):
+    """Ultralytics YOLOv8 モデルをロード（モデルレジストリのローダー）。失敗時は None"""
+    # torch の import 前にスレッド数・コア予算を適用（プロセスごとに1回）
+    apply_inference_thread_settings(current_app.config, current_app.logger)
     try:
         from ultralytics import YOLO
     except Exception as e:
         current_app.logger.warning(f"Ultralyticsの読み込みに失敗: {e}")
         return None
 
-    # プロジェクト直下の学習済み重みを参照（yolov8n.pt）
-    weights_path = os.path.join(current_app.root_path, 'yolov8n.pt')
-    if not os.path.exists(weights_path):
-        # カレントディレクトリ直下のケースも試す
-        alt_path = os.path.abspath(os.path.join(os.getcwd(), 'yolov8n.pt'))
-        weights_path = alt_path if os.path.exists(alt_path) else 'yolov8n.pt'
+    weights_path = _yolo_weights_path(model_id)
     try:
-        _YOLO_MODEL = YOLO(weights_path)
-        return _YOLO_MODEL
+        return YOLO(weights_path)
     except Exception as e:
-        current_app.logger.error(f"YOLOv8モデルの初期化に失敗: {e}")
+        current_app.logger.error(f"YOLOv8モデルの初期化に失敗 ({model_id}): {e}")
         return None
 
-def real_object_detection(filename):
-    """実際の物体検知実装（Ultralytics YOLOv8 使用、CPU推論）"""
+def _make_yolo_batcher(model):
+    """モデルの前段に置くバッチディスパッチャを作成"""
+    return BatchPredictor(
+        lambda images: model.predict(images, verbose=False, **_INFERENCE_PARAMS),
+        max_batch_size=current_app.config.get('DETECTOR_BATCH_MAX_SIZE', 8),
+        max_wait=current_app.config.get('DETECTOR_BATCH_MAX_WAIT_MS', 20) / 1000.0,
+    )
+
+def model_registry():
+    """アプリ単位の検知モデルレジストリ（要求時ロード + LRU 解放）"""
+    return get_model_registry(current_app._get_current_object(), _load_yolo_model, _make_yolo_batcher)
+
+def _get_yolo_model(model_id=None):
+    """検知モデルを取得（未ロードならロード）。利用できない場合は None"""
+    entry = model_registry().get(model_id or default_model_id())
+    return entry.model if entry is not None else None
+
+def _get_yolo_batcher(model_id=None):
+    """検知モデルのバッチディスパッチャを取得（モデル未ロード時は None）"""
+    entry = model_registry().get(model_id or default_model_id())
+    return entry.batcher if entry is not None else None
+
+def warmup_detector_model():
+    """モデルをロードし、ダミー画像で1回推論して初回推論の遅延を前倒しする"""
+    from PIL import Image
+    batcher = _get_yolo_batcher()
+    if batcher is None:
+        raise RuntimeError('YOLOv8モデルを利用できません')
+    size = _INFERENCE_PARAMS.get('imgsz', 640)
+    batcher.predict(Image.new('RGB', (size, size)))
+
+def _result_arrays(result):
+    """推論結果1件から (xyxy, conf, cls) の numpy 配列を取り出す（検出なしは空配列）"""
+    import numpy as np
+    boxes = getattr(result, 'boxes', None) if result is not None else None
+    if boxes is None or len(boxes) == 0:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=int)
+    try:
+        xyxy = boxes.xyxy.cpu().numpy()
+        conf = boxes.conf.cpu().numpy()
+        cls = boxes.cls.cpu().numpy().astype(int)
+    except Exception:
+        # CPUテンソルではない、または属性が存在しない場合のフォールバック
+        xyxy = np.array(boxes.xyxy)
+        conf = np.array(boxes.conf)
+        cls = np.array(boxes.cls, dtype=int)
+    return xyxy, conf, cls
+
+_CLASS_NAME_TABLE = (None, None)  # (names, 参照表) の1件キャッシュ
+
+def _class_name_table(names):
+    """クラスID → クラス名の参照表（numpy object 配列）。names は dict / list 形式"""
+    import numpy as np
+    global _CLASS_NAME_TABLE
+    cached_names, table = _CLASS_NAME_TABLE
+    if cached_names is names and table is not None:
+        return table
+    if isinstance(names, dict):
+        ids = [k for k in names if isinstance(k, int) and k >= 0]
+        table = np.array([str(k) for k in range(max(ids, default=-1) + 1)], dtype=object)
+        for k in ids:
+            table[k] = names[k]
+    elif isinstance(names, (list, tuple)):
+        table = np.array(list(names), dtype=object)
+    else:
+        table = np.array([], dtype=object)
+    # names への参照を保持するので、同一性比較で取り違えることはない
+    _CLASS_NAME_TABLE = (names, table)
+    return table
+
+def build_detections(xyxy, conf, cls, names):
+    """(xyxy, conf, cls) 配列を保存形式の検出リストに変換
+
+    クリップ・幅高さ・丸め・クラス名の割り当てを配列演算でまとめて行い、
+    Python 側では tolist() 済みの値から辞書を組み立てるだけにする。
+    """
+    import numpy as np
+    boxes = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+    n = len(boxes)
+    if n == 0:
+        return []
+    # conf / cls が短い場合は 0.0 / -1 で補う（従来の挙動）
+    conf_arr = np.zeros(n, dtype=np.float64)
+    c = np.asarray(conf, dtype=np.float64).reshape(-1)[:n]
+    conf_arr[:len(c)] = c
+    cls_arr = np.full(n, -1, dtype=np.int64)
+    k = np.asarray(cls).reshape(-1)[:n].astype(np.int64)
+    cls_arr[:len(k)] = k
+
+    table = _class_name_table(names)
+    known = (cls_arr >= 0) & (cls_arr < len(table))
+    labels = np.empty(n, dtype=object)
+    labels[known] = table[cls_arr[known]]
+    if not known.all():
+        labels[~known] = [str(v) for v in cls_arr[~known].tolist()]
+
+    # int() と同じく0方向への切り捨て（クリップ後は非負なので floor と同じ）
+    xs = np.trunc(np.clip(boxes[:, 0], 0, None)).astype(np.int64).tolist()
+    ys = np.trunc(np.clip(boxes[:, 1], 0, None)).astype(np.int64).tolist()
+    ws = np.trunc(np.clip(boxes[:, 2] - boxes[:, 0], 0, None)).astype(np.int64).tolist()
+    hs = np.trunc(np.clip(boxes[:, 3] - boxes[:, 1], 0, None)).astype(np.int64).tolist()
+    confs = np.round(conf_arr, 2).tolist()
+
+    return [
+        {'class': label, 'confidence': cf, 'bbox': {'x': x, 'y': y, 'width': w, 'height': h}}
+        for label, cf, x, y, w, h in zip(labels.tolist(), confs, xs, ys, ws, hs)
+    ]
+
+def real_object_detection(filename, cache_key=None, tiled=False, timer=None, model_id=None):
+    """実際の物体検知実装（Ultralytics YOLOv8 使用、CPU推論）
+
+    cache_key を指定した場合、推論に成功した結果のみ検知結果キャッシュへ保存する。
+    tiled=True では重なり付きタイル分割で推論する（高解像度画像の小物体向け）。
+    timer（StageTimer）には file_io / decode / preprocess / inference / postprocess を記録する。
+    """
     try:
-        import numpy as np
         from PIL import Image
         # 画像パス
         upload_dir = ensure_upload_dirs()
@@ -350,61 +1321,107 @@ def real_object_detection(filename):
             current_app.logger.error(f"画像ファイルが見つかりません: {image_path}")
             return []
 
-        model = _get_yolo_model()
-        if model is None:
+        with span(timer, 'model_load'):
+            entry = model_registry().get(model_id or default_model_id())
+        model = entry.model if entry is not None else None
+        batcher = entry.batcher if entry is not None else None
+        if model is None or batcher is None:
             return simulate_object_detection_fallback(filename)
 
-        # PILで読み込み（ultralyticsはパスでも可だが、将来の前処理のため読み込む）
-        img = Image.open(image_path).convert('RGB')
+        # namesは辞書 or list 形式
+        names = getattr(model, 'names', None) or {}
 
-        # 推論（速度重視のためデフォルト設定、CPU）
-        results = model.predict(img, verbose=False)
-        if not results:
-            return []
-        r0 = results[0]
+        if tiled:
+            # 全タイル + 縮小全体画像を1回のバッチ要求として推論し、NMSで統合
+            xyxy, conf, cls = tiled_inference(
+                image_path,
+                batcher.predict_many,
+                _result_arrays,
+                tile=current_app.config.get('DETECTOR_TILE_SIZE', 640),
+                overlap=current_app.config.get('DETECTOR_TILE_OVERLAP', 0.2),
+                max_side=current_app.config.get('DETECTOR_TILE_MAX_SIDE', 4096),
+                imgsz=_INFERENCE_PARAMS.get('imgsz', 640),
+                timer=timer,
+            )
+        else:
+            # ファイル読込とデコードを分けて計測するため、先にバイト列として読む
+            with span(timer, 'file_io'):
+                with open(image_path, 'rb') as f:
+                    data = io.BytesIO(f.read())
+            # 縮小デコード + レターボックス（原寸展開を避ける）。無効時は従来どおり原寸で渡す
+            letterbox_meta = None
+            if current_app.config.get('DETECTOR_PREPROCESS_DOWNSCALE', True):
+                imgsz = _INFERENCE_PARAMS.get('imgsz', 640)
+                with span(timer, 'decode'):
+                    img, orig_size = decode_reduced(data, imgsz)
+                with span(timer, 'preprocess'):
+                    img, letterbox_meta = letterbox(img, orig_size, imgsz)
+            else:
+                with span(timer, 'decode'):
+                    img = Image.open(data).convert('RGB')
 
-        detections = []
-        # namesは辞書 or list 形式
-        names = getattr(model, 'names', None) or getattr(r0, 'names', None) or {}
+            # 推論（他の要求とバッチにまとめて実行、CPU）
+            with span(timer, 'inference'):
+                r0 = batcher.predict(img)
+            if r0 is None:
+                return []
+            names = names or getattr(r0, 'names', None) or {}
 
-        # r0.boxes: xyxy, conf, cls
-        boxes = getattr(r0, 'boxes', None)
-        if boxes is None or len(boxes) == 0:
-            return []
+            # r0.boxes: xyxy, conf, cls
+            with span(timer, 'postprocess'):
+                xyxy, conf, cls = _result_arrays(r0)
+                if letterbox_meta is not None and len(xyxy):
+                    xyxy = scale_boxes_to_original(xyxy, letterbox_meta)
 
-        try:
-            xyxy = boxes.xyxy.cpu().numpy()
-            conf = boxes.conf.cpu().numpy()
-            cls = boxes.cls.cpu().numpy().astype(int)
-        except Exception:
-            # CPUテンソルではない、または属性が存在しない場合のフォールバック
-            xyxy = np.array(boxes.xyxy)
-            conf = np.array(boxes.conf)
-            cls = np.array(boxes.cls, dtype=int)
-
-        for i in range(len(xyxy)):
-            x1, y1, x2, y2 = xyxy[i]
-            c = float(conf[i]) if i < len(conf) else 0.0
-            k = int(cls[i]) if i < len(cls) else -1
-            label = names.get(k, str(k)) if isinstance(names, dict) else (names[k] if isinstance(names, (list, tuple)) and 0 <= k < len(names) else str(k))
-            detections.append({
-                'class': label,
-                'confidence': round(c, 2),
-                'bbox': {
-                    'x': int(max(0, x1)),
-                    'y': int(max(0, y1)),
-                    'width': int(max(0, x2 - x1)),
-                    'height': int(max(0, y2 - y1))
-                }
-            })
-
-        current_app.logger.info(f"物体検知完了: {len(detections)}個のオブジェクトを検出 (YOLOv8)")
+        with span(timer, 'postprocess'):
+            detections = build_detections(xyxy, conf, cls, names) if len(xyxy) else []
+
+        if detections:
+            current_app.logger.info(f"物体検知完了: {len(detections)}個のオブジェクトを検出 (YOLOv8)")
+        cache = get_detection_cache(current_app)
+        if cache_key and cache is not None:
+            try:
+                with span(timer, 'cache'):
+                    cache.put(cache_key, detections)
+            except OSError as ce:
+                current_app.logger.warning(f"検知結果キャッシュの保存に失敗: {ce}")
         return detections
 
     except Exception as e:
         current_app.logger.error(f"物体検知エラー (YOLOv8): {e}")
         return simulate_object_detection_fallback(filename)
 
+def detect_frames(frames, model_id=None, label='video'):
+    """動画フレームをまとめて推論し、フレームごとの検出リストを返す
+
+    Args:
+        frames: [(RGB画像, 元サイズ), ...]。画像は縮小済みでよい（検出枠は元サイズの座標で返す）
+        label: フォールバック時のログ用の名前
+    """
+    entry = model_registry().get(model_id or default_model_id())
+    if entry is None or entry.model is None or entry.batcher is None:
+        return [list(simulate_object_detection_fallback(label)) for _ in frames]
+    imgsz = _INFERENCE_PARAMS.get('imgsz', 640)
+    boxed = [letterbox(image, orig_size, imgsz) for image, orig_size in frames]
+    # 1回の要求として登録し、他の要求と合わせて最大バッチ件数ずつ推論される
+    outputs = entry.batcher.predict_many([image for image, _meta in boxed])
+    names = getattr(entry.model, 'names', None) or {}
+    detections = []
+    for result, (_image, meta) in zip(outputs, boxed):
+        if result is None:
+            detections.append([])
+            continue
+        xyxy, conf, cls = _result_arrays(result)
+        if not len(xyxy):
+            detections.append([])
+            continue
+        xyxy = scale_boxes_to_original(xyxy, meta)
+        detections.append(build_detections(xyxy, conf, cls, names or getattr(result, 'names', None) or {}))
+    return detections
+
+class FallbackResults(list):
+    """シミュレーションによる検知結果（モデル指紋を付けず、再検知の対象に残す）"""
+
 def simulate_object_detection_fallback(filename):
     """
     フォールバック用のシミュレーション（実際のAIが使えない場合）
@@ -438,12 +1455,48 @@ def simulate_object_detection_fallback(filename):
             }
         })
     
-    return results
+    return FallbackResults(results)
+
+def _inference_params(tiled=False):
+    """キャッシュキー・結果記録用の推論パラメータ一式"""
+    params = dict(_INFERENCE_PARAMS, downscale=bool(current_app.config.get('DETECTOR_PREPROCESS_DOWNSCALE', True)))
+    if tiled:
+        params['tile'] = [
+            current_app.config.get('DETECTOR_TILE_SIZE', 640),
+            current_app.config.get('DETECTOR_TILE_OVERLAP', 0.2),
+            current_app.config.get('DETECTOR_TILE_MAX_SIDE', 4096),
+        ]
+    return params
+
+def detection_cache_key(filename, tiled=False, model_id=None, content_hash=None):
+    """画像内容ハッシュ + モデル識別子 + 推論パラメータからキャッシュキーを作成
+
+    content_hash（アップロード時に計算済みの値）があればファイルを読み直さない。
+    """
+    if content_hash is None:
+        image_path = os.path.join(ensure_upload_dirs(), filename)
+        try:
+            content_hash = file_sha256(image_path)
+        except OSError:
+            return None
+    model_key = model_fingerprint(model_id, tiled) or _yolo_model_identity(model_id)
+    return make_cache_key(content_hash, model_key, _inference_params(tiled))
 
 # メイン関数のエイリアス（後方互換性）
-def simulate_object_detection(filename):
-    """物体検知のメイン関数"""
-    return real_object_detection(filename)
+def simulate_object_detection(filename, tiled=False, timer=None, model_id=None, content_hash=None):
+    """物体検知のメイン関数（同一内容の画像はキャッシュ済み結果を返す）"""
+    cache = get_detection_cache(current_app)
+    cache_key = None
+    if cache is not None:
+        with span(timer, 'hash'):
+            cache_key = detection_cache_key(filename, tiled=tiled, model_id=model_id, content_hash=content_hash)
+    if cache_key:
+        with span(timer, 'cache'):
+            cached = cache.get(cache_key)
+        if cached is not None:
+            current_app.logger.info(f"検知結果キャッシュにヒット: {filename}")
+            return cached
+    return real_object_detection(filename, cache_key=cache_key, tiled=tiled, timer=timer, model_id=model_id)
 
 @detector_bp.route('/results')
 @login_required  
@@ -468,24 +1521,41 @@ def delete_image(image_id):
         return redirect(url_for('detector.gallery'))
 
     try:
-        # 物理ファイル削除（存在する場合のみ、失敗しても処理継続）
+        upload_dir = ensure_upload_dirs()
+        thumb_dir = current_app.config['DETECTOR_THUMB_FOLDER']
+        # 付随する検知結果JSONを削除（存在する場合のみ、失敗しても処理継続）
         try:
-            upload_dir = ensure_upload_dirs()
-            file_path = os.path.join(upload_dir, img.filename)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                current_app.logger.info(f"画像ファイルを削除しました: {img.filename}")
-            # 付随する検知結果JSONも削除
-            sidecar = result_json_path(img.filename)
-            if os.path.exists(sidecar):
-                os.remove(sidecar)
-                current_app.logger.info(f"検知結果JSONを削除しました: {os.path.basename(sidecar)}")
+            for sidecar in {result_json_path(img.filename, img.id), result_json_path(img.filename)}:
+                if os.path.exists(sidecar):
+                    os.remove(sidecar)
+                    current_app.logger.info(f"検知結果JSONを削除しました: {os.path.basename(sidecar)}")
         except Exception as fe:
             current_app.logger.warning(f"ファイル削除に失敗しました（スキップ）: {fe}")
 
+        if img.detection_result is not None:
+            result = img.detection_result
+            record_result(result.user_id, result.updated_at, [d.class_name for d in result.detections],
+                          [d.confidence for d in result.detections], sign=-1)
+            db.session.delete(result)
         img.is_active = False
         img.is_deleted = True
-        db.session.commit()
+        get_ownership_cache(current_app).invalidate(img.user_id, img.filename)
+        get_near_duplicate_index(current_app).remove(img.id)
+        if img.content_hash and is_blob_key(img.filename):
+            # 論理削除と参照カウントの減算を同時にコミット。最後の参照なら実体とサムネイルも削除
+            if release_blob(upload_dir, img.content_hash, on_remove=lambda path: remove_thumbnails(thumb_dir, path)):
+                current_app.logger.info(f"画像ファイルを削除しました: {img.filename}")
+        else:
+            db.session.commit()
+            # 旧形式（移行前のフラットなファイル）は画像ごとに実体を持つ
+            try:
+                file_path = os.path.join(upload_dir, img.filename)
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                    current_app.logger.info(f"画像ファイルを削除しました: {img.filename}")
+                remove_thumbnails(thumb_dir, img.filename)
+            except Exception as fe:
+                current_app.logger.warning(f"ファイル削除に失敗しました（スキップ）: {fe}")
         flash('画像を削除しました', 'success')
     except Exception as e:
         current_app.logger.error(f"画像削除エラー: {e}")
@@ -498,28 +1568,226 @@ def delete_image(image_id):
 
 
 def _image_to_item(img: UserImage):
-    """テンプレート用のギャラリーアイテム辞書を作成（サムネは未生成のためNone）"""
+    """テンプレート用のギャラリーアイテム辞書を作成（サムネは初回アクセス時に生成）"""
     return {
         'id': img.id,
         'filename': img.filename,
         'original_filename': img.original_filename,
         'alt': img.original_filename or img.filename,
-        'thumb_webp_url': None,
-        'thumb2x_webp_url': None,
-        'thumb_fallback_jpg': None,
+        'duplicate_of': img.duplicate_of_id,
+        'thumb_webp_url': url_for('detector.thumbnail', image_id=img.id, variant='1x.webp'),
+        'thumb2x_webp_url': url_for('detector.thumbnail', image_id=img.id, variant='2x.webp'),
+        'thumb_fallback_jpg': url_for('detector.thumbnail', image_id=img.id, variant='1x.jpg'),
     }
 
 
 @detector_bp.route('/gallery/partial')
 @login_required
 def gallery_partial():
-    """ギャラリーの部分テンプレート（HTMX用）"""
-    images = UserImage.query.filter_by(
-        user_id=current_user.id,
-        is_active=True
-    ).order_by(UserImage.uploaded_at.desc()).all()
+    """ギャラリーの部分テンプレート（HTMX用）
+
+    ``after`` なしは先頭ページをグリッドごと、``after=<cursor>`` は続きのアイテムと
+    次ページ読み込み用の番兵要素のみを返す（無限スクロール）。
+    """
+    after = request.args.get('after')
+    if after and decode_gallery_cursor(after) is None:
+        return ('Bad Request', 400)
+    try:
+        criteria = parse_class_filter(request.args)
+    except ValueError:
+        return ('Bad Request', 400)
+    images, next_cursor = paginate_user_images(current_user.id, after=after, **criteria)
     items = [_image_to_item(img) for img in images]
-    return render_template('detector/_gallery_grid.html', items=items)
+    # 次ページの読み込みにも同じ絞り込み条件を引き継ぐ
+    filter_args = {}
+    if criteria['classes']:
+        filter_args = {'classes': ','.join(criteria['classes']), 'min_confidence': criteria['min_confidence'],
+                       'match': criteria['match']}
+    template = 'detector/_gallery_page.html' if after else 'detector/_gallery_grid.html'
+    return render_template(template, items=items, next_cursor=next_cursor, filter_args=filter_args)
+
+
+@detector_bp.route('/api/search')
+@login_required
+def api_search():
+    """検知クラスによる画像検索API
+
+    ``classes=dog,person&min_confidence=0.7&match=all`` で絞り込み、新しい順に返す。
+    続きは応答の next_cursor を ``after`` に渡して取得する。
+    """
+    after = request.args.get('after')
+    if after and decode_gallery_cursor(after) is None:
+        return jsonify({'success': False, 'error': 'カーソルが不正です'}), 400
+    try:
+        criteria = parse_class_filter(request.args)
+        limit = min(int(request.args.get('limit') or current_app.config.get('DETECTOR_GALLERY_PAGE_SIZE', 24)), 100)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if not criteria['classes']:
+        return jsonify({'success': False, 'error': 'classes を指定してください'}), 400
+    images, next_cursor = paginate_user_images(current_user.id, after=after, limit=max(1, limit), **criteria)
+    summary = load_class_summary(current_user.id, [img.id for img in images])
+    return jsonify({
+        'success': True,
+        **criteria,
+        'items': [
+            {
+                'image_id': img.id,
+                'original_filename': img.original_filename,
+                'uploaded_at': img.uploaded_at.isoformat(timespec='seconds') + 'Z' if img.uploaded_at else None,
+                'url': url_for('detector.uploaded_file', filename=img.filename),
+                'thumbnail_url': url_for('detector.thumbnail', image_id=img.id, variant='1x.webp'),
+                'classes': summary.get(img.id, {}),
+            }
+            for img in images
+        ],
+        'next_cursor': next_cursor,
+    })
+
+
+@detector_bp.route('/api/classes')
+@login_required
+def api_classes():
+    """ユーザーの画像に写っているクラス一覧（画像数の多い順）"""
+    return jsonify({'success': True, 'classes': user_class_counts(current_user.id)})
+
+
+@detector_bp.route('/analytics')
+@login_required
+def analytics():
+    """検知結果の集計ダッシュボード（クラス頻度・信頼度分布・期間別の検出数）"""
+    try:
+        days, bucket = parse_period(request.args)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('detector.analytics'))
+    return render_template('detector/analytics.html', report=rollup(current_user.id, days, bucket))
+
+
+@detector_bp.route('/api/analytics')
+@login_required
+def api_analytics():
+    """検知結果の集計API（``days=90&bucket=week``。bucket は day / week）"""
+    try:
+        days, bucket = parse_period(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, **rollup(current_user.id, days, bucket)})
+
+
+@detector_bp.route('/video')
+@login_required
+def video():
+    """動画・アニメーションGIFのフレーム検知ページ"""
+    return render_template('detector/video.html', extensions=VIDEO_EXTENSIONS,
+                           stride=current_app.config.get('DETECTOR_VIDEO_FRAME_STRIDE', 5))
+
+
+@detector_bp.route('/api/video', methods=['POST'])
+@login_required
+def api_video_upload():
+    """動画（またはアニメーションGIF）のアップロードAPI
+
+    ``file`` に動画を指定する。保存して動画情報を返すだけで、検知は events_url
+    （Server-Sent Events）への接続時にフレームを読みながら行う。
+    """
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({'success': False, 'error': 'ファイルが選択されていません'}), 400
+    if not is_video(file.filename):
+        return jsonify({'success': False, 'error': '対応していない形式です',
+                        'extensions': list(VIDEO_EXTENSIONS)}), 400
+    video_dir = ensure_video_dir()
+    purge_stale_videos(video_dir, current_app.config.get('DETECTOR_VIDEO_TTL', 3600))
+    video_id, path = new_video_path(video_dir, current_user.id, file.filename)
+    try:
+        file.save(path)
+        meta = probe(path)
+    except VideoUnsupported as e:
+        os.remove(path)
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        if os.path.exists(path):
+            os.remove(path)
+        current_app.logger.error(f"動画アップロードエラー: {e}")
+        return jsonify({'success': False, 'error': '動画のアップロードに失敗しました'}), 500
+    current_app.logger.info(f"動画アップロード: {video_id} {meta} (ユーザー: {current_user.username})")
+    return jsonify({
+        'success': True,
+        'video_id': video_id,
+        'filename': file.filename,
+        **meta,
+        'events_url': url_for('detector.api_video_events', video_id=video_id),
+    }), 201
+
+
+@detector_bp.route('/api/video/<video_id>/events')
+@login_required
+def api_video_events(video_id: str):
+    """動画のフレーム検知結果を Server-Sent Events で返す
+
+    ``stride``（既定 DETECTOR_VIDEO_FRAME_STRIDE）フレームごとに1枚を推論し、
+    推論バッチ単位でフレームごとの frame イベントを送る。完了したら done を送って動画を削除する。
+    再接続時は Last-Event-ID（フレーム番号）の次のフレームから再開する。
+    """
+    path = find_video(ensure_video_dir(), current_user.id, video_id)
+    if path is None:
+        return jsonify({'success': False, 'error': '動画が見つかりません'}), 404
+    try:
+        model_id = resolve_model_id(request.args.get('model'))
+        stride = int(request.args.get('stride') or current_app.config.get('DETECTOR_VIDEO_FRAME_STRIDE', 5))
+        start = int(request.headers.get('Last-Event-ID') or -1) + 1
+        if stride < 1 or start < 0:
+            raise ValueError('stride は1以上で指定してください')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    # ストリームの間は実行枠を1つ持つ（応答を閉じたときに返す）
+    controller = admission_controller()
+    user_id = current_user.id
+    try:
+        started = controller.acquire(user_id)
+    except AdmissionRejected as e:
+        return rejected_response(admission_error_message(e), e.retry_after, e.status)
+    max_frames = current_app.config.get('DETECTOR_VIDEO_MAX_FRAMES', 600)
+    batch_size = current_app.config.get('DETECTOR_BATCH_MAX_SIZE', 8)
+    imgsz = _INFERENCE_PARAMS.get('imgsz', 640)
+    label = os.path.basename(path)
+
+    def generate():
+        frames = detections = 0
+        class_counts = {}
+        try:
+            yield sse_event('meta', {**probe(path), 'stride': stride, 'start': start, 'model': model_id})
+            # 推論に回すのは最大 max_frames 枚。デコード済みフレームはバッチ1つ分だけ保持する
+            sampled = itertools.islice(iter_frames(path, stride, start, max_side=imgsz), max_frames)
+            for batch in batched(sampled, batch_size):
+                results = detect_frames([(image, size) for _index, _time, image, size in batch], model_id, label)
+                for (index, timestamp, _image, _size), found in zip(batch, results):
+                    frames += 1
+                    detections += len(found)
+                    for d in found:
+                        class_counts[d.get('class')] = class_counts.get(d.get('class'), 0) + 1
+                    yield sse_event('frame', {'frame': index, 'time': timestamp, 'count': len(found),
+                                              'detections': found}, event_id=index)
+        except VideoUnsupported as e:
+            yield sse_event('error', {'error': str(e)})
+            return
+        except Exception as e:
+            current_app.logger.error(f"動画の検知エラー: {video_id}: {e}")
+            yield sse_event('error', {'error': '動画の検知に失敗しました'})
+            return
+        yield sse_event('done', {'frames': frames, 'detections': detections, 'class_counts': class_counts,
+                                 'truncated': frames >= max_frames})
+        # 完了した動画は削除する（途中で切断された場合は再開できるよう TTL まで残す）
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(lambda: controller.release(user_id, started))
+    return response
 
 
 # 再検知機能は廃止しました（2025-09）。関連するUIは削除済み。
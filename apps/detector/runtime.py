@@ -0,0 +1,93 @@
+"""
+推論スレッド・CPUコア割り当て設定
+
+torch の intra-op / inter-op スレッド数と、プロセス単位のコア予算
+（``DETECTOR_CORE_BUDGET``）を適用します。マルチプロセス構成で各ワーカーが
+全コア分のスレッドを立てて奪い合う（オーバーサブスクリプション）のを防ぎます。
+
+プロセス内の推論は BatchPredictor のディスパッチャ1本に集約されるため、
+同時推論数はプロセス数、1推論あたりの並列度は intra-op スレッド数で決まります。
+"""
+
+import os
+
+_APPLIED_PID = None
+
+
+def available_cores():
+    """このプロセスが利用可能なCPUコア一覧"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def resolve_thread_settings(config):
+    """設定値から (intra_op, inter_op, core_budget) を決める（0/未設定は自動）"""
+    cores = len(available_cores())
+    budget = int(config.get('DETECTOR_CORE_BUDGET') or 0)
+    budget = min(budget, cores) if budget > 0 else 0
+    intra = int(config.get('DETECTOR_TORCH_INTRA_OP_THREADS') or 0) or budget or cores
+    inter = int(config.get('DETECTOR_TORCH_INTER_OP_THREADS') or 0) or 1
+    return intra, inter, budget
+
+
+def default_job_workers(config):
+    """DETECTOR_JOB_WORKERS=0 の場合のワーカー数（コア予算 or 利用可能コア数、最低2）"""
+    _intra, _inter, budget = resolve_thread_settings(config)
+    return max(2, budget or len(available_cores()))
+
+
+def _pin_to_core_slice(budget, logger=None):
+    """コア予算分のコアにプロセスを固定（Linuxのみ）
+
+    スロット番号は DETECTOR_WORKER_INDEX 環境変数、なければ pid から決める。
+    """
+    if not budget or not hasattr(os, 'sched_setaffinity'):
+        return None
+    cores = available_cores()
+    slots = max(1, len(cores) // budget)
+    index = os.environ.get('DETECTOR_WORKER_INDEX')
+    slot = (int(index) if index and index.isdigit() else os.getpid()) % slots
+    chosen = cores[slot * budget:(slot + 1) * budget]
+    try:
+        os.sched_setaffinity(0, chosen)
+    except OSError as e:
+        if logger:
+            logger.warning(f"CPUアフィニティの設定に失敗: {e}")
+        return None
+    return chosen
+
+
+def apply_inference_thread_settings(config, logger=None):
+    """torch / OpenCV のスレッド数とコア固定をプロセスごとに1回だけ適用
+
+    torch の import 前に呼ぶと OMP_NUM_THREADS 等の環境変数も効く。
+    """
+    global _APPLIED_PID
+    if _APPLIED_PID == os.getpid():
+        return
+    _APPLIED_PID = os.getpid()
+
+    intra, inter, budget = resolve_thread_settings(config)
+    pinned = _pin_to_core_slice(budget, logger) if config.get('DETECTOR_CPU_AFFINITY') else None
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ.setdefault(var, str(intra))
+
+    try:
+        import torch
+        torch.set_num_threads(intra)
+        try:
+            torch.set_num_interop_threads(inter)
+        except RuntimeError:
+            # inter-op プールが既に起動済みの場合は変更できない
+            pass
+    except ImportError:
+        pass
+    try:
+        import cv2
+        cv2.setNumThreads(intra)
+    except ImportError:
+        pass
+
+    if logger:
+        logger.info(f"推論スレッド設定: intra_op={intra} inter_op={inter} core_budget={budget or 'all'} pinned={pinned}")
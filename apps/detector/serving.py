@@ -0,0 +1,149 @@
+"""
+アップロード画像の配信
+
+画像の配信では、毎回の所有者確認クエリと Python 側でのファイル読み出しを減らします。
+
+- 所有者確認の結果（ユーザーID + ファイル名 → 内容ハッシュ）を短いTTLでプロセス内にキャッシュ
+- 内容ハッシュを強いETagとして使い、If-None-Match が一致すればファイルに触れず 304 を返す
+- Range 要求（部分取得）と条件付き要求は Werkzeug の send_file に任せる
+- 前段プロキシがあれば X-Accel-Redirect（nginx）/ X-Sendfile（Apache 等）でファイル送出を委ねる
+
+X-Accel-Redirect を使う場合は、nginx 側にアップロード先を指す internal な location
+（``DETECTOR_IMAGE_ACCEL_PREFIX``）を用意します::
+
+    location /_protected/detector-images/ {
+        internal;
+        alias /path/to/apps/detector/images/;
+    }
+"""
+
+import mimetypes
+import threading
+import time
+from collections import OrderedDict
+
+import werkzeug.utils
+from flask import Response, current_app, request
+
+class OwnershipCache:
+    """(ユーザーID, ファイル名) → (画像ID, 内容ハッシュ) の短期キャッシュ（LRU + TTL、スレッドセーフ）
+
+    所有している場合のみ記録する（未所有・未登録を覚えると直後のアップロードが見えなくなるため）。
+    削除時は ``invalidate`` で即座に外す。
+
+    Args:
+        ttl (float): 有効期間（秒）。0 でキャッシュ無効
+        max_entries (int): 保持する最大件数
+    """
+
+    def __init__(self, ttl=30, max_entries=10000):
+        self.ttl = max(0.0, float(ttl))
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, filename):
+        if not self.ttl:
+            return None
+        key = (user_id, filename)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id, filename, image_id, content_hash):
+        if not self.ttl:
+            return
+        with self._lock:
+            self._entries[(user_id, filename)] = (time.monotonic() + self.ttl, (image_id, content_hash))
+            self._entries.move_to_end((user_id, filename))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id, filename=None):
+        """ユーザーの指定ファイル（省略時は全ファイル）のキャッシュを外す"""
+        with self._lock:
+            if filename is not None:
+                self._entries.pop((user_id, filename), None)
+                return
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'ttl': self.ttl}
+
+
+_CREATE_LOCK = threading.Lock()
+
+
+def get_ownership_cache(app):
+    """アプリ単位の所有者確認キャッシュ"""
+    cache = app.extensions.get('detector_ownership')
+    if cache is not None:
+        return cache
+    with _CREATE_LOCK:
+        cache = app.extensions.get('detector_ownership')
+        if cache is None:
+            cache = app.extensions['detector_ownership'] = OwnershipCache(
+                ttl=app.config.get('DETECTOR_OWNERSHIP_CACHE_TTL', 30),
+                max_entries=app.config.get('DETECTOR_OWNERSHIP_CACHE_SIZE', 10000),
+            )
+    return cache
+
+
+def _cache_headers(response, max_age):
+    """ユーザー専用（private）で、内容が変わらない URL として長期キャッシュさせる"""
+    response.cache_control.max_age = max_age
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+
+def send_image(directory, filename, etag=None, max_age=31536000):
+    """画像ファイルを条件付き要求・Range 要求に対応して送る
+
+    Args:
+        directory (str): 配信元ディレクトリ
+        filename (str): directory からの相対パス（所有者確認済みであること）
+        etag (str): 強いETag（内容ハッシュ）。None なら Werkzeug がファイル情報から生成
+        max_age (int): Cache-Control の max-age（秒）
+    """
+    if etag is not None and request.if_none_match.contains(etag):
+        # ブラウザが同じ内容を持っている: ファイルを開かずに返す
+        response = Response(status=304)
+        response.set_etag(etag)
+        return _cache_headers(response, max_age)
+
+    mode = current_app.config.get('DETECTOR_IMAGE_SENDFILE_MODE', 'off')
+    if mode == 'x-accel':
+        # 送出は nginx に任せる（Range もプロキシ側で処理される）
+        prefix = current_app.config.get('DETECTOR_IMAGE_ACCEL_PREFIX', '/_protected/detector-images/')
+        response = Response(status=200, mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + filename
+        if etag is not None:
+            response.set_etag(etag)
+        return _cache_headers(response, max_age)
+
+    # x-sendfile はこの配信だけで有効にする（アプリ全体の USE_X_SENDFILE は変えない）
+    response = werkzeug.utils.send_from_directory(
+        directory,
+        filename,
+        request.environ,
+        etag=etag if etag is not None else True,
+        conditional=True,
+        max_age=max_age,
+        use_x_sendfile=mode == 'x-sendfile' or current_app.config['USE_X_SENDFILE'],
+        response_class=current_app.response_class,
+    )
+    return _cache_headers(response, max_age)
@@ -0,0 +1,94 @@
+"""
+同一検知の同時実行の集約（single-flight）
+
+フォームの二重送信や、HTMX ページと API からの同時要求で、同じ画像を同じモデルで
+並行して推論すると、推論が無駄になるうえ同じ検知結果を競合して上書きします。
+(画像ID, モデル指紋) をキーに実行中の処理を1つだけ持ち、後から来た呼び出しは
+新たに実行せず、その完了を待って同じ結果（例外なら同じ例外）を受け取ります。
+
+集約はプロセス内のみです（複数プロセス間では DB の一意制約と
+アトミックなサイドカー書き込みで整合性を保ちます）。
+"""
+
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """キーごとに実行中の処理を1つにまとめる（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """key の処理が実行中ならその完了を待ち、なければ fn() を実行する
+
+        Returns:
+            (結果, shared): shared は他の呼び出しの結果を受け取った場合 True
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            with self._lock:
+                call.waiters -= 1
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # 完了後の呼び出しは新たに実行する（結果はキャッシュしない）
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'waiting': sum(call.waiters for call in self._calls.values()),
+                'executed': self.executed,
+                'coalesced': self.coalesced,
+            }
+
+
+_CREATE_LOCK = threading.Lock()
+
+
+def get_single_flight(app):
+    """アプリ単位の検知の集約"""
+    flights = app.extensions.get('detector_singleflight')
+    if flights is not None:
+        return flights
+    with _CREATE_LOCK:
+        flights = app.extensions.get('detector_singleflight')
+        if flights is None:
+            flights = app.extensions['detector_singleflight'] = SingleFlight()
+    return flights
@@ -0,0 +1,251 @@
+"""
+画像のコンテンツアドレス保存
+
+アップロード画像を内容ハッシュ（SHA-256）で名前付けし、ハッシュ先頭で2段に
+シャーディングしたディレクトリ（``ab/cd/abcd....jpg``）へ保存します。1ディレクトリの
+ファイル数が増えないため、ファイル数が増えても参照・書き込みのコストは変わりません。
+
+同じ内容の画像は1つだけ保存し、``image_blobs`` テーブルの参照カウント
+（参照している UserImage 行の数）で共有します。参照が0になった時点で
+実体とサムネイルを削除します。
+
+旧形式（アップロード先直下のフラットなファイル名）の画像は
+``flask --app run detector migrate-storage`` でこの形式へ移行します。
+"""
+
+import os
+import shutil
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+from apps.models.model import ImageBlob, UserImage, db
+from .cache import file_sha256
+from .thumbnails import THUMB_VARIANTS, thumb_filename
+from .uploads import FORMAT_EXTENSIONS, sniff_image_format
+
+# 同一ハッシュの参照カウント更新とファイル操作を直列化（プロセス内）
+_LOCKS = [threading.Lock() for _ in range(64)]
+
+
+def _lock_for(content_hash):
+    return _LOCKS[int(content_hash[:4], 16) % len(_LOCKS)]
+
+
+def blob_key(content_hash, ext):
+    """保存先の相対パス（UserImage.filename に入る値）"""
+    return f'{content_hash[:2]}/{content_hash[2:4]}/{content_hash}{ext}'
+
+
+def is_blob_key(filename):
+    """コンテンツアドレス形式のファイル名かどうか（旧形式はフラットなファイル名）"""
+    return '/' in (filename or '')
+
+
+def sidecar_relpath(image_id):
+    """画像IDごとの検知結果サイドカーJSONの相対パス（IDの下位16bitで2段に分散）"""
+    return f'{(image_id >> 8) & 0xff:02x}/{image_id & 0xff:02x}/{image_id}.det.json'
+
+
+def acquire_blob(upload_dir, content_hash, ext, size, place):
+    """内容ハッシュの実体を確保し、参照カウントを1増やしてコミットする
+
+    Args:
+        upload_dir (str): 保存先ルート
+        content_hash (str): 画像内容の SHA-256
+        ext (str): 新規保存時の拡張子
+        size (int): ファイルサイズ
+        place: ``place(dest_path)`` で一時ファイルを dest_path へ移す関数。
+            既に同じ内容が保存済みなら呼ばれない
+    Returns:
+        tuple: (相対パス, 新規保存したかどうか)
+    """
+    with _lock_for(content_hash):
+        for attempt in range(2):
+            blob = db.session.get(ImageBlob, content_hash)
+            if blob is None:
+                blob = ImageBlob(content_hash=content_hash, path=blob_key(content_hash, ext), size=size, refcount=1)
+                db.session.add(blob)
+            else:
+                # 他プロセスとの同時更新でも取りこぼさないよう SQL 側で加算する
+                blob.refcount = ImageBlob.refcount + 1
+            try:
+                db.session.commit()
+                break
+            except IntegrityError:
+                # 別プロセスが同じ内容を先に登録した: 読み直して加算し直す
+                db.session.rollback()
+                if attempt:
+                    raise
+        dest = os.path.join(upload_dir, blob.path)
+        created = not os.path.exists(dest)
+        if created:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            place(dest)
+        return blob.path, created
+
+
+def stage_blobs(items):
+    """複数の実体の参照カウント加算をセッションに積む（コミットは呼び出し側でまとめて行う）
+
+    一括アップロードで、画像行の作成と同じ1回のコミットに含めるために使う。
+    コミット後に ``place_blobs`` で未配置の実体を置く。同じ内容の新規登録が
+    他プロセスと競合した場合はコミットが IntegrityError になるため、呼び出し側で
+    ロールバックしてやり直す。
+
+    Args:
+        items: (内容ハッシュ, 拡張子, サイズ) のリスト（同じハッシュが複数あってよい）
+    Returns:
+        list: items と同じ順の相対パス
+    """
+    counts = {}
+    for content_hash, ext, size in items:
+        counts.setdefault(content_hash, [ext, size, 0])[2] += 1
+    existing = {b.content_hash: b for b in ImageBlob.query.filter(ImageBlob.content_hash.in_(list(counts)))}
+    for content_hash, (ext, size, n) in counts.items():
+        blob = existing.get(content_hash)
+        if blob is None:
+            existing[content_hash] = blob = ImageBlob(
+                content_hash=content_hash, path=blob_key(content_hash, ext), size=size, refcount=n)
+            db.session.add(blob)
+        else:
+            blob.refcount = ImageBlob.refcount + n
+    paths = {content_hash: blob.path for content_hash, blob in existing.items()}
+    return [paths[content_hash] for content_hash, _ext, _size in items]
+
+
+def place_blobs(upload_dir, placements):
+    """コミット済みの実体を配置する（既に存在すれば place は呼ばず False）
+
+    Args:
+        placements: (相対パス, place) のリスト。``place(dest_path)`` で一時ファイルを移す
+    Returns:
+        list: 新規配置したかどうか（placements と同じ順）
+    """
+    created = []
+    for path, place in placements:
+        dest = os.path.join(upload_dir, path)
+        with _lock_for(os.path.basename(path)):
+            if os.path.exists(dest):
+                created.append(False)
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            place(dest)
+            created.append(True)
+    return created
+
+
+def release_blob(upload_dir, content_hash, on_remove=None):
+    """参照カウントを1減らしてコミットする（セッションの他の変更も同時にコミットされる）
+
+    参照が0になったら行と実体を削除し、``on_remove(相対パス)`` を呼ぶ（サムネイル削除など）。
+
+    Returns:
+        bool: 実体を削除したかどうか
+    """
+    with _lock_for(content_hash):
+        blob = db.session.get(ImageBlob, content_hash)
+        if blob is not None:
+            blob.refcount = ImageBlob.refcount - 1
+        db.session.commit()
+        if blob is None:
+            return False
+        path = blob.path
+        # 0以下になった行だけを条件付きで削除（同時に参照が増えていれば残る）
+        deleted = ImageBlob.query.filter(
+            ImageBlob.content_hash == content_hash, ImageBlob.refcount <= 0
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        if not deleted:
+            return False
+        full = os.path.join(upload_dir, path)
+        if os.path.exists(full):
+            os.remove(full)
+        if on_remove:
+            on_remove(path)
+        return True
+
+
+def _legacy_extension(path, image_format=None):
+    """旧形式ファイルの保存用拡張子（形式が分かれば既定拡張子、不明なら元の拡張子）"""
+    if image_format is None:
+        with open(path, 'rb') as f:
+            image_format = sniff_image_format(f.read(12))
+    if image_format in FORMAT_EXTENSIONS:
+        return FORMAT_EXTENSIONS[image_format][0]
+    return os.path.splitext(path)[1].lower()
+
+
+def _move_if_present(src, dest):
+    """src があれば dest へ移す（dest が既にあれば src を捨てる）"""
+    if not os.path.exists(src):
+        return
+    if os.path.exists(dest):
+        os.remove(src)
+        return
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.replace(src, dest)
+
+
+def migrate_legacy_images(upload_dir, thumb_dir, sidecar_path, limit=None):
+    """旧形式の画像をコンテンツアドレス形式へ移行する（何度実行してもよい）
+
+    実体は先に新しい場所へ複製（ハードリンク）してから参照をコミットし、その後で
+    旧ファイルを消すため、途中で中断しても画像が失われることはない。
+    サイドカーJSONとサムネイルも新しい場所へ移す。
+
+    Args:
+        upload_dir (str): アップロード先ルート
+        thumb_dir (str): サムネイル保存先
+        sidecar_path: ``sidecar_path(user_image)`` で画像ID別のサイドカーJSONパスを返す関数
+        limit (int): 移行する最大件数
+    Returns:
+        dict: migrated（移行件数）/ deduplicated（うち既存の実体と同じ内容だった件数）/ missing（ファイルなし）
+    """
+    counts = {'migrated': 0, 'deduplicated': 0, 'missing': 0}
+    after_id = 0
+    while limit is None or counts['migrated'] < limit:
+        # フラットなファイル名（'/' を含まない）の有効な画像を画像ID順に少しずつ読む
+        rows = UserImage.query.filter(
+            UserImage.id > after_id,
+            UserImage.is_active == True,  # noqa: E712
+            ~UserImage.filename.contains('/'),
+        ).order_by(UserImage.id).limit(200).all()
+        if not rows:
+            break
+        for img in rows:
+            after_id = img.id
+            if limit is not None and counts['migrated'] >= limit:
+                break
+            old_name = img.filename
+            src = os.path.join(upload_dir, old_name)
+            if not os.path.exists(src):
+                counts['missing'] += 1
+                continue
+            content_hash = img.content_hash or file_sha256(src)
+            blob = db.session.get(ImageBlob, content_hash)
+            # 同じ内容が登録済みならその実体を共有する（拡張子も既存に合わせる）
+            key = blob.path if blob is not None else blob_key(content_hash, _legacy_extension(src, img.image_format))
+            dest = os.path.join(upload_dir, key)
+            existed = os.path.exists(dest)
+            if not existed:
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                try:
+                    os.link(src, dest)
+                except OSError:
+                    shutil.copy2(src, dest)
+            # 属性の変更では onupdate でアップロード日時が移行時刻に変わるため、日時を据え置いて更新する
+            img.update_columns(filename=key, image_path=f'uploads/{key}', content_hash=content_hash,
+                               file_size=img.file_size if img.file_size is not None else os.path.getsize(src))
+            # 画像行の更新と参照カウントの加算を同時にコミット（実体は配置済みなので place は呼ばれない）
+            acquire_blob(upload_dir, content_hash, os.path.splitext(key)[1], img.file_size,
+                         place=lambda path: shutil.copy2(src, path))
+            os.remove(src)
+            _move_if_present(os.path.join(upload_dir, f'{old_name}.det.json'), sidecar_path(img))
+            for variant in THUMB_VARIANTS:
+                _move_if_present(os.path.join(thumb_dir, thumb_filename(old_name, variant)),
+                                 os.path.join(thumb_dir, thumb_filename(key, variant)))
+            counts['migrated'] += 1
+            if existed:
+                counts['deduplicated'] += 1
+    return counts
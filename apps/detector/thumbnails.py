@@ -0,0 +1,86 @@
+"""
+ギャラリー用サムネイル生成
+
+元画像から 1x / 2x の WebP サムネイルと JPEG フォールバックを生成し、
+ディスクにキャッシュします。JPEG は draft モードで縮小デコードするため、
+大きな元画像でも全画素を展開せずに済みます。
+"""
+
+import os
+import threading
+
+# variant名 -> (倍率, PIL保存形式, 拡張子)
+THUMB_VARIANTS = {
+    '1x.webp': (1, 'WEBP', 'webp'),
+    '2x.webp': (2, 'WEBP', 'webp'),
+    '1x.jpg': (1, 'JPEG', 'jpg'),
+}
+
+
+def thumb_filename(filename, variant):
+    """サムネイルのファイル名（<元ファイル名>.<variant>。元がシャーディングされた相対パスなら同じ階層）"""
+    return f'{filename}.{variant}'
+
+
+def _save_atomic(img, path, fmt):
+    """一時ファイルに書き出してから置換（読み手が途中状態を見ないように）"""
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    if fmt == 'WEBP':
+        img.save(tmp, fmt, quality=80, method=4)
+    else:
+        img.save(tmp, fmt, quality=82, optimize=True, progressive=True)
+    os.replace(tmp, path)
+
+
+def generate_thumbnails(source_path, thumb_dir, filename, size=320):
+    """全variantを一度のデコードで生成し、variant名 -> パスの辞書を返す
+
+    既に存在するvariantは再生成しない。
+    """
+    from PIL import Image, ImageOps
+
+    os.makedirs(thumb_dir, exist_ok=True)
+    paths = {v: os.path.join(thumb_dir, thumb_filename(filename, v)) for v in THUMB_VARIANTS}
+    missing = [v for v, p in paths.items() if not os.path.exists(p)]
+    if not missing:
+        return paths
+    os.makedirs(os.path.dirname(paths[missing[0]]), exist_ok=True)
+
+    max_scale = max(THUMB_VARIANTS[v][0] for v in missing)
+    with Image.open(source_path) as src:
+        # JPEGはDCTスケーリングで目標サイズ近くまで縮小しながらデコード
+        src.draft('RGB', (size * max_scale, size * max_scale))
+        img = ImageOps.exif_transpose(src)
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            # 透過部分は白背景に合成（JPEGは透過を持てないため）
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel('A'))
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        # 大きいvariantから順に、直前の縮小結果をさらに縮小して使う
+        base = img
+        for variant in sorted(missing, key=lambda v: -THUMB_VARIANTS[v][0]):
+            scale, fmt, _ext = THUMB_VARIANTS[variant]
+            thumb = base.copy()
+            thumb.thumbnail((size * scale, size * scale), Image.LANCZOS)
+            _save_atomic(thumb, paths[variant], fmt)
+            base = thumb
+    return paths
+
+
+def ensure_thumbnail(source_path, thumb_dir, filename, variant, size=320):
+    """指定variantのサムネイルパスを返す（未生成なら生成）"""
+    path = os.path.join(thumb_dir, thumb_filename(filename, variant))
+    if not os.path.exists(path):
+        # 同時生成が起きても書き込みはアトミックなので結果は壊れない
+        generate_thumbnails(source_path, thumb_dir, filename, size=size)
+    return path
+
+
+def remove_thumbnails(thumb_dir, filename):
+    """画像に対応するサムネイルをすべて削除"""
+    for variant in THUMB_VARIANTS:
+        path = os.path.join(thumb_dir, thumb_filename(filename, variant))
+        if os.path.exists(path):
+            os.remove(path)
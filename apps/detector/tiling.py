@@ -0,0 +1,131 @@
+"""
+タイル分割推論（高解像度画像の小物体検出用）
+
+画像を重なり付きのタイルに分割し、全タイルを BatchPredictor でまとめて推論します。
+縮小画像での全体推論（大きな物体用）の結果と合わせ、タイル境界で重複・分断した
+検出枠をクラスごとの NMS で統合します。
+"""
+
+import numpy as np
+
+
+def tile_origins(length, tile, overlap):
+    """1次元方向のタイル開始位置（末尾は画像端に揃える）"""
+    if length <= tile:
+        return [0]
+    stride = max(1, int(tile * (1 - overlap)))
+    origins = list(range(0, length - tile + 1, stride))
+    if origins[-1] != length - tile:
+        origins.append(length - tile)
+    return origins
+
+
+def make_tiles(width, height, tile=640, overlap=0.2):
+    """重なり付きタイルの (x0, y0, x1, y1) 一覧"""
+    return [
+        (x, y, min(x + tile, width), min(y + tile, height))
+        for y in tile_origins(height, tile, overlap)
+        for x in tile_origins(width, tile, overlap)
+    ]
+
+
+def merge_boxes(xyxy, conf, cls, iou_threshold=0.5, ios_threshold=0.8):
+    """クラスごとの貪欲NMS
+
+    IoU が閾値を超えるか、小さい方の枠の大部分が重なる（タイル境界で分断された
+    部分枠）場合に、信頼度の低い方を除く。後者（IoS による抑制）では、残す枠を
+    除いた枠との和集合に広げる（タイル内の部分枠の方が信頼度が高くても、全体推論の
+    大きな枠が1タイル分に切り詰められないようにする）。
+    """
+    xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+    conf = np.asarray(conf, dtype=np.float32).reshape(-1)
+    cls = np.asarray(cls, dtype=np.int64).reshape(-1)
+    if len(xyxy) == 0:
+        return xyxy, conf, cls
+
+    areas = np.clip(xyxy[:, 2] - xyxy[:, 0], 0, None) * np.clip(xyxy[:, 3] - xyxy[:, 1], 0, None)
+    merged = xyxy.copy()
+    order = np.argsort(-conf)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        ix1 = np.maximum(xyxy[i, 0], xyxy[rest, 0])
+        iy1 = np.maximum(xyxy[i, 1], xyxy[rest, 1])
+        ix2 = np.minimum(xyxy[i, 2], xyxy[rest, 2])
+        iy2 = np.minimum(xyxy[i, 3], xyxy[rest, 3])
+        inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        ios = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        same = cls[rest] == cls[i]
+        suppressed = same & ((iou > iou_threshold) | (ios > ios_threshold))
+        contained = rest[same & (ios > ios_threshold)]
+        if contained.size:
+            merged[i, :2] = np.minimum(merged[i, :2], xyxy[contained, :2].min(axis=0))
+            merged[i, 2:] = np.maximum(merged[i, 2:], xyxy[contained, 2:].max(axis=0))
+        order = rest[~suppressed]
+    keep = np.array(keep, dtype=np.int64)
+    return merged[keep], conf[keep], cls[keep]
+
+
+def tiled_inference(image_path, predict_many, result_arrays, tile=640, overlap=0.2,
+                    max_side=4096, imgsz=640, timer=None):
+    """タイル分割 + 全体縮小推論を行い、元画像座標の (xyxy, conf, cls) を返す
+
+    Args:
+        image_path (str): 元画像のパス
+        predict_many: 画像リストを受け取り結果リストを返す関数（バッチ推論経路）
+        result_arrays: 推論結果1件から (xyxy, conf, cls) を取り出す関数
+        tile (int): タイル一辺のpx（デコード後の座標系）
+        overlap (float): タイル同士の重なり率
+        max_side (int): デコード時の長辺上限（これを超える画像は縮小デコード）
+        imgsz (int): 全体推論の入力サイズ
+        timer (StageTimer): ステージ別計測（省略可）
+    """
+    from .preprocess import decode_reduced, letterbox
+    from .timing import span
+
+    with span(timer, 'decode'):
+        img, orig_size = decode_reduced(image_path, max_side)
+    with span(timer, 'preprocess'):
+        if max(img.size) > max_side:
+            from PIL import Image
+            ratio = max_side / max(img.size)
+            img = img.resize((max(1, round(img.size[0] * ratio)), max(1, round(img.size[1] * ratio))), Image.BILINEAR)
+        decode_scale = img.size[0] / orig_size[0]
+
+        tiles = make_tiles(img.size[0], img.size[1], tile, overlap)
+        global_img, global_meta = letterbox(img, orig_size, imgsz)
+        inputs = [img.crop(box) for box in tiles] + [global_img]
+    with span(timer, 'inference'):
+        outputs = predict_many(inputs)
+    with span(timer, 'postprocess'):
+        return _merge_outputs(tiles, outputs, decode_scale, global_meta, result_arrays)
+
+
+def _merge_outputs(tiles, outputs, decode_scale, global_meta, result_arrays):
+    """タイル・全体推論の結果を元画像座標に戻して NMS で統合"""
+    from .preprocess import scale_boxes_to_original
+
+    all_xyxy, all_conf, all_cls = [], [], []
+    for (x0, y0, _x1, _y1), r in zip(tiles, outputs[:-1]):
+        xyxy, conf, cls = result_arrays(r)
+        if len(xyxy) == 0:
+            continue
+        xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4).copy()
+        xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] + x0) / decode_scale
+        xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] + y0) / decode_scale
+        all_xyxy.append(xyxy)
+        all_conf.append(np.asarray(conf, dtype=np.float32).reshape(-1))
+        all_cls.append(np.asarray(cls, dtype=np.int64).reshape(-1))
+
+    xyxy, conf, cls = result_arrays(outputs[-1])
+    if len(xyxy):
+        all_xyxy.append(scale_boxes_to_original(xyxy, global_meta))
+        all_conf.append(np.asarray(conf, dtype=np.float32).reshape(-1))
+        all_cls.append(np.asarray(cls, dtype=np.int64).reshape(-1))
+
+    if not all_xyxy:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+    return merge_boxes(np.concatenate(all_xyxy), np.concatenate(all_conf), np.concatenate(all_cls))
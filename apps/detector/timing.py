@@ -0,0 +1,135 @@
+"""
+検知パイプラインのステージ別計測
+
+1回の検知で ``StageTimer`` を作り、各ステージ（ファイル読込・デコード・前処理・
+推論・後処理・保存など）を ``span`` で囲んで所要時間を記録します。記録値は
+結果ペイロードの ``timings`` に保存し、同時にプロセス内の ``StageMetrics``
+（ステージ別ヒストグラム）へ集計します。集計値は管理画面のメトリクスAPIで参照できます。
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# ヒストグラムのバケット上限（ms）。最後のバケットは上限なし
+HISTOGRAM_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class StageTimer:
+    """1回の検知処理のステージ別所要時間（ms）を記録する"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def span(self, stage):
+        """with ブロックの所要時間を stage に加算する（同じステージの複数回は合計）"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, (time.perf_counter() - t0) * 1000.0)
+
+    def add(self, stage, ms):
+        self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+    def to_dict(self):
+        """ペイロード保存用 {stage: ms, ..., 'total': ms}（小数2桁）"""
+        data = {stage: round(ms, 2) for stage, ms in self.stages.items()}
+        data['total'] = round((time.perf_counter() - self.started) * 1000.0, 2)
+        return data
+
+
+def span(timer, stage):
+    """timer が None でも使える span"""
+    return timer.span(stage) if timer is not None else nullcontext()
+
+
+class _Histogram:
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.sum += ms
+        self.max = max(self.max, ms)
+
+    def quantile(self, q):
+        """バケット境界から推定した分位点（該当バケットの上限値）"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                bound = HISTOGRAM_BUCKETS_MS[i] if i < len(HISTOGRAM_BUCKETS_MS) else self.max
+                return round(min(bound, self.max), 2)
+        return round(self.max, 2)
+
+    def to_dict(self):
+        bounds = [str(b) for b in HISTOGRAM_BUCKETS_MS] + ['+Inf']
+        return {
+            'count': self.count,
+            'sum_ms': round(self.sum, 2),
+            'mean_ms': round(self.sum / self.count, 2) if self.count else None,
+            'max_ms': round(self.max, 2),
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'p99_ms': self.quantile(0.99),
+            'buckets': dict(zip(bounds, self.counts)),
+        }
+
+
+class StageMetrics:
+    """ステージ別ヒストグラムのプロセス内集計（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self.since = time.time()
+
+    def observe(self, timings):
+        """StageTimer.to_dict() の値をまとめて記録"""
+        with self._lock:
+            for stage, ms in timings.items():
+                hist = self._histograms.get(stage)
+                if hist is None:
+                    hist = self._histograms[stage] = _Histogram()
+                hist.observe(ms)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self.since = time.time()
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'since': self.since,
+                'buckets_ms': list(HISTOGRAM_BUCKETS_MS),
+                'stages': {stage: h.to_dict() for stage, h in sorted(self._histograms.items())},
+            }
+
+
+_CREATE_LOCK = threading.Lock()
+
+
+def get_stage_metrics(app):
+    """アプリ単位のステージ別メトリクス"""
+    metrics = app.extensions.get('detector_metrics')
+    if metrics is not None:
+        return metrics
+    with _CREATE_LOCK:
+        metrics = app.extensions.get('detector_metrics')
+        if metrics is None:
+            metrics = app.extensions['detector_metrics'] = StageMetrics()
+    return metrics
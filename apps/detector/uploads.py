@@ -0,0 +1,194 @@
+"""
+ストリーミングアップロード
+
+multipart の解析中にファイル部分をアップロード先ディレクトリの一時ファイルへ
+チャンク単位で書き込み、同時に SHA-256 を計算して先頭バイトから画像形式を判定します。
+画像でないと判明した時点で以降の書き込みを止め、受信完了後にヘッダーだけを読んで
+画像サイズを確認してから、一時ファイルを保存先へアトミックに rename します。
+
+Werkzeug 既定の SpooledTemporaryFile への退避 → ``FileStorage.save`` での再コピーを
+避けるため、リクエストクラスの ``_get_file_stream`` を差し替えて使います。
+"""
+
+import hashlib
+import os
+import tempfile
+
+from flask import Request, current_app
+
+# ストリーミング保存を行うエンドポイント
+STREAMING_UPLOAD_ENDPOINTS = {'detector.upload', 'detector.api_upload_bulk'}
+# リクエストサイズ上限に DETECTOR_BULK_MAX_CONTENT_LENGTH を使うエンドポイント
+BULK_UPLOAD_ENDPOINTS = {'detector.api_upload_bulk'}
+# リクエストサイズ上限に DETECTOR_VIDEO_MAX_CONTENT_LENGTH を使うエンドポイント
+VIDEO_UPLOAD_ENDPOINTS = {'detector.api_video_upload'}
+
+# 一括アップロードの ZIP（画像ではないため通常の一時ファイルで受ける）
+ARCHIVE_EXTENSIONS = ('.zip',)
+ARCHIVE_CONTENT_TYPES = ('application/zip', 'application/x-zip-compressed')
+
+# 判定に必要な先頭バイト数（WebP は RIFF....WEBP の12バイト）
+_SNIFF_BYTES = 12
+
+# 形式 → 保存時の拡張子（先頭が既定）
+FORMAT_EXTENSIONS = {
+    'JPEG': ('.jpg', '.jpeg', '.jfif'),
+    'PNG': ('.png',),
+    'GIF': ('.gif',),
+    'BMP': ('.bmp',),
+    'WEBP': ('.webp',),
+}
+
+
+class UploadRejected(ValueError):
+    """アップロードされたファイルが画像として受け付けられない"""
+
+
+def sniff_image_format(head):
+    """先頭バイトから画像形式（JPEG / PNG / GIF / BMP / WEBP）を判定。不明なら None"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'GIF'
+    if head.startswith(b'BM'):
+        return 'BMP'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def is_archive(filename, content_type=None):
+    """一括アップロード用の ZIP かどうか（ファイル名または Content-Type で判定）"""
+    return os.path.splitext(filename or '')[1].lower() in ARCHIVE_EXTENSIONS or content_type in ARCHIVE_CONTENT_TYPES
+
+
+class HashingUploadStream:
+    """一時ファイルへ書き込みながらハッシュ計算と形式判定を行うアップロード先
+
+    Werkzeug の multipart パーサーが ``write`` でチャンクを渡し、終了後に
+    ``seek(0)`` してから ``FileStorage`` に包む。保存は ``commit`` で行い、
+    commit されずに閉じられた一時ファイルは削除する。
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-', suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.sha256()
+        self._head = b''
+        self.size = 0
+        self.format = None
+        self.rejected = False
+        self.committed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.rejected:
+            # 画像でないと判明済み: 残りは読み捨てる（ディスクに書かない）
+            return len(data)
+        if self.format is None:
+            self._head += bytes(data[:_SNIFF_BYTES])
+            if len(self._head) >= _SNIFF_BYTES:
+                self.format = sniff_image_format(self._head)
+                if self.format is None:
+                    self.rejected = True
+                    self._file.truncate(0)
+                    return len(data)
+        self._hash.update(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    # FileStorage / パーサーが使うファイルAPI
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def readline(self, *args):
+        return self._file.readline(*args)
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        return self._file.flush()
+
+    def validate(self, max_pixels=None):
+        """受信完了後の検証。画像の (形式, 幅, 高さ) を返し、不正なら UploadRejected"""
+        if self.format is None and not self.rejected:
+            # 判定に必要なバイト数に満たない小さなファイル
+            self.format = sniff_image_format(self._head)
+        if self.rejected or self.format is None:
+            raise UploadRejected('画像ファイルではありません')
+        self._file.flush()
+        from PIL import Image
+        try:
+            # ヘッダーのみ読む（画素はデコードしない）
+            with Image.open(self.temp_path) as img:
+                width, height = img.size
+                actual = img.format
+        except Exception as e:
+            raise UploadRejected(f'画像として読み込めません: {e}')
+        if actual != self.format:
+            raise UploadRejected(f'画像形式が一致しません: {self.format} / {actual}')
+        if max_pixels and width * height > max_pixels:
+            raise UploadRejected(f'画像が大きすぎます: {width}x{height}')
+        return self.format, width, height
+
+    def finish(self):
+        """書き込みを確定してファイルを閉じる（一時ファイルは commit / close まで残る）
+
+        多数のファイルを同時に保持する一括アップロードで、ファイル記述子を使い切らないために使う。
+        """
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def commit(self, dest_path):
+        """一時ファイルを保存先へアトミックに移動"""
+        self.finish()
+        os.replace(self.temp_path, dest_path)
+        self.committed = True
+
+    def close(self):
+        """commit されていなければ一時ファイルを削除"""
+        if not self._file.closed:
+            self._file.close()
+        if not self.committed:
+            try:
+                os.unlink(self.temp_path)
+            except FileNotFoundError:
+                pass
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+
+class StreamingUploadRequest(Request):
+    """検知アップロードのファイル部分を HashingUploadStream で受けるリクエストクラス"""
+
+    @property
+    def max_content_length(self):
+        # 一括アップロード・動画は専用の上限（CSRF 検証などでフォームが先に解析されるためここで切り替える）
+        if self.endpoint in BULK_UPLOAD_ENDPOINTS:
+            return current_app.config.get('DETECTOR_BULK_MAX_CONTENT_LENGTH')
+        if self.endpoint in VIDEO_UPLOAD_ENDPOINTS:
+            return current_app.config.get('DETECTOR_VIDEO_MAX_CONTENT_LENGTH')
+        return Request.max_content_length.fget(self)
+
+    @max_content_length.setter
+    def max_content_length(self, value):
+        Request.max_content_length.fset(self, value)
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if filename and self.endpoint in STREAMING_UPLOAD_ENDPOINTS and not is_archive(filename, content_type):
+            return HashingUploadStream(current_app.config['DETECTOR_UPLOAD_FOLDER'])
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
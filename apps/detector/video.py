@@ -0,0 +1,198 @@
+"""
+動画・アニメーション GIF のフレーム検知
+
+動画は OpenCV（cv2.VideoCapture）でフレームを1枚ずつ遅延デコードし、``stride``
+フレームごとに1枚を推論します。間引くフレームは ``grab`` で読み飛ばすだけでデコード
+しないため、長い動画でも保持するのは処理中のバッチ分のフレームだけです。
+OpenCV が使えない環境では、アニメーション GIF に限り Pillow でフレームを読みます。
+
+結果は Server-Sent Events（``text/event-stream``）でフレームごとに返します::
+
+    event: meta    data: {"fps": 30.0, "frame_count": 300, "width": 1280, "height": 720, "stride": 5}
+    id: 15
+    event: frame   data: {"frame": 15, "time": 0.5, "count": 2, "detections": [...]}
+    event: done    data: {"frames": 60, "detections": 87, "class_counts": {...}}
+
+各フレームのイベントIDはフレーム番号です。接続が切れた場合、EventSource が送る
+Last-Event-ID 以降のフレームから再開します。アップロードされた動画は検知完了時
+（または ``DETECTOR_VIDEO_TTL`` 秒の経過後）に削除します。
+"""
+
+import json
+import os
+import time
+import uuid
+
+VIDEO_EXTENSIONS = ('.mp4', '.m4v', '.mov', '.webm', '.avi', '.mkv', '.gif')
+
+
+class VideoUnsupported(ValueError):
+    """動画として開けない（形式不明・デコーダーなし・長すぎる）"""
+
+
+def is_video(filename):
+    """フレーム検知の対象（動画またはGIF）の拡張子かどうか"""
+    return os.path.splitext(filename or '')[1].lower() in VIDEO_EXTENSIONS
+
+
+def _cv2():
+    try:
+        import cv2
+    except ImportError:
+        return None
+    return cv2
+
+
+def new_video_path(directory, user_id, filename):
+    """アップロード動画の保存先（ユーザー別ディレクトリ / 推測できないID + 元の拡張子）"""
+    video_id = uuid.uuid4().hex
+    ext = os.path.splitext(filename or '')[1].lower()
+    user_dir = os.path.join(directory, str(int(user_id)))
+    os.makedirs(user_dir, exist_ok=True)
+    return video_id, os.path.join(user_dir, video_id + ext)
+
+
+def find_video(directory, user_id, video_id):
+    """ユーザーの動画IDから保存先パスを探す（なければ None）"""
+    if not video_id.isalnum():
+        return None
+    user_dir = os.path.join(directory, str(int(user_id)))
+    for ext in VIDEO_EXTENSIONS:
+        path = os.path.join(user_dir, video_id + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def purge_stale_videos(directory, ttl):
+    """ttl 秒より古いアップロード動画を削除し、削除件数を返す"""
+    if not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - ttl
+    removed = 0
+    for root, _dirs, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def probe(path):
+    """動画の情報（fps, frame_count, width, height）を返す。開けなければ VideoUnsupported"""
+    cv2 = _cv2()
+    if cv2 is not None:
+        cap = cv2.VideoCapture(path)
+        try:
+            if not cap.isOpened():
+                raise VideoUnsupported('動画を開けません')
+            return {
+                'fps': round(float(cap.get(cv2.CAP_PROP_FPS) or 0.0), 3),
+                'frame_count': int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0),
+                'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0),
+                'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0),
+            }
+        finally:
+            cap.release()
+    if not path.lower().endswith('.gif'):
+        raise VideoUnsupported('動画のデコードには OpenCV が必要です')
+    from PIL import Image
+
+    try:
+        with Image.open(path) as img:
+            duration = img.info.get('duration') or 100
+            return {
+                'fps': round(1000.0 / duration, 3),
+                'frame_count': getattr(img, 'n_frames', 1),
+                'width': img.width,
+                'height': img.height,
+            }
+    except OSError as e:
+        raise VideoUnsupported('GIF を開けません') from e
+
+
+def iter_frames(path, stride=1, start=0, max_side=None):
+    """stride フレームごとに (フレーム番号, 秒, RGB画像, 元サイズ) を1枚ずつ返すジェネレーター
+
+    start より前と間引くフレームはデコードしない（OpenCV の grab のみ）。
+    max_side を指定すると長辺がそれ以下になるよう縮小してから PIL 画像にする。
+    """
+    from PIL import Image
+
+    stride = max(1, int(stride))
+    cv2 = _cv2()
+    if cv2 is None:
+        yield from _iter_gif_frames(path, stride, start, max_side)
+        return
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise VideoUnsupported('動画を開けません')
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        index = 0
+        while True:
+            if index < start or index % stride:
+                if not cap.grab():
+                    return
+                index += 1
+                continue
+            ok, frame = cap.read()
+            if not ok:
+                return
+            height, width = frame.shape[:2]
+            scale = max_side / max(width, height) if max_side else 1.0
+            if scale < 1.0:
+                frame = cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))),
+                                   interpolation=cv2.INTER_AREA)
+            image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            yield index, round(index / fps, 3) if fps else None, image, (width, height)
+            index += 1
+    finally:
+        cap.release()
+
+
+def _iter_gif_frames(path, stride, start, max_side):
+    """OpenCV がない環境でのアニメーション GIF のフレーム読み出し（Pillow）"""
+    from PIL import Image
+
+    if not path.lower().endswith('.gif'):
+        raise VideoUnsupported('動画のデコードには OpenCV が必要です')
+    with Image.open(path) as img:
+        elapsed = 0.0
+        for index in range(getattr(img, 'n_frames', 1)):
+            img.seek(index)
+            timestamp = round(elapsed / 1000.0, 3)
+            elapsed += img.info.get('duration') or 100
+            if index < start or index % stride:
+                continue
+            frame = img.convert('RGB')
+            size = frame.size
+            if max_side and max(size) > max_side:
+                frame.thumbnail((max_side, max_side), Image.BILINEAR)
+            yield index, timestamp, frame, size
+
+
+def batched(frames, size):
+    """フレームのジェネレーターを size 枚ずつのリストにまとめる（先読みはバッチ1つ分のみ）"""
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def sse_event(event, data, event_id=None):
+    """Server-Sent Events の1イベント分の文字列"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,118 @@
+"""
+物体検知モデルの事前ロードとウォームアップ
+
+``DETECTOR_PRELOAD_MODEL`` で動作を選択します。
+
+- ``off``    : 従来どおり最初の検知リクエストで遅延ロード（既定）
+- ``boot``   : create_app 内でロード + ダミー推論まで同期実行（単一プロセス向け）
+- ``fork``   : 重みのロードだけを create_app（fork前のマスター）で行い、
+               ダミー推論は fork 後の各ワーカーで実行（gunicorn --preload 向け。
+               推論スレッドプールを fork 前に作らないため安全）
+- ``worker`` : 各ワーカープロセスで最初のリクエスト／readiness 確認時に
+               バックグラウンドでロード + ダミー推論
+
+readiness（``/readyz``）はウォームアップ完了後にのみ成功を返します。
+"""
+
+import os
+import threading
+import time
+
+PRELOAD_MODES = ('off', 'boot', 'fork', 'worker')
+
+
+class DetectorWarmup:
+    """プロセス単位のウォームアップ状態
+
+    Args:
+        app: Flaskアプリ
+        mode (str): PRELOAD_MODES のいずれか
+        load_fn: モデルをロードする関数（アプリケーションコンテキスト内で呼ぶ）
+        warm_fn: ダミー推論を1回行う関数（同上）
+    """
+
+    def __init__(self, app, mode, load_fn, warm_fn):
+        self.app = app
+        self.mode = mode
+        self.load_fn = load_fn
+        self.warm_fn = warm_fn
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.ready = self.mode == 'off'
+        self.started = False
+        self.error = None
+        self.seconds = None
+
+    def _after_fork(self):
+        """fork直後の子プロセスでは未ウォームアップ状態からやり直す"""
+        self._lock = threading.Lock()
+        self._reset()
+
+    def run(self):
+        """ロード + ダミー推論を同期実行"""
+        started = time.perf_counter()
+        try:
+            with self.app.app_context():
+                self.load_fn()
+                self.warm_fn()
+        except Exception as e:
+            # モデルが使えなくてもフォールバック検知で動作は継続できるため ready にする
+            self.error = str(e)
+            self.app.logger.warning(f"検知モデルのウォームアップに失敗（フォールバックで継続）: {e}")
+        self.seconds = round(time.perf_counter() - started, 3)
+        self.ready = True
+        self.app.logger.info(f"検知モデルのウォームアップ完了: mode={self.mode} pid={os.getpid()} {self.seconds}s")
+
+    def check(self):
+        """ready を返す。未開始ならこのプロセスでバックグラウンド実行を開始する"""
+        if self.ready:
+            return True
+        if self.pid != os.getpid():
+            self._after_fork()
+        with self._lock:
+            if not self.started:
+                self.started = True
+                threading.Thread(target=self.run, name='detector-warmup', daemon=True).start()
+        return self.ready
+
+    def to_dict(self):
+        """readiness 応答用の辞書"""
+        return {
+            'ready': self.ready,
+            'mode': self.mode,
+            'pid': os.getpid(),
+            'warmup_seconds': self.seconds,
+            'error': self.error,
+        }
+
+
+def init_detector_warmup(app):
+    """DETECTOR_PRELOAD_MODEL に従ってウォームアップを構成し、app.extensions に登録"""
+    from .routes import _get_yolo_model, warmup_detector_model
+
+    mode = str(app.config.get('DETECTOR_PRELOAD_MODEL') or 'off').lower()
+    if mode not in PRELOAD_MODES:
+        app.logger.warning(f"不明な DETECTOR_PRELOAD_MODEL={mode}（off として扱います）")
+        mode = 'off'
+
+    warmup = DetectorWarmup(app, mode, _get_yolo_model, warmup_detector_model)
+    app.extensions['detector_warmup'] = warmup
+
+    if mode == 'boot':
+        warmup.run()
+    elif mode == 'fork':
+        # 重みだけ fork 前に読み込み、子プロセスへ copy-on-write で共有する
+        with app.app_context():
+            _get_yolo_model()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=warmup._after_fork)
+
+    if mode in ('fork', 'worker'):
+        @app.before_request
+        def _detector_warmup_kick():
+            warmup.check()
+
+    return warmup
@@ -204,7 +204,11 @@ class UserImage(db.Model):
     usersテーブルとのリレーションを持ちます。
     """
     __tablename__ = 'user_images'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # ギャラリーのキーセットページング（uploaded_at, id の降順走査）用
+        db.Index('ix_user_images_gallery', 'user_id', 'is_active', 'uploaded_at', 'id'),
+        {'extend_existing': True},
+    )
 
     # 基本フィールド
     id = db.Column(db.Integer, primary_key=True, comment='画像ID（主キー）')
@@ -214,6 +218,13 @@ class UserImage(db.Model):
     image_path = db.Column(db.String(255), nullable=False, comment='画像パス')
     filename = db.Column(db.String(255), nullable=False, comment='ファイル名')
     original_filename = db.Column(db.String(255), comment='元のファイル名')
+    content_hash = db.Column(db.String(64), index=True, comment='画像内容のSHA-256')
+    image_format = db.Column(db.String(16), comment='画像形式（JPEG / PNG など）')
+    width = db.Column(db.Integer, comment='画像幅')
+    height = db.Column(db.Integer, comment='画像高さ')
+    file_size = db.Column(db.Integer, comment='ファイルサイズ（バイト）')
+    perceptual_hash = db.Column(db.String(16), comment='知覚ハッシュ（64bit dHash の16進）')
+    duplicate_of_id = db.Column(db.Integer, db.ForeignKey('user_images.id'), comment='ほぼ重複と判定された元画像ID')
     
     # タイムスタンプ
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment='アップロード日時')
@@ -229,6 +240,21 @@ class UserImage(db.Model):
         """文字列表現"""
         return f'<UserImage {self.image_path} by User {self.user_id}>'
 
+    def update_columns(self, **values):
+        """保存済みの行の列を更新する（コミットは呼び出し側）
+
+        属性を変更してフラッシュすると onupdate で uploaded_at が現在時刻に書き換わるため、
+        uploaded_at を据え置いた UPDATE 文を発行し、オブジェクトの値もそれに合わせる。
+        """
+        from sqlalchemy.orm.attributes import set_committed_value
+
+        db.session.execute(
+            db.update(UserImage).where(UserImage.id == self.id).values(uploaded_at=UserImage.uploaded_at, **values),
+            execution_options={'synchronize_session': False},
+        )
+        for key, value in values.items():
+            set_committed_value(self, key, value)
+
     def to_dict(self):
         """
         辞書形式でデータを返す
@@ -242,10 +268,213 @@ class UserImage(db.Model):
             'image_path': self.image_path,
             'filename': self.filename,
             'original_filename': self.original_filename,
+            'content_hash': self.content_hash,
+            'perceptual_hash': self.perceptual_hash,
+            'duplicate_of_id': self.duplicate_of_id,
+            'width': self.width,
+            'height': self.height,
             'uploaded_at': self.uploaded_at.isoformat() if self.uploaded_at else None,
             'is_active': self.is_active,
             'is_deleted': self.is_deleted
         }
 
 
+class ImageBlob(db.Model):
+    """
+    画像実体モデル
+
+    コンテンツアドレス保存（内容ハッシュ名）された画像ファイル1つを表すモデルです。
+    同じ内容の UserImage 行は1つの実体を共有し、refcount で参照数を管理します。
+    """
+    __tablename__ = 'image_blobs'
+    __table_args__ = {'extend_existing': True}
+
+    content_hash = db.Column(db.String(64), primary_key=True, comment='画像内容のSHA-256（主キー）')
+    path = db.Column(db.String(255), nullable=False, comment='保存先の相対パス')
+    size = db.Column(db.Integer, comment='ファイルサイズ（バイト）')
+    refcount = db.Column(db.Integer, default=0, nullable=False, comment='参照しているUserImage数')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, comment='作成日時')
+
+    def __repr__(self):
+        """文字列表現"""
+        return f'<ImageBlob {self.path} refs={self.refcount}>'
+
+
+class DetectionResult(db.Model):
+    """
+    物体検知結果モデル
+
+    画像1枚に対する最新の検知結果（件数・クラス別件数）を管理するモデルです。
+    user_imagesテーブルと1対1のリレーションを持ちます。
+    """
+    __tablename__ = 'detection_results'
+    __table_args__ = (
+        db.Index('ix_detection_results_user_updated', 'user_id', 'updated_at'),
+        {'extend_existing': True},
+    )
+
+    # 基本フィールド
+    id = db.Column(db.Integer, primary_key=True, comment='検知結果ID（主キー）')
+    image_id = db.Column(db.Integer, db.ForeignKey('user_images.id'), nullable=False, unique=True, comment='画像ID（外部キー）')
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, comment='ユーザーID（外部キー）')
+
+    # 検知情報
+    model = db.Column(db.String(64), comment='使用モデル')
+    model_fingerprint = db.Column(db.String(64), index=True, comment='モデル指紋（重みハッシュ + 推論パラメータ）')
+    count = db.Column(db.Integer, default=0, nullable=False, comment='検出件数')
+    class_counts = db.Column(db.JSON, comment='クラス別件数')
+    timings = db.Column(db.JSON, comment='ステージ別処理時間（ms）')
+
+    # タイムスタンプ
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, comment='検知日時')
+
+    # リレーションシップ
+    image = db.relationship('UserImage', backref=db.backref('detection_result', uselist=False))
+    detections = db.relationship('Detection', backref='result', cascade='all, delete-orphan',
+                                 order_by='Detection.id')
+    class_index = db.relationship('DetectionClassIndex', cascade='all, delete-orphan')
+
+    def __repr__(self):
+        """文字列表現"""
+        return f'<DetectionResult image={self.image_id} count={self.count}>'
+
+    @property
+    def updated_at_iso(self):
+        """サイドカーJSON互換の日時文字列（UTC, 末尾Z）"""
+        return self.updated_at.isoformat(timespec='seconds') + 'Z' if self.updated_at else None
+
+    def to_payload(self, filename=None):
+        """
+        サイドカーJSONと同じ形式の辞書を返す
+
+        Returns:
+            dict: image_filename / updated_at / model / results / count（計測時は timings も）
+        """
+        payload = {
+            'image_filename': filename or (self.image.filename if self.image else None),
+            'updated_at': self.updated_at_iso,
+            'model': self.model,
+            'model_fingerprint': self.model_fingerprint,
+            'results': [d.to_dict() for d in self.detections],
+            'count': self.count,
+        }
+        if self.timings:
+            payload['timings'] = self.timings
+        return payload
+
+
+class Detection(db.Model):
+    """
+    検出オブジェクトモデル
+
+    検知結果に含まれる個々の検出（クラス・信頼度・領域）を管理するモデルです。
+    """
+    __tablename__ = 'detections'
+    __table_args__ = {'extend_existing': True}
+
+    # 基本フィールド
+    id = db.Column(db.Integer, primary_key=True, comment='検出ID（主キー）')
+    result_id = db.Column(db.Integer, db.ForeignKey('detection_results.id'), nullable=False, index=True, comment='検知結果ID（外部キー）')
+
+    # 検出情報
+    class_name = db.Column(db.String(64), nullable=False, index=True, comment='クラス名')
+    confidence = db.Column(db.Float, nullable=False, comment='信頼度')
+    x = db.Column(db.Integer, comment='領域X')
+    y = db.Column(db.Integer, comment='領域Y')
+    width = db.Column(db.Integer, comment='領域幅')
+    height = db.Column(db.Integer, comment='領域高さ')
+
+    def __repr__(self):
+        """文字列表現"""
+        return f'<Detection {self.class_name} {self.confidence}>'
+
+    @classmethod
+    def from_dict(cls, data):
+        """サイドカーJSONの1検出分から生成"""
+        bbox = data.get('bbox') or {}
+        return cls(
+            class_name=str(data.get('class')),
+            confidence=float(data.get('confidence') or 0.0),
+            x=bbox.get('x'),
+            y=bbox.get('y'),
+            width=bbox.get('width'),
+            height=bbox.get('height'),
+        )
+
+    def to_dict(self):
+        """サイドカーJSONの1検出分と同じ形式の辞書を返す"""
+        return {
+            'class': self.class_name,
+            'confidence': self.confidence,
+            'bbox': {'x': self.x, 'y': self.y, 'width': self.width, 'height': self.height},
+        }
+
+
+class DetectionClassIndex(db.Model):
+    """
+    検知クラス索引モデル
+
+    クラス名 → (ユーザー, 画像, 最大信頼度, 件数) の転置索引です。検知結果の保存時に
+    画像ごとに作り直し、「犬と人が信頼度0.7以上で写っている画像」のような検索に使います。
+    """
+    __tablename__ = 'detection_class_index'
+    __table_args__ = (
+        # ユーザー内のクラス検索用。クラスごとの走査と (クラス, 画像) の存在確認の両方を1つの索引で引く
+        db.Index('ix_detection_class_index_lookup', 'user_id', 'class_name', 'image_id', 'max_confidence'),
+        {'extend_existing': True},
+    )
+
+    # 基本フィールド（検知結果ごとにクラス1行）
+    result_id = db.Column(db.Integer, db.ForeignKey('detection_results.id'), primary_key=True, comment='検知結果ID（外部キー）')
+    class_name = db.Column(db.String(64), primary_key=True, comment='クラス名')
+    image_id = db.Column(db.Integer, db.ForeignKey('user_images.id'), nullable=False, comment='画像ID（外部キー）')
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, comment='ユーザーID（外部キー）')
+
+    # 集計値
+    max_confidence = db.Column(db.Float, nullable=False, comment='最大信頼度')
+    count = db.Column(db.Integer, nullable=False, comment='検出件数')
+
+    def __repr__(self):
+        """文字列表現"""
+        return f'<DetectionClassIndex {self.class_name} image={self.image_id} max={self.max_confidence}>'
+
 
+class DetectionDailyStat(db.Model):
+    """
+    検知集計モデル（ユーザー × 日 × クラス）
+
+    検知結果の保存時に増分更新する集計表です。ダッシュボードはこの表だけを
+    集計するため、画像数が増えても集計コストは期間 × クラス数で決まります。
+    class_name が '*' の行は画像単位の合計（検出0件の画像も含む）です。
+    """
+    __tablename__ = 'detection_daily_stats'
+    __table_args__ = (
+        # サイト全体の期間集計用
+        db.Index('ix_detection_daily_stats_day', 'day', 'class_name'),
+        {'extend_existing': True},
+    )
+
+    # 基本フィールド
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True, comment='ユーザーID（外部キー）')
+    day = db.Column(db.Date, primary_key=True, comment='検知日（UTC）')
+    class_name = db.Column(db.String(64), primary_key=True, comment="クラス名（'*' は全クラス合計）")
+
+    # 集計値
+    images = db.Column(db.Integer, default=0, nullable=False, comment='クラスが写っている画像数')
+    detections = db.Column(db.Integer, default=0, nullable=False, comment='検出件数')
+    confidence_sum = db.Column(db.Float, default=0.0, nullable=False, comment='信頼度の合計')
+    # 信頼度ヒストグラム（0.1 刻み、bin_9 は 0.9〜1.0）
+    bin_0 = db.Column(db.Integer, default=0, nullable=False, comment='信頼度0.0〜0.1の件数')
+    bin_1 = db.Column(db.Integer, default=0, nullable=False, comment='信頼度0.1〜0.2の件数')
+    bin_2 = db.Column(db.Integer, default=0, nullable=False, comment='信頼度0.2〜0.3の件数')
+    bin_3 = db.Column(db.Integer, default=0, nullable=False, comment='信頼度0.3〜0.4の件数')
+    bin_4 = db.Column(db.Integer, default=0, nullable=False, comment='信頼度0.4〜0.5の件数')
+    bin_5 = db.Column(db.Integer, default=0, nullable=False, comment='信頼度0.5〜0.6の件数')
+    bin_6 = db.Column(db.Integer, default=0, nullable=False, comment='信頼度0.6〜0.7の件数')
+    bin_7 = db.Column(db.Integer, default=0, nullable=False, comment='信頼度0.7〜0.8の件数')
+    bin_8 = db.Column(db.Integer, default=0, nullable=False, comment='信頼度0.8〜0.9の件数')
+    bin_9 = db.Column(db.Integer, default=0, nullable=False, comment='信頼度0.9〜1.0の件数')
+
+    def __repr__(self):
+        """文字列表現"""
+        return f'<DetectionDailyStat user={self.user_id} {self.day} {self.class_name} n={self.detections}>'
@@ -0,0 +1,303 @@
+"""
+物体検知ベンチマーク
+
+合成画像コーパス（benchmarks/corpus.py）に対して次を計測し、JSONで出力します。
+
+1. stages      : 画像ごとのステージ別時間（decode / preprocess / inference /
+                 postprocess / save）
+2. end_to_end  : Flask テストクライアント経由のアップロード・検知API・ギャラリーの応答時間
+3. concurrency : 検知APIを複数スレッドから同時に叩いたときのスループットとレイテンシ
+
+使い方:
+    python benchmarks/bench_detector.py --out bench.json
+    python benchmarks/bench_detector.py --sizes small,vga --concurrency 1,4,8 --requests 32
+
+ultralytics が無い環境では inference は "unavailable" となり、
+エンドツーエンドはフォールバック（シミュレーション）で計測されます（backend に記録）。
+"""
+
+import argparse
+import datetime
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(__file__))
+
+from corpus import DEFAULT_FORMATS, DEFAULT_SIZES, generate_corpus  # noqa: E402
+
+
+def _summary(samples):
+    """秒単位のサンプル列を ms の統計値にまとめる"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def pct(q):
+        # nearest-rank
+        return round(ordered[max(0, math.ceil(len(ordered) * q) - 1)] * 1000, 2)
+
+    return {
+        'n': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 2),
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    value = fn(*args, **kwargs)
+    return value, time.perf_counter() - t0
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def create_bench_app(work_dir):
+    """一時DB・一時ディレクトリを使うベンチマーク用アプリと、ログイン済みユーザーIDを返す"""
+    import logging
+    import config as app_config
+
+    class BenchmarkConfig(app_config.TestingConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(work_dir, 'bench.sqlite')
+        SQLALCHEMY_ECHO = False
+        SQLALCHEMY_RECORD_QUERIES = False
+        DEBUG = False
+        DETECTOR_UPLOAD_FOLDER = os.path.join(work_dir, 'uploads')
+        DETECTOR_THUMB_FOLDER = os.path.join(work_dir, 'thumbs')
+        # 検知結果・動画も作業ディレクトリへ（ベンチ用DBの画像IDで本番のサイドカーを上書きしない）
+        DETECTOR_RESULT_FOLDER = os.path.join(work_dir, 'results')
+        DETECTOR_VIDEO_FOLDER = os.path.join(work_dir, 'videos')
+        DETECTOR_CACHE_FOLDER = None  # キャッシュヒットで計測が歪まないよう無効化
+
+    app_config.config['benchmark'] = BenchmarkConfig
+    cwd = os.getcwd()
+    os.chdir(work_dir)  # create_app のログファイルを作業ディレクトリに出す
+    try:
+        from app import create_app
+        app = create_app('benchmark')
+    finally:
+        os.chdir(cwd)
+    for handler in app.logger.handlers:
+        handler.setLevel(logging.WARNING)
+
+    from apps.models.model import User, db
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com')
+        user.set_password('benchmark')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    return app, user_id
+
+
+def _login(client, user_id):
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+
+
+def bench_stages(app, user_id, corpus, repeat):
+    """画像ごとのステージ別時間"""
+    from PIL import Image
+    from apps.detector import routes
+    from apps.detector.preprocess import decode_reduced, letterbox
+    from apps.models.model import UserImage, db
+
+    results = []
+    with app.test_request_context():
+        model = routes._get_yolo_model()
+        batcher = routes._get_yolo_batcher() if model is not None else None
+        imgsz = routes._INFERENCE_PARAMS.get('imgsz', 640)
+        names = getattr(model, 'names', None) or {}
+        for entry in corpus:
+            # 保存は画像単位のため計測用の行を作る（他の計測に含めないよう無効にしておく）
+            name = os.path.basename(entry['path'])
+            user_image = UserImage(user_id=user_id, image_path=name, filename=name, original_filename=name,
+                                   is_active=False)
+            db.session.add(user_image)
+            db.session.commit()
+            timings = {k: [] for k in ('decode_full', 'decode', 'preprocess', 'inference', 'postprocess', 'save')}
+            for _ in range(repeat):
+                _, t = _timed(lambda: Image.open(entry['path']).convert('RGB'))
+                timings['decode_full'].append(t)
+                (img, orig_size), t = _timed(decode_reduced, entry['path'], imgsz)
+                timings['decode'].append(t)
+                (canvas, meta), t = _timed(letterbox, img, orig_size, imgsz)
+                timings['preprocess'].append(t)
+                if batcher is not None:
+                    r0, t = _timed(batcher.predict, canvas)
+                    timings['inference'].append(t)
+                    xyxy, conf, cls = routes._result_arrays(r0)
+                else:
+                    # モデルなし: 後処理・保存は一定数の合成枠で計測する
+                    import numpy as np
+                    rng = np.random.default_rng(0)
+                    xy = rng.uniform(0, 600, size=(50, 2)).astype('float32')
+                    xyxy = np.hstack([xy, xy + 40])
+                    conf = rng.uniform(0.25, 1.0, size=50).astype('float32')
+                    cls = rng.integers(0, 80, size=50)
+                detections, t = _timed(routes.build_detections, xyxy, conf, cls, names)
+                timings['postprocess'].append(t)
+                _, t = _timed(routes.save_detection_results, user_image, detections)
+                timings['save'].append(t)
+            results.append({
+                'image': os.path.basename(entry['path']),
+                'label': entry['label'],
+                'format': entry['format'],
+                'size': [entry['width'], entry['height']],
+                'bytes': entry['bytes'],
+                'stages': {k: _summary(v) for k, v in timings.items()} | (
+                    {} if batcher is not None else {'inference': 'unavailable'}),
+            })
+    return results
+
+
+def _upload(client, entry):
+    with open(entry['path'], 'rb') as f:
+        data = {'file': (io.BytesIO(f.read()), os.path.basename(entry['path']))}
+    return client.post('/detector/upload', data=data, content_type='multipart/form-data')
+
+
+def bench_end_to_end(app, user_id, corpus, repeat):
+    """テストクライアント経由のリクエスト単位の応答時間"""
+    from apps.models.model import UserImage
+
+    client = app.test_client()
+    _login(client, user_id)
+    samples = {'upload': [], 'api_detect': [], 'gallery_partial': [], 'detect_page': []}
+    for entry in corpus:
+        for _ in range(repeat):
+            _, t = _timed(_upload, client, entry)
+            samples['upload'].append(t)
+    with app.app_context():
+        image_ids = [img.id for img in UserImage.query.filter_by(user_id=user_id, is_active=True).all()]
+    for image_id in image_ids:
+        _, t = _timed(client.post, '/detector/api/detect', json={'image_id': image_id})
+        samples['api_detect'].append(t)
+        _, t = _timed(client.get, f'/detector/detect/{image_id}')
+        samples['detect_page'].append(t)
+    for _ in range(max(1, repeat) * 5):
+        _, t = _timed(client.get, '/detector/gallery/partial')
+        samples['gallery_partial'].append(t)
+    return {k: _summary(v) for k, v in samples.items()}, image_ids
+
+
+def bench_concurrency(app, user_id, image_ids, levels, requests_per_level):
+    """検知APIを並行に叩いたときのスループット／レイテンシ"""
+    out = []
+    for level in levels:
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+        counter = iter(range(requests_per_level))
+
+        def worker():
+            nonlocal errors
+            client = app.test_client()
+            _login(client, user_id)
+            while True:
+                with lock:
+                    n = next(counter, None)
+                if n is None:
+                    return
+                image_id = image_ids[n % len(image_ids)]
+                resp, t = _timed(client.post, '/detector/api/detect', json={'image_id': image_id})
+                with lock:
+                    latencies.append(t)
+                    if resp.status_code != 200:
+                        errors += 1
+
+        threads = [threading.Thread(target=worker) for _ in range(level)]
+        started = time.perf_counter()
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        wall = time.perf_counter() - started
+        out.append({
+            'concurrency': level,
+            'requests': len(latencies),
+            'errors': errors,
+            'throughput_rps': round(len(latencies) / wall, 2) if wall else None,
+            'latency': _summary(latencies),
+        })
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='コーパスの出力先（省略時は一時ディレクトリ）')
+    parser.add_argument('--sizes', help='使うサイズラベル（例: small,vga,hd,12mp）')
+    parser.add_argument('--formats', help='使う形式（例: JPEG,PNG,WEBP）')
+    parser.add_argument('--repeat', type=int, default=3, help='ステージ計測の繰り返し回数')
+    parser.add_argument('--concurrency', default='1,2,4,8', help='並行数のカンマ区切り')
+    parser.add_argument('--requests', type=int, default=16, help='並行数ごとの総リクエスト数')
+    parser.add_argument('--out', help='結果JSONの出力先（省略時は標準出力）')
+    args = parser.parse_args()
+
+    sizes = DEFAULT_SIZES
+    if args.sizes:
+        wanted = set(args.sizes.split(','))
+        sizes = [s for s in DEFAULT_SIZES if s[0] in wanted]
+    formats = DEFAULT_FORMATS
+    if args.formats:
+        wanted = {f.upper() for f in args.formats.split(',')}
+        formats = [f for f in DEFAULT_FORMATS if f[0] in wanted]
+
+    work_dir = tempfile.mkdtemp(prefix='detector-bench-')
+    corpus = generate_corpus(args.corpus or os.path.join(work_dir, 'corpus'), sizes=sizes, formats=formats)
+    app, user_id = create_bench_app(work_dir)
+
+    from apps.detector import routes
+    with app.app_context():
+        backend = 'yolo' if routes._get_yolo_model() is not None else 'fallback'
+
+    stages = bench_stages(app, user_id, corpus, args.repeat)
+    end_to_end, image_ids = bench_end_to_end(app, user_id, corpus, 1)
+    levels = [int(v) for v in args.concurrency.split(',') if v]
+    concurrency = bench_concurrency(app, user_id, image_ids, levels, args.requests)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'backend': backend,
+            'config': {k: app.config.get(k) for k in sorted(app.config) if k.startswith('DETECTOR_') and 'FOLDER' not in k},
+        },
+        'corpus': [{k: v for k, v in e.items() if k != 'path'} for e in corpus],
+        'stages': stages,
+        'end_to_end': end_to_end,
+        'concurrency': concurrency,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f'wrote {args.out}')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+ベンチマーク用の合成画像コーパス生成
+
+乱数シード固定で、サイズ・形式の異なる画像を生成します。同じ引数なら
+毎回同一バイト列になるため、実行間の比較に使えます。
+
+使い方:
+    python benchmarks/corpus.py --out /tmp/detector-corpus
+"""
+
+import argparse
+import os
+import random
+
+# (ラベル, 幅, 高さ)
+DEFAULT_SIZES = [
+    ('small', 320, 240),
+    ('vga', 640, 480),
+    ('hd', 1920, 1080),
+    ('12mp', 4000, 3000),
+]
+DEFAULT_FORMATS = [
+    ('JPEG', 'jpg'),
+    ('PNG', 'png'),
+    ('WEBP', 'webp'),
+]
+
+
+def _render(width, height, rng):
+    """ランダムな矩形・楕円を描いた写真風でない合成画像（圧縮率が極端にならない程度のノイズ入り）"""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    img = Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1 = min(width, x0 + rng.randrange(width // 10 + 1, width // 3 + 2))
+        y1 = min(height, y0 + rng.randrange(height // 10 + 1, height // 3 + 2))
+        color = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.rectangle((x0, y0, x1, y1), fill=color)
+        else:
+            draw.ellipse((x0, y0, x1, y1), fill=color)
+    # Image.effect_noise はシードを指定できないため、同じ乱数列から生成する
+    import numpy as np
+    gauss = np.random.default_rng(rng.randrange(2 ** 32)).normal(128, 24, (height, width))
+    noise = Image.fromarray(gauss.clip(0, 255).astype(np.uint8), 'L').convert('RGB')
+    return Image.blend(img.filter(ImageFilter.GaussianBlur(1)), noise, 0.15)
+
+
+def generate_corpus(out_dir, sizes=None, formats=None, per_combo=1, seed=1234):
+    """コーパスを生成し、[{path, label, format, width, height, bytes}] を返す（既存ファイルは再利用）"""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    entries = []
+    for label, width, height in sizes or DEFAULT_SIZES:
+        for fmt, ext in formats or DEFAULT_FORMATS:
+            for n in range(per_combo):
+                path = os.path.join(out_dir, f'{label}_{n}.{ext}')
+                img = _render(width, height, rng)
+                if not os.path.exists(path):
+                    options = {'quality': 90} if fmt in ('JPEG', 'WEBP') else {}
+                    img.save(path, fmt, **options)
+                entries.append({
+                    'path': path,
+                    'label': label,
+                    'format': fmt,
+                    'width': width,
+                    'height': height,
+                    'bytes': os.path.getsize(path),
+                })
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', required=True, help='出力ディレクトリ')
+    parser.add_argument('--per-combo', type=int, default=1, help='サイズ×形式ごとの枚数')
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+    for e in generate_corpus(args.out, per_combo=args.per_combo, seed=args.seed):
+        print(f"{e['label']:>6} {e['format']:>5} {e['width']}x{e['height']} {e['bytes']:>10} {e['path']}")
+
+
+if __name__ == '__main__':
+    main()
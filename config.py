@@ -31,6 +31,90 @@ class Config:
     DETECTOR_UPLOAD_FOLDER = str(basedir / 'apps' / 'detector' / 'images')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB制限
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp', 'jfif'}
+    # 検知アップロードで受け付ける最大画素数（幅×高さ。ヘッダーのみで判定）
+    DETECTOR_MAX_IMAGE_PIXELS = int(os.environ.get('DETECTOR_MAX_IMAGE_PIXELS') or 64_000_000)
+
+    # 一括アップロード（ZIP / 複数ファイル）。リクエスト全体の上限・最大件数・検証の並列数
+    DETECTOR_BULK_MAX_CONTENT_LENGTH = int(os.environ.get('DETECTOR_BULK_MAX_CONTENT_LENGTH') or 512 * 1024 * 1024)
+    DETECTOR_BULK_MAX_FILES = int(os.environ.get('DETECTOR_BULK_MAX_FILES') or 500)
+    DETECTOR_BULK_WORKERS = int(os.environ.get('DETECTOR_BULK_WORKERS') or 4)
+
+    # 物体検知ジョブキュー設定（0 でコア予算/利用可能コア数から自動決定）
+    DETECTOR_JOB_WORKERS = int(os.environ.get('DETECTOR_JOB_WORKERS') or 2)
+    DETECTOR_JOB_QUEUE_SIZE = int(os.environ.get('DETECTOR_JOB_QUEUE_SIZE') or 100)
+
+    # リクエスト内で推論するAPI（/detector/api/detect, 動画）の受付制御。プロセスあたりの同時実行数・
+    # ユーザーあたりの同時実行+待機数（検知ジョブの登録数にも適用）・待ち行列の長さ・待ち時間の上限(ms)
+    DETECTOR_ADMISSION_MAX_CONCURRENT = int(os.environ.get('DETECTOR_ADMISSION_MAX_CONCURRENT') or 2)
+    DETECTOR_ADMISSION_MAX_PER_USER = int(os.environ.get('DETECTOR_ADMISSION_MAX_PER_USER') or 2)
+    DETECTOR_ADMISSION_QUEUE_SIZE = int(os.environ.get('DETECTOR_ADMISSION_QUEUE_SIZE') or 8)
+    DETECTOR_ADMISSION_TIMEOUT_MS = int(os.environ.get('DETECTOR_ADMISSION_TIMEOUT_MS') or 10000)
+
+    # 検知モデル。DETECTOR_MODELS は選択可能なモデルID（重みファイル名から .pt を除いたもの）の
+    # カンマ区切り。要求されたモデルだけを読み込み、常駐数・メモリ量（MB, 0は無制限）を超えたら LRU で解放
+    DETECTOR_MODELS = os.environ.get('DETECTOR_MODELS') or 'yolov8n'
+    DETECTOR_DEFAULT_MODEL = os.environ.get('DETECTOR_DEFAULT_MODEL') or 'yolov8n'
+    DETECTOR_MODEL_DIR = os.environ.get('DETECTOR_MODEL_DIR') or str(basedir)
+    DETECTOR_MAX_RESIDENT_MODELS = int(os.environ.get('DETECTOR_MAX_RESIDENT_MODELS') or 2)
+    DETECTOR_MODEL_MEMORY_BUDGET_MB = int(os.environ.get('DETECTOR_MODEL_MEMORY_BUDGET_MB') or 0)
+
+    # 検知モデルの事前ロード（off / boot / fork / worker。詳細は apps/detector/warmup.py）
+    DETECTOR_PRELOAD_MODEL = os.environ.get('DETECTOR_PRELOAD_MODEL') or 'off'
+
+    # 推論スレッド設定（0 は自動）。DETECTOR_CORE_BUDGET はプロセスあたりのコア数で、
+    # 複数ワーカープロセス構成では「コア数 / プロセス数」を目安に設定する
+    DETECTOR_TORCH_INTRA_OP_THREADS = int(os.environ.get('DETECTOR_TORCH_INTRA_OP_THREADS') or 0)
+    DETECTOR_TORCH_INTER_OP_THREADS = int(os.environ.get('DETECTOR_TORCH_INTER_OP_THREADS') or 0)
+    DETECTOR_CORE_BUDGET = int(os.environ.get('DETECTOR_CORE_BUDGET') or 0)
+    DETECTOR_CPU_AFFINITY = os.environ.get('DETECTOR_CPU_AFFINITY', 'false').lower() in ['true', 'on', '1']
+
+    # 推論バッチ設定（最大件数 / 最大待ち時間ms。件数1でバッチ無効）
+    DETECTOR_BATCH_MAX_SIZE = int(os.environ.get('DETECTOR_BATCH_MAX_SIZE') or 8)
+    DETECTOR_BATCH_MAX_WAIT_MS = int(os.environ.get('DETECTOR_BATCH_MAX_WAIT_MS') or 20)
+
+    # 推論前に縮小デコード + レターボックスする（元画像の原寸展開を避ける）
+    DETECTOR_PREPROCESS_DOWNSCALE = os.environ.get('DETECTOR_PREPROCESS_DOWNSCALE', 'true').lower() in ['true', 'on', '1']
+
+    # タイル分割推論（/detector/api/detect に tiled=true で opt-in）
+    DETECTOR_TILE_SIZE = int(os.environ.get('DETECTOR_TILE_SIZE') or 640)
+    DETECTOR_TILE_OVERLAP = float(os.environ.get('DETECTOR_TILE_OVERLAP') or 0.2)
+    DETECTOR_TILE_MAX_SIDE = int(os.environ.get('DETECTOR_TILE_MAX_SIDE') or 4096)
+
+    # ギャラリーの1ページあたり件数（キーセットページング）
+    DETECTOR_GALLERY_PAGE_SIZE = int(os.environ.get('DETECTOR_GALLERY_PAGE_SIZE') or 24)
+
+    # ギャラリー用サムネイル（1xの長辺px。2xはその倍）
+    DETECTOR_THUMB_FOLDER = str(basedir / 'apps' / 'detector' / 'thumbs')
+    DETECTOR_THUMB_SIZE = int(os.environ.get('DETECTOR_THUMB_SIZE') or 320)
+
+    # アップロード画像の配信。DETECTOR_IMAGE_SENDFILE_MODE は off / x-sendfile / x-accel
+    # （x-accel は nginx の internal location を DETECTOR_IMAGE_ACCEL_PREFIX に用意する。apps/detector/serving.py 参照）
+    DETECTOR_IMAGE_SENDFILE_MODE = os.environ.get('DETECTOR_IMAGE_SENDFILE_MODE') or 'off'
+    DETECTOR_IMAGE_ACCEL_PREFIX = os.environ.get('DETECTOR_IMAGE_ACCEL_PREFIX') or '/_protected/detector-images/'
+    DETECTOR_IMAGE_MAX_AGE = int(os.environ.get('DETECTOR_IMAGE_MAX_AGE') or 31536000)
+    # 画像の所有者確認結果のキャッシュ（秒。0で無効）と最大件数
+    DETECTOR_OWNERSHIP_CACHE_TTL = int(os.environ.get('DETECTOR_OWNERSHIP_CACHE_TTL') or 30)
+    DETECTOR_OWNERSHIP_CACHE_SIZE = int(os.environ.get('DETECTOR_OWNERSHIP_CACHE_SIZE') or 10000)
+
+    # 類似画像（再エンコード・縮小）とみなす知覚ハッシュのハミング距離（0で無効、最大7）
+    DETECTOR_NEAR_DUPLICATE_DISTANCE = min(int(os.environ.get('DETECTOR_NEAR_DUPLICATE_DISTANCE') or 5), 7)
+    # 類似画像索引を DB から作り直す間隔（秒。後付けのハッシュ・他プロセスでの削除を反映。0で作り直さない）
+    DETECTOR_NEAR_DUPLICATE_REFRESH = int(os.environ.get('DETECTOR_NEAR_DUPLICATE_REFRESH') or 300)
+
+    # 動画・アニメーションGIFのフレーム検知（/detector/video）。アップロード上限・推論するフレームの間隔・
+    # 1本あたりの最大推論フレーム数・未完了の動画を残す秒数
+    DETECTOR_VIDEO_FOLDER = str(basedir / 'apps' / 'detector' / 'videos')
+    DETECTOR_VIDEO_MAX_CONTENT_LENGTH = int(os.environ.get('DETECTOR_VIDEO_MAX_CONTENT_LENGTH') or 256 * 1024 * 1024)
+    DETECTOR_VIDEO_FRAME_STRIDE = int(os.environ.get('DETECTOR_VIDEO_FRAME_STRIDE') or 5)
+    DETECTOR_VIDEO_MAX_FRAMES = int(os.environ.get('DETECTOR_VIDEO_MAX_FRAMES') or 600)
+    DETECTOR_VIDEO_TTL = int(os.environ.get('DETECTOR_VIDEO_TTL') or 3600)
+
+    # 検知結果サイドカーJSON（画像ID別に2段のサブディレクトリへ分散）
+    DETECTOR_RESULT_FOLDER = str(basedir / 'apps' / 'detector' / 'results')
+
+    # 検知結果キャッシュ（画像内容ハッシュ + モデル + 推論パラメータがキー、LRUで上限管理）
+    DETECTOR_CACHE_FOLDER = str(basedir / 'apps' / 'detector' / 'cache')
+    DETECTOR_CACHE_MAX_BYTES = int(os.environ.get('DETECTOR_CACHE_MAX_BYTES') or 64 * 1024 * 1024)
     
     # メール設定
     MAIL_SERVER = os.environ.get('MAIL_SERVER')
@@ -0,0 +1,112 @@
+"""
+pytest の共通フィクスチャ
+
+テスト用アプリは一時ディレクトリ配下に画像・結果・サムネイル等を保存し、
+一時ファイルの SQLite を使います。推論は ``fake_model`` で決まった結果を返すモデルに差し替えます。
+"""
+
+import numpy as np
+import pytest
+from flask import g
+
+import config
+from app import create_app
+from apps.models.model import User, db
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # create_app のログファイルを一時ディレクトリに出す
+    # 検知ワーカー等の別スレッドからも使うため、接続を共有するインメモリではなくファイルにする
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'test.sqlite'}")
+    app = create_app('testing')
+    app.config.update(
+        DETECTOR_UPLOAD_FOLDER=str(tmp_path / 'uploads'),
+        DETECTOR_RESULT_FOLDER=str(tmp_path / 'results'),
+        DETECTOR_THUMB_FOLDER=str(tmp_path / 'thumbs'),
+        DETECTOR_VIDEO_FOLDER=str(tmp_path / 'videos'),
+        DETECTOR_CACHE_FOLDER=None,
+    )
+    # 下のアプリコンテキストはリクエスト間で共有されるため、Flask-Login が g に保持した
+    # ログインユーザーをリクエストごとに捨てる（複数クライアントで別ユーザーを使えるように）
+    @app.before_request
+    def _forget_login_user():
+        g.pop('_login_user', None)
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def make_user(app):
+    """ユーザーを作成する関数"""
+    def make(name='alice'):
+        user = User(username=name, email=f'{name}@example.com')
+        user.set_password('password123')
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def login():
+    """テストクライアントをユーザーでログイン状態にする関数"""
+    def do(client, user):
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user.id)
+            sess['_fresh'] = True
+        return client
+    return do
+
+
+class _Boxes:
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.conf = np.asarray(conf, dtype=np.float32)
+        self.cls = np.asarray(cls, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.xyxy)
+
+
+class _Result:
+    def __init__(self, boxes, names):
+        self.boxes = boxes
+        self.names = names
+
+
+class FakeYOLO:
+    """画像中央の 1/4 に 'dog' を1つ検出する推論モデルの代わり（fail=True で推論が例外になる）"""
+
+    names = {0: 'person', 1: 'dog'}
+
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+
+    def predict(self, images, **kwargs):
+        if self.fail:
+            raise RuntimeError('inference failed')
+        self.calls.append(len(images))
+        results = []
+        for image in images:
+            w, h = image.size
+            results.append(_Result(_Boxes([[w / 4, h / 4, 3 * w / 4, 3 * h / 4]], [0.9], [1]), self.names))
+        return results
+
+
+@pytest.fixture
+def fake_model(app, tmp_path, monkeypatch):
+    """既定モデルの重みファイルを置き、モデルの読み込みを FakeYOLO に差し替える"""
+    from apps.detector import routes
+
+    model_dir = tmp_path / 'models'
+    model_dir.mkdir()
+    (model_dir / f'{routes.default_model_id()}.pt').write_bytes(b'weights-v1')
+    app.config['DETECTOR_MODEL_DIR'] = str(model_dir)
+    model = FakeYOLO()
+    monkeypatch.setattr(routes, '_load_yolo_model', lambda model_id: model)
+    return model
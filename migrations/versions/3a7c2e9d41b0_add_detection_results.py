@@ -0,0 +1,64 @@
+"""Add detection_results and detections tables
+
+Revision ID: 3a7c2e9d41b0
+Revises: fd160c6c9b0b
+Create Date: 2026-10-18 10:00:00.000000
+
+既存のサイドカーJSONは upgrade 後に
+``flask --app run detector import-sidecars`` で取り込みます。
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a7c2e9d41b0'
+down_revision = 'fd160c6c9b0b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('detection_results',
+    sa.Column('id', sa.Integer(), nullable=False, comment='検知結果ID（主キー）'),
+    sa.Column('image_id', sa.Integer(), nullable=False, comment='画像ID（外部キー）'),
+    sa.Column('user_id', sa.Integer(), nullable=False, comment='ユーザーID（外部キー）'),
+    sa.Column('model', sa.String(length=64), nullable=True, comment='使用モデル'),
+    sa.Column('count', sa.Integer(), nullable=False, comment='検出件数'),
+    sa.Column('class_counts', sa.JSON(), nullable=True, comment='クラス別件数'),
+    sa.Column('updated_at', sa.DateTime(), nullable=True, comment='検知日時'),
+    sa.ForeignKeyConstraint(['image_id'], ['user_images.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('image_id')
+    )
+    with op.batch_alter_table('detection_results', schema=None) as batch_op:
+        batch_op.create_index('ix_detection_results_user_updated', ['user_id', 'updated_at'], unique=False)
+
+    op.create_table('detections',
+    sa.Column('id', sa.Integer(), nullable=False, comment='検出ID（主キー）'),
+    sa.Column('result_id', sa.Integer(), nullable=False, comment='検知結果ID（外部キー）'),
+    sa.Column('class_name', sa.String(length=64), nullable=False, comment='クラス名'),
+    sa.Column('confidence', sa.Float(), nullable=False, comment='信頼度'),
+    sa.Column('x', sa.Integer(), nullable=True, comment='領域X'),
+    sa.Column('y', sa.Integer(), nullable=True, comment='領域Y'),
+    sa.Column('width', sa.Integer(), nullable=True, comment='領域幅'),
+    sa.Column('height', sa.Integer(), nullable=True, comment='領域高さ'),
+    sa.ForeignKeyConstraint(['result_id'], ['detection_results.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('detections', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_detections_class_name'), ['class_name'], unique=False)
+        batch_op.create_index(batch_op.f('ix_detections_result_id'), ['result_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('detections', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_detections_result_id'))
+        batch_op.drop_index(batch_op.f('ix_detections_class_name'))
+
+    op.drop_table('detections')
+    with op.batch_alter_table('detection_results', schema=None) as batch_op:
+        batch_op.drop_index('ix_detection_results_user_updated')
+
+    op.drop_table('detection_results')
@@ -0,0 +1,26 @@
+"""Add composite index for keyset-paginated gallery
+
+Revision ID: 8b1f04c6d2e7
+Revises: 3a7c2e9d41b0
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1f04c6d2e7'
+down_revision = '3a7c2e9d41b0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_images', schema=None) as batch_op:
+        batch_op.create_index('ix_user_images_gallery', ['user_id', 'is_active', 'uploaded_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_images', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_images_gallery')
@@ -0,0 +1,31 @@
+"""Add perceptual hash and near-duplicate link to user_images
+
+Revision ID: a6c1e4f9b305
+Revises: f5b3d8e1a274
+Create Date: 2026-10-18 17:00:00.000000
+
+既存画像の知覚ハッシュは ``flask --app run detector backfill-phash`` で計算します。
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c1e4f9b305'
+down_revision = 'f5b3d8e1a274'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('perceptual_hash', sa.String(length=16), nullable=True, comment='知覚ハッシュ（64bit dHash の16進）'))
+        batch_op.add_column(sa.Column('duplicate_of_id', sa.Integer(), nullable=True, comment='ほぼ重複と判定された元画像ID'))
+        batch_op.create_foreign_key('fk_user_images_duplicate_of_id', 'user_images', ['duplicate_of_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('user_images', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_user_images_duplicate_of_id', type_='foreignkey')
+        batch_op.drop_column('duplicate_of_id')
+        batch_op.drop_column('perceptual_hash')
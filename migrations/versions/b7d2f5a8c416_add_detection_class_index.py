@@ -0,0 +1,48 @@
+"""Add detection_class_index (class label inverted index)
+
+Revision ID: b7d2f5a8c416
+Revises: a6c1e4f9b305
+Create Date: 2026-10-18 18:00:00.000000
+
+既存の検出（detections）から索引を作成します。
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2f5a8c416'
+down_revision = 'a6c1e4f9b305'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('detection_class_index',
+    sa.Column('result_id', sa.Integer(), nullable=False, comment='検知結果ID（外部キー）'),
+    sa.Column('class_name', sa.String(length=64), nullable=False, comment='クラス名'),
+    sa.Column('image_id', sa.Integer(), nullable=False, comment='画像ID（外部キー）'),
+    sa.Column('user_id', sa.Integer(), nullable=False, comment='ユーザーID（外部キー）'),
+    sa.Column('max_confidence', sa.Float(), nullable=False, comment='最大信頼度'),
+    sa.Column('count', sa.Integer(), nullable=False, comment='検出件数'),
+    sa.ForeignKeyConstraint(['image_id'], ['user_images.id'], ),
+    sa.ForeignKeyConstraint(['result_id'], ['detection_results.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('result_id', 'class_name')
+    )
+    with op.batch_alter_table('detection_class_index', schema=None) as batch_op:
+        batch_op.create_index('ix_detection_class_index_lookup', ['user_id', 'class_name', 'image_id', 'max_confidence'], unique=False)
+
+    op.execute(
+        'INSERT INTO detection_class_index (result_id, class_name, image_id, user_id, max_confidence, count) '
+        'SELECT r.id, d.class_name, r.image_id, r.user_id, MAX(d.confidence), COUNT(*) '
+        'FROM detections d JOIN detection_results r ON r.id = d.result_id '
+        'GROUP BY r.id, d.class_name, r.image_id, r.user_id'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('detection_class_index', schema=None) as batch_op:
+        batch_op.drop_index('ix_detection_class_index_lookup')
+
+    op.drop_table('detection_class_index')
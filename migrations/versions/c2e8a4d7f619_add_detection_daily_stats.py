@@ -0,0 +1,41 @@
+"""Add detection_daily_stats (incremental analytics aggregates)
+
+Revision ID: c2e8a4d7f619
+Revises: b7d2f5a8c416
+Create Date: 2026-10-18 19:00:00.000000
+
+既存の検知結果からの集計は ``flask --app run detector rebuild-analytics`` で作成します。
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2e8a4d7f619'
+down_revision = 'b7d2f5a8c416'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('detection_daily_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False, comment='ユーザーID（外部キー）'),
+    sa.Column('day', sa.Date(), nullable=False, comment='検知日（UTC）'),
+    sa.Column('class_name', sa.String(length=64), nullable=False, comment="クラス名（'*' は全クラス合計）"),
+    sa.Column('images', sa.Integer(), nullable=False, comment='クラスが写っている画像数'),
+    sa.Column('detections', sa.Integer(), nullable=False, comment='検出件数'),
+    sa.Column('confidence_sum', sa.Float(), nullable=False, comment='信頼度の合計'),
+    *[sa.Column(f'bin_{i}', sa.Integer(), nullable=False, comment=f'信頼度{i / 10:.1f}〜{(i + 1) / 10:.1f}の件数')
+      for i in range(10)],
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day', 'class_name')
+    )
+    with op.batch_alter_table('detection_daily_stats', schema=None) as batch_op:
+        batch_op.create_index('ix_detection_daily_stats_day', ['day', 'class_name'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('detection_daily_stats', schema=None) as batch_op:
+        batch_op.drop_index('ix_detection_daily_stats_day')
+
+    op.drop_table('detection_daily_stats')
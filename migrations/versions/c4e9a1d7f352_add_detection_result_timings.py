@@ -0,0 +1,26 @@
+"""Add per-stage timings to detection_results
+
+Revision ID: c4e9a1d7f352
+Revises: 8b1f04c6d2e7
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e9a1d7f352'
+down_revision = '8b1f04c6d2e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('detection_results', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('timings', sa.JSON(), nullable=True, comment='ステージ別処理時間（ms）'))
+
+
+def downgrade():
+    with op.batch_alter_table('detection_results', schema=None) as batch_op:
+        batch_op.drop_column('timings')
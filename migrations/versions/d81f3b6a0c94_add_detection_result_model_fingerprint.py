@@ -0,0 +1,28 @@
+"""Add model fingerprint to detection_results
+
+Revision ID: d81f3b6a0c94
+Revises: c4e9a1d7f352
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81f3b6a0c94'
+down_revision = 'c4e9a1d7f352'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('detection_results', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('model_fingerprint', sa.String(length=64), nullable=True, comment='モデル指紋（重みハッシュ + 推論パラメータ）'))
+        batch_op.create_index(batch_op.f('ix_detection_results_model_fingerprint'), ['model_fingerprint'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('detection_results', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_detection_results_model_fingerprint'))
+        batch_op.drop_column('model_fingerprint')
@@ -0,0 +1,36 @@
+"""Add content hash and image metadata to user_images
+
+Revision ID: e2a7c95b8f16
+Revises: d81f3b6a0c94
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c95b8f16'
+down_revision = 'd81f3b6a0c94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True, comment='画像内容のSHA-256'))
+        batch_op.add_column(sa.Column('image_format', sa.String(length=16), nullable=True, comment='画像形式（JPEG / PNG など）'))
+        batch_op.add_column(sa.Column('width', sa.Integer(), nullable=True, comment='画像幅'))
+        batch_op.add_column(sa.Column('height', sa.Integer(), nullable=True, comment='画像高さ'))
+        batch_op.add_column(sa.Column('file_size', sa.Integer(), nullable=True, comment='ファイルサイズ（バイト）'))
+        batch_op.create_index(batch_op.f('ix_user_images_content_hash'), ['content_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_images', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_images_content_hash'))
+        batch_op.drop_column('file_size')
+        batch_op.drop_column('height')
+        batch_op.drop_column('width')
+        batch_op.drop_column('image_format')
+        batch_op.drop_column('content_hash')
@@ -0,0 +1,32 @@
+"""Add image_blobs for content-addressed image storage
+
+Revision ID: f5b3d8e1a274
+Revises: e2a7c95b8f16
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5b3d8e1a274'
+down_revision = 'e2a7c95b8f16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 既存ファイルの移行は `flask --app run detector migrate-storage` で行う
+    op.create_table('image_blobs',
+    sa.Column('content_hash', sa.String(length=64), nullable=False, comment='画像内容のSHA-256（主キー）'),
+    sa.Column('path', sa.String(length=255), nullable=False, comment='保存先の相対パス'),
+    sa.Column('size', sa.Integer(), nullable=True, comment='ファイルサイズ（バイト）'),
+    sa.Column('refcount', sa.Integer(), nullable=False, comment='参照しているUserImage数'),
+    sa.Column('created_at', sa.DateTime(), nullable=True, comment='作成日時'),
+    sa.PrimaryKeyConstraint('content_hash')
+    )
+
+
+def downgrade():
+    op.drop_table('image_blobs')
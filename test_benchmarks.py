@@ -0,0 +1,61 @@
+"""
+ベンチマーク（benchmarks/）の合成コーパスと集計のテスト
+
+``python -m pytest test_benchmarks.py`` で実行します。
+"""
+
+import os
+import sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+import bench_detector  # noqa: E402
+from corpus import generate_corpus  # noqa: E402
+
+SIZES = [('a', 64, 48), ('b', 96, 32)]
+FORMATS = [('JPEG', 'jpg'), ('PNG', 'png')]
+
+
+def test_generate_corpus_sizes_and_formats(tmp_path):
+    entries = generate_corpus(str(tmp_path), sizes=SIZES, formats=FORMATS, per_combo=2)
+
+    assert len(entries) == 8
+    for e in entries:
+        with Image.open(e['path']) as img:
+            assert img.size == (e['width'], e['height'])
+            assert img.format == e['format']
+        assert e['bytes'] == os.path.getsize(e['path'])
+
+
+def test_generate_corpus_is_deterministic_and_reuses_files(tmp_path):
+    first = generate_corpus(str(tmp_path / 'x'), sizes=SIZES, formats=FORMATS, seed=7)
+    other = generate_corpus(str(tmp_path / 'y'), sizes=SIZES, formats=FORMATS, seed=7)
+    assert [open(e['path'], 'rb').read() for e in first] == [open(e['path'], 'rb').read() for e in other]
+
+    # 既存ファイルは上書きしない
+    marker = first[0]['path']
+    mtime = os.stat(marker).st_mtime_ns
+    again = generate_corpus(str(tmp_path / 'x'), sizes=SIZES, formats=FORMATS, seed=7)
+    assert os.stat(marker).st_mtime_ns == mtime
+    assert [e['bytes'] for e in again] == [e['bytes'] for e in first]
+
+
+def test_summary_nearest_rank_percentiles():
+    samples = [i / 1000 for i in range(100, 0, -1)]  # 1〜100 ms（逆順）
+
+    summary = bench_detector._summary(samples)
+
+    assert summary == {'n': 100, 'mean_ms': 50.5, 'p50_ms': 50.0, 'p95_ms': 95.0, 'max_ms': 100.0}
+    assert bench_detector._summary([]) is None
+    assert bench_detector._summary([0.003])['p95_ms'] == 3.0
+
+
+def test_bench_app_keeps_outputs_in_work_dir(tmp_path):
+    app, user_id = bench_detector.create_bench_app(str(tmp_path))
+
+    assert user_id
+    for key in ('DETECTOR_UPLOAD_FOLDER', 'DETECTOR_THUMB_FOLDER', 'DETECTOR_RESULT_FOLDER', 'DETECTOR_VIDEO_FOLDER'):
+        assert app.config[key].startswith(str(tmp_path))
+    assert app.config['DETECTOR_CACHE_FOLDER'] is None
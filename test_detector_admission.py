@@ -0,0 +1,106 @@
+"""
+検知リクエストの受付制御（AdmissionController）のテスト
+
+``python -m pytest test_detector_admission.py`` で実行します。
+"""
+
+import threading
+import time
+
+import pytest
+
+from apps.detector.admission import AdmissionController, AdmissionRejected
+
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, '条件を満たさないままタイムアウトしました'
+        time.sleep(0.005)
+
+
+def test_waiters_are_admitted_in_arrival_order():
+    controller = AdmissionController(max_concurrent=1, max_per_user=0, max_waiting=8, timeout=5)
+    started = controller.acquire()
+    order = []
+
+    def worker(name):
+        s = controller.acquire()
+        order.append(name)
+        controller.release(started=s)
+
+    threads = []
+    for i, name in enumerate('abc'):
+        t = threading.Thread(target=worker, args=(name,))
+        t.start()
+        threads.append(t)
+        # 到着順を確定させるため、待ち行列に入るまで待ってから次を起動する
+        _wait_until(lambda: controller.stats()['queue_depth'] == i + 1)
+    controller.release(started=started)
+    for t in threads:
+        t.join(2)
+
+    assert order == ['a', 'b', 'c']
+    stats = controller.stats()
+    assert stats['active'] == 0 and stats['queue_depth'] == 0 and stats['admitted'] == 4
+
+
+def test_user_limit_is_429():
+    controller = AdmissionController(max_concurrent=4, max_per_user=1, max_waiting=8, timeout=1)
+    with controller.slot(user_id=1):
+        with pytest.raises(AdmissionRejected) as e:
+            controller.acquire(user_id=1)
+        assert e.value.status == 429 and e.value.reason == 'user_limit'
+        # 別ユーザーは受け付ける
+        with controller.slot(user_id=2):
+            pass
+    # 終了後は同じユーザーも再び受け付ける
+    with controller.slot(user_id=1):
+        pass
+    assert controller.stats()['rejected']['user_limit'] == 1
+
+
+def test_queue_full_is_503_with_retry_after_from_service_time():
+    controller = AdmissionController(max_concurrent=2, max_per_user=0, max_waiting=0, timeout=1)
+    # 処理時間 約3.9 秒の実行を記録する（指数移動平均の初期値になる）
+    controller.release(started=controller.acquire() - 3.9)
+    first, second = controller.acquire(), controller.acquire()
+
+    with pytest.raises(AdmissionRejected) as e:
+        controller.acquire()
+
+    assert e.value.status == 503 and e.value.reason == 'queue_full'
+    # 待ち順1、同時実行数2 → ceil(3.9 * 1 / 2)
+    assert e.value.retry_after == 2
+    controller.release(started=first)
+    controller.release(started=second)
+
+
+def test_wait_timeout_is_503_and_releases_the_queue_position():
+    controller = AdmissionController(max_concurrent=1, max_per_user=2, max_waiting=4, timeout=0.05)
+    started = controller.acquire(user_id=1)
+
+    t0 = time.monotonic()
+    with pytest.raises(AdmissionRejected) as e:
+        controller.acquire(user_id=1)
+
+    assert time.monotonic() - t0 >= 0.05
+    assert e.value.status == 503 and e.value.reason == 'timeout'
+    assert e.value.retry_after >= 1
+    stats = controller.stats()
+    assert stats['queue_depth'] == 0 and stats['rejected']['timeout'] == 1
+    controller.release(user_id=1, started=started)
+    # 待機していた分のユーザー別カウントも戻っている（残っていれば2件目は 429 になる）
+    with controller.slot(user_id=1):
+        with pytest.raises(AdmissionRejected) as e:
+            controller.acquire(user_id=1)
+    assert e.value.reason == 'timeout'
+
+
+def test_release_on_exception_inside_slot():
+    controller = AdmissionController(max_concurrent=1, max_per_user=1, max_waiting=0, timeout=1)
+    with pytest.raises(ValueError):
+        with controller.slot(user_id=1):
+            raise ValueError('boom')
+    with controller.slot(user_id=1):
+        assert controller.stats()['active'] == 1
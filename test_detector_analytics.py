@@ -0,0 +1,105 @@
+"""
+検知結果の集計（detection_daily_stats の増分更新と rollup）のテスト
+
+``python -m pytest test_detector_analytics.py`` で実行します。
+"""
+
+import datetime
+
+import pytest
+
+from apps.detector import routes
+from apps.detector.analytics import TOTAL, apply_summary, rebuild, record_result, rollup, summarize
+from apps.models.model import DetectionDailyStat, UserImage, db
+
+
+def _det(name, confidence):
+    return {'class': name, 'confidence': confidence, 'bbox': {'x': 0, 'y': 0, 'width': 10, 'height': 10}}
+
+
+def _snapshot():
+    rows = db.session.query(DetectionDailyStat).all()
+    return {
+        (r.user_id, r.day, r.class_name): (r.images, r.detections, round(r.confidence_sum, 6),
+                                           tuple(getattr(r, f'bin_{i}') for i in range(10)))
+        for r in rows
+    }
+
+
+def test_summarize_counts_and_confidence_bins():
+    summary = summarize(['dog', 'dog', 'cat'], [0.95, 0.42, 1.0])
+
+    assert summary[TOTAL][:3].tolist() == [1, 3, pytest.approx(2.37)]
+    assert summary['dog'][:2].tolist() == [1, 2]
+    # 信頼度 1.0 は最後のビンに入る
+    assert summary['dog'][3:].tolist() == [0, 0, 0, 0, 1, 0, 0, 0, 0, 1]
+    assert summary['cat'][3:].tolist()[-1] == 1
+    assert set(summarize([], [])) == {TOTAL}
+
+
+def test_incremental_updates_match_rebuild(app, make_user, login):
+    user = make_user()
+    images = []
+    for i, results in enumerate([[_det('dog', 0.9)], [_det('dog', 0.5), _det('cat', 0.7)], []]):
+        image = UserImage(user_id=user.id, image_path=f'uploads/{i}.jpg', filename=f'{i}.jpg')
+        db.session.add(image)
+        db.session.commit()
+        routes.save_detection_results(image, results)
+        images.append(image)
+    # 再検知は旧結果の分を引いてから加算する
+    routes.save_detection_results(images[0], [_det('person', 0.3)])
+    # 削除は sign=-1 で取り消す
+    client = login(app.test_client(), user)
+    assert client.post(f'/detector/delete/{images[1].id}').status_code == 302
+
+    incremental = _snapshot()
+    day = datetime.datetime.utcnow().date()
+    assert incremental[(user.id, day, TOTAL)][:2] == (2, 1)
+    assert (user.id, day, 'dog') not in incremental  # 画像数が0になった行は消える
+
+    rebuild()
+    assert _snapshot() == incremental
+
+
+def test_decrement_without_row_is_ignored(app):
+    record_result(1, datetime.datetime(2024, 1, 1), ['dog'], [0.9], sign=-1)
+    db.session.commit()
+
+    assert _snapshot() == {}
+
+
+def test_rollup_day_and_week_buckets(app):
+    today = datetime.date(2024, 5, 15)  # 水曜日
+    for day, classes, confidences in [
+        (datetime.date(2024, 5, 15), ['dog', 'cat'], [0.9, 0.25]),
+        (datetime.date(2024, 5, 13), ['dog'], [0.55]),
+        (datetime.date(2024, 5, 10), ['dog'], [0.75]),
+        (datetime.date(2024, 4, 1), ['dog'], [0.5]),  # 期間外
+    ]:
+        apply_summary(1, day, summarize(classes, confidences))
+    apply_summary(2, today, summarize(['cat'], [0.95]))
+    db.session.commit()
+
+    daily = rollup(1, days=7, bucket='day', today=today)
+    assert daily['start'] == '2024-05-09' and len(daily['series']) == 7
+    assert [p['detections'] for p in daily['series']] == [0, 1, 0, 0, 1, 0, 2]
+    assert daily['totals'] == {'images': 3, 'detections': 4, 'mean_confidence': pytest.approx(0.6125)}
+    assert [(c['class'], c['detections']) for c in daily['classes']] == [('dog', 3), ('cat', 1)]
+    assert daily['class_series']['dog'] == [0, 1, 0, 0, 1, 0, 1]
+
+    # 週は月曜始まり（2024-05-09 を含む週 = 05-06 から）
+    weekly = rollup(1, days=7, bucket='week', today=today)
+    assert [p['period'] for p in weekly['series']] == ['2024-05-06', '2024-05-13']
+    assert [p['images'] for p in weekly['series']] == [1, 2]
+
+    site = rollup(None, days=7, today=today)
+    assert site['scope'] == 'site' and site['totals']['detections'] == 5
+
+
+def test_analytics_api_validates_period(app, make_user, login):
+    client = login(app.test_client(), make_user())
+
+    assert client.get('/detector/api/analytics?days=400').status_code == 400
+    assert client.get('/detector/api/analytics?bucket=month').status_code == 400
+    data = client.get('/detector/api/analytics?days=14&bucket=week').get_json()
+    assert data['success'] and data['scope'] == 'user' and data['bucket'] == 'week'
@@ -0,0 +1,74 @@
+"""
+推論バッチ処理（BatchPredictor）のテスト
+
+``python -m pytest test_detector_batching.py`` で実行します。
+"""
+
+import threading
+
+import pytest
+
+from apps.detector.batching import BatchPredictor
+
+
+def test_concurrent_requests_are_batched_and_results_routed():
+    calls = []
+
+    def predict_fn(items):
+        calls.append(list(items))
+        return [item * 10 for item in items]
+
+    # 待ち時間を長めにして、同時に届いた要求が1回にまとまるようにする
+    batcher = BatchPredictor(predict_fn, max_batch_size=4, max_wait=0.5)
+    results = {}
+
+    def call(i):
+        results[i] = batcher.predict(i, timeout=5)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    batcher.close()
+
+    assert results == {i: i * 10 for i in range(4)}
+    assert len(calls) == 1 and sorted(calls[0]) == [0, 1, 2, 3]
+    assert batcher.batches == 1 and batcher.items == 4
+
+
+def test_batches_are_split_at_max_size_and_keep_order():
+    calls = []
+
+    def predict_fn(items):
+        calls.append(len(items))
+        return [f'r{item}' for item in items]
+
+    batcher = BatchPredictor(predict_fn, max_batch_size=3, max_wait=0.2)
+
+    assert batcher.predict_many(range(7), timeout=5) == [f'r{i}' for i in range(7)]
+    batcher.close()
+    assert calls == [3, 3, 1]
+
+
+def test_errors_are_raised_to_every_caller_in_the_batch():
+    batcher = BatchPredictor(lambda items: items[:-1], max_batch_size=2, max_wait=0.2)
+    futures = [batcher.submit(i) for i in range(2)]
+
+    for fut in futures:
+        with pytest.raises(RuntimeError, match='batch size mismatch'):
+            fut.result(timeout=5)
+
+    # 失敗後もディスパッチャは動き続ける
+    batcher.predict_fn = lambda items: items
+    assert batcher.predict('x', timeout=5) == 'x'
+    batcher.close()
+
+
+def test_close_then_submit_restarts_dispatcher():
+    batcher = BatchPredictor(lambda items: items, max_wait=0)
+    assert batcher.predict(1, timeout=5) == 1
+    batcher.close()
+
+    assert batcher.predict(2, timeout=5) == 2
+    batcher.close()
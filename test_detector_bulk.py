@@ -0,0 +1,102 @@
+"""
+一括アップロード（BulkUploadTracker と /detector/api/upload/bulk）のテスト
+
+``python -m pytest test_detector_bulk.py`` で実行します。
+"""
+
+import io
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from apps.detector import routes
+from apps.detector.bulk import BulkUploadTracker
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, '条件を満たさないままタイムアウトしました'
+        time.sleep(0.01)
+
+
+def test_progress_counts_detected_reused_and_failed(app):
+    release = threading.Event()
+
+    def detect_one(image_id, model_id):
+        release.wait(2)
+        if image_id % 3 == 0:
+            raise RuntimeError('inference failed')
+        return 'reused' if image_id % 3 == 1 else 'detected'
+
+    tracker = BulkUploadTracker(app, detect_one, workers=2)
+    upload = tracker.start(1, range(1, 7), [{'name': 'notes.txt', 'reason': 'unsupported'}])
+    assert upload.to_dict()['status'] == 'stored' and upload.finished_at is None
+
+    release.set()
+    _wait_until(lambda: upload.finished_at is not None)
+
+    data = upload.to_dict()
+    assert (data['detected'], data['reused'], data['failed']) == (2, 2, 2)
+    assert upload.completed == 6
+    assert data['status'] == 'done' and data['progress'] == 1.0
+    assert data['total'] == 6 and len(data['rejected']) == 1
+    assert tracker.get(upload.id) is upload
+
+
+def test_empty_upload_is_done_immediately(app):
+    tracker = BulkUploadTracker(app, lambda image_id, model_id: 'detected')
+
+    upload = tracker.start(1, [], [{'name': 'a.txt', 'reason': 'unsupported'}])
+
+    assert upload.to_dict()['status'] == 'done'
+    assert upload.to_dict()['progress'] == 1.0
+
+
+def test_old_uploads_are_pruned(app):
+    tracker = BulkUploadTracker(app, lambda image_id, model_id: 'detected', keep=2)
+    uploads = [tracker.start(1, [], []) for _ in range(3)]
+
+    assert tracker.get(uploads[0].id) is None
+    assert tracker.get(uploads[2].id) is uploads[2]
+
+
+def _noise_png(seed):
+    # 類似画像として結果が再利用されないよう、画像ごとに異なるノイズにする
+    pixels = np.random.default_rng(seed).integers(0, 255, (48, 64, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def test_bulk_inference_shares_job_worker_limit(app, make_user, login, fake_model, monkeypatch):
+    app.config['DETECTOR_JOB_WORKERS'] = 2
+    lock = threading.Lock()
+    running = [0, 0]  # 実行中, 最大
+    detect = routes.simulate_object_detection
+
+    def slow_detect(*args, **kwargs):
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.05)
+        try:
+            return detect(*args, **kwargs)
+        finally:
+            with lock:
+                running[0] -= 1
+
+    monkeypatch.setattr(routes, 'simulate_object_detection', slow_detect)
+    client = login(app.test_client(), make_user())
+    files = [(io.BytesIO(_noise_png(i)), f'p{i}.png') for i in range(6)]
+
+    response = client.post('/detector/api/upload/bulk', data={'files': files}, content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    progress_url = response.get_json()['progress_url']
+    _wait_until(lambda: client.get(progress_url).get_json()['status'] == 'done')
+    data = client.get(progress_url).get_json()
+    assert (data['detected'], data['reused'], data['failed']) == (6, 0, 0)
+    assert running[1] <= 2
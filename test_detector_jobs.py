@@ -0,0 +1,147 @@
+"""
+物体検知ジョブキュー（DetectionJobQueue）と検知ページの受付制限のテスト
+
+``python -m pytest test_detector_jobs.py`` で実行します。
+"""
+
+import io
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from apps.detector import routes
+from apps.detector.jobs import DetectionJobQueue
+from apps.models.model import UserImage, db
+
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, '条件を満たさないままタイムアウトしました'
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def blocked():
+    """ジョブの処理を止めておくイベント（テスト終了時に解放する）"""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def test_submit_dedups_and_rejects_when_full(app, blocked):
+    started = threading.Event()
+
+    def handler(job):
+        started.set()
+        blocked.wait(2)
+        return {'count': 0}
+
+    jobs = DetectionJobQueue(app, handler, workers=1, max_queued=1)
+    running = jobs.submit(1, 10, 'a.jpg')
+    assert started.wait(2)
+    queued = jobs.submit(2, 10, 'b.jpg')
+
+    # 同じ画像の未完了ジョブは新たに登録しない。待機枠（1件）が埋まっていれば None
+    assert jobs.submit(2, 10, 'b.jpg') is queued
+    assert jobs.submit(3, 20, 'c.jpg') is None
+    assert jobs.pending(10) == 2 and jobs.pending(20) == 0
+    assert jobs.depth() == 1
+    assert jobs.estimated_wait() >= 1
+
+    blocked.set()
+    _wait_until(lambda: queued.is_finished)
+    assert running.status == queued.status == 'done'
+    assert jobs.pending(10) == 0
+
+
+def test_slot_is_shared_up_to_worker_count(app):
+    jobs = DetectionJobQueue(app, lambda job: None, workers=2)
+    entered = []
+
+    def take():
+        with jobs.slot():
+            entered.append(1)
+
+    with jobs.slot(), jobs.slot():
+        t = threading.Thread(target=take)
+        t.start()
+        time.sleep(0.05)
+        # ワーカー数（2）の枠がすべて使われている間は入れない
+        assert entered == []
+    t.join(2)
+    assert entered == [1]
+
+
+@pytest.fixture
+def page(app, make_user, login, monkeypatch, blocked):
+    """検知ジョブが完了しない状態の検知ページ用（ユーザー・画像2件・ログイン済みクライアント）"""
+    monkeypatch.setattr(routes, '_run_detection_job', lambda job: blocked.wait(5) and None)
+    user = make_user()
+    upload_dir = routes.ensure_upload_dirs()
+    images = []
+    for i in range(2):
+        name = f'p{i}.jpg'
+        Image.new('RGB', (64, 48), (i * 90, 40, 40)).save(os.path.join(upload_dir, name), 'JPEG')
+        image = UserImage(user_id=user.id, image_path=f'uploads/{name}', filename=name)
+        db.session.add(image)
+        db.session.commit()
+        images.append(image.id)
+    return login(app.test_client(), user), images
+
+
+def test_detect_post_over_user_limit_is_429(app, page):
+    app.config['DETECTOR_ADMISSION_MAX_PER_USER'] = 1
+    client, images = page
+
+    first = client.post(f'/detector/detect/{images[0]}')
+    assert first.status_code == 302
+    # 同じ画像の再送信は実行中のジョブに合流する
+    assert client.post(f'/detector/detect/{images[0]}').status_code == 302
+
+    response = client.post(f'/detector/detect/{images[1]}')
+
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_detect_post_with_full_queue_is_503(app, page):
+    app.config.update(DETECTOR_ADMISSION_MAX_PER_USER=0, DETECTOR_JOB_WORKERS=1, DETECTOR_JOB_QUEUE_SIZE=1)
+    client, images = page
+    jobs = routes.get_job_queue(app, routes._run_detection_job)
+    # 実行中1件 + 待機1件で満杯にする
+    jobs.submit(1000, 999, 'other.jpg')
+    _wait_until(lambda: jobs.depth() == 0)
+    assert client.post(f'/detector/detect/{images[0]}').status_code == 302
+
+    response = client.post(f'/detector/detect/{images[1]}')
+
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_upload_enqueues_detection_and_job_status_api(app, make_user, login, fake_model):
+    alice, bob = make_user('alice'), make_user('bob')
+    client = login(app.test_client(), alice)
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 48), (200, 30, 30)).save(buf, 'PNG')
+
+    response = client.post('/detector/upload', data={'file': (io.BytesIO(buf.getvalue()), 'a.png')},
+                           content_type='multipart/form-data')
+
+    # 推論を待たずに検知ページへリダイレクトし、検知はワーカーで進む
+    assert response.status_code == 302 and '/detector/detect/' in response.headers['Location']
+    image = UserImage.query.filter_by(user_id=alice.id).one()
+    jobs = routes.detection_job_queue()
+    job = jobs.find_active(image.id) or jobs.submit(image.id, alice.id, image.filename)
+    _wait_until(lambda: job.is_finished)
+
+    status = client.get(f'/detector/api/jobs/{job.id}').get_json()
+    assert status['status'] == 'done' and status['detection_count'] == 1
+    assert [r['class'] for r in routes.load_detection_results(image)['results']] == ['dog']
+    # 他のユーザーのジョブは見えない
+    other = login(app.test_client(), bob)
+    assert other.get(f'/detector/api/jobs/{job.id}').status_code == 404
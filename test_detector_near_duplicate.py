@@ -0,0 +1,150 @@
+"""
+ほぼ重複の画像の検知結果の再利用のテスト
+
+``python -m pytest test_detector_near_duplicate.py`` で実行します。
+"""
+
+import datetime
+import os
+
+import pytest
+from PIL import Image
+
+from app import create_app
+from apps.detector import routes
+from apps.models.model import User, UserImage, db
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # create_app のログファイルを一時ディレクトリに出す
+    app = create_app('testing')
+    app.config.update(
+        DETECTOR_UPLOAD_FOLDER=str(tmp_path / 'uploads'),
+        DETECTOR_RESULT_FOLDER=str(tmp_path / 'results'),
+    )
+    # 重みファイルなしでも現在のモデル指紋があるものとして扱う
+    monkeypatch.setattr(routes, 'model_fingerprint', lambda model_id=None, tiled=False: 'test-fingerprint')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def _user(name):
+    user = User(username=name, email=f'{name}@example.com')
+    user.set_password('password123')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def _image(user, content_hash, size=(200, 100), **kwargs):
+    image = UserImage(user_id=user.id, image_path=f'{content_hash}.jpg', filename=f'{content_hash}.jpg',
+                      content_hash=content_hash, width=size[0], height=size[1], **kwargs)
+    db.session.add(image)
+    db.session.commit()
+    return image
+
+
+def _detect(image):
+    results = [{'class': 'dog', 'confidence': 0.9, 'bbox': {'x': 10, 'y': 20, 'width': 50, 'height': 40}}]
+    routes.save_detection_results(image, results, model_id=routes.default_model_id())
+
+
+def test_reuses_own_near_duplicate(app):
+    alice = _user('alice')
+    source = _image(alice, 'a' * 64)
+    _detect(source)
+    target = _image(alice, 'b' * 64, size=(400, 200))
+
+    payload = routes.reuse_near_duplicate_results(target, [(3, source.id, alice.id)])
+
+    assert payload is not None
+    assert payload['results'][0]['bbox'] == {'x': 20, 'y': 40, 'width': 100, 'height': 80}
+
+
+def test_does_not_reuse_other_users_near_duplicate(app):
+    alice, bob = _user('alice'), _user('bob')
+    source = _image(alice, 'a' * 64)
+    _detect(source)
+    target = _image(bob, 'b' * 64)
+
+    assert routes.reuse_near_duplicate_results(target, [(3, source.id, alice.id)]) is None
+    assert routes.load_detection_results(target) is None
+
+
+def test_reuses_other_users_identical_content(app):
+    alice, bob = _user('alice'), _user('bob')
+    source = _image(alice, 'a' * 64)
+    _detect(source)
+    target = _image(bob, 'a' * 64)
+
+    payload = routes.reuse_near_duplicate_results(target, [(0, source.id, alice.id)])
+
+    assert payload is not None
+    assert [r['class'] for r in payload['results']] == ['dog']
+
+
+def test_backfill_keeps_uploaded_at(app):
+    """知覚ハッシュの後付け・重複の関連付けでアップロード日時を書き換えない"""
+    alice = _user('alice')
+    uploaded_at = datetime.datetime(2020, 1, 1, 12, 0, 0)
+    os.makedirs(app.config['DETECTOR_UPLOAD_FOLDER'], exist_ok=True)
+    images = []
+    for i, content_hash in enumerate(['a' * 64, 'b' * 64]):
+        image = _image(alice, content_hash, uploaded_at=uploaded_at + datetime.timedelta(days=i))
+        # 同じ絵柄（横グラデーション）のため知覚ハッシュが一致する
+        gradient = Image.linear_gradient('L').rotate(90).resize((200, 100)).convert('RGB')
+        gradient.save(os.path.join(app.config['DETECTOR_UPLOAD_FOLDER'], image.filename), 'JPEG', quality=90 - i * 30)
+        images.append(image.id)
+
+    result = app.test_cli_runner().invoke(args=['detector', 'backfill-phash'])
+
+    assert result.exit_code == 0, result.output
+    db.session.expire_all()
+    first, second = (db.session.get(UserImage, image_id) for image_id in images)
+    assert first.perceptual_hash and second.perceptual_hash
+    assert second.duplicate_of_id == first.id
+    assert first.uploaded_at == uploaded_at
+    assert second.uploaded_at == uploaded_at + datetime.timedelta(days=1)
+
+
+def test_refresh_index_picks_up_backfilled_and_drops_deleted(app):
+    """作り直しで既存画像への後付けのハッシュと削除を反映する"""
+    from apps.detector.phash import NearDuplicateIndex, refresh_index
+
+    alice = _user('alice')
+    old = _image(alice, 'a' * 64)
+    deleted = _image(alice, 'b' * 64, perceptual_hash='00000000000000ff')
+    index = refresh_index(NearDuplicateIndex())
+    assert index.query(0xff, 0) == [(0, deleted.id, alice.id)]
+
+    # 他プロセスでの後付けのハッシュと削除
+    old.update_columns(perceptual_hash='0000000000000fff')
+    deleted.update_columns(is_active=False)
+    db.session.commit()
+    assert index.query(0xfff, 0) == []
+    refresh_index(index, max_age=0)
+
+    assert index.query(0xfff, 0) == [(0, old.id, alice.id)]
+    assert index.query(0xff, 0) == []
+
+
+def test_duplicate_of_skips_deactivated_image(app):
+    """索引に残っている削除済みの画像を duplicate_of_id に設定しない"""
+    alice = _user('alice')
+    deleted = _image(alice, 'a' * 64, perceptual_hash='00000000000000ff')
+    kept = _image(alice, 'b' * 64, perceptual_hash='00000000000001ff')
+    routes.find_near_duplicates(kept)
+    assert kept.duplicate_of_id == deleted.id
+    kept.update_columns(duplicate_of_id=None)
+    # 別プロセスで削除された（この索引にはまだ残っている）
+    deleted.update_columns(is_active=False)
+    db.session.commit()
+    target = _image(alice, 'c' * 64, perceptual_hash='00000000000000ff')
+
+    matches = routes.find_near_duplicates(target)
+
+    assert [image_id for _distance, image_id, _owner in matches] == [kept.id]
+    assert target.duplicate_of_id == kept.id
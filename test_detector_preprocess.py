@@ -0,0 +1,90 @@
+"""
+物体検知の推論前処理（縮小デコード）のテスト
+
+``python -m pytest test_detector_preprocess.py`` で実行します。
+"""
+
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from apps.detector.preprocess import decode_reduced, letterbox, load_for_inference, scale_boxes_to_original
+
+
+def _encode(img, fmt):
+    buf = io.BytesIO()
+    img.save(buf, fmt)
+    buf.seek(0)
+    return buf
+
+
+@pytest.mark.parametrize('mode, fmt', [
+    ('P', 'GIF'),
+    ('P', 'PNG'),
+    ('1', 'PNG'),
+    ('I;16', 'PNG'),
+    ('RGBA', 'PNG'),
+    ('L', 'BMP'),
+])
+def test_decode_reduced_large_non_rgb(mode, fmt):
+    """パレット・1bit・16bit などの大きな画像も縮小デコードできる"""
+    src = Image.new('RGB', (2000, 1500), (200, 40, 40))
+    if mode == 'P':
+        src = src.convert('P')
+    elif mode != 'RGB':
+        src = src.convert('L').convert(mode) if mode == 'I;16' else src.convert(mode)
+    img, orig_size = decode_reduced(_encode(src, fmt), 640)
+    assert orig_size == (2000, 1500)
+    assert img.mode == 'RGB'
+    assert max(img.size) >= 640
+
+
+def test_load_for_inference_palette_gif():
+    """タイル推論と同じ経路（縮小デコード + レターボックス）でもパレット GIF を扱える"""
+    src = Image.new('RGB', (2000, 1500), (10, 120, 10)).convert('P')
+    img, meta = load_for_inference(_encode(src, 'GIF'), 640)
+    assert img.size == (640, 640)
+    assert (meta.orig_width, meta.orig_height) == (2000, 1500)
+
+
+def test_decode_reduced_jpeg_uses_dct_scaling():
+    """JPEG は長辺が target を下回らない最大の 1/2^n でデコードされる"""
+    src = Image.new('RGB', (4000, 3000), (30, 60, 90))
+    img, orig_size = decode_reduced(_encode(src, 'JPEG'), 640)
+    assert orig_size == (4000, 3000)
+    assert img.size == (1000, 750)
+
+
+def test_decode_reduced_keeps_small_images():
+    src = Image.new('RGB', (320, 200), (30, 60, 90))
+    img, orig_size = decode_reduced(_encode(src, 'PNG'), 640)
+    assert img.size == orig_size == (320, 200)
+
+
+@pytest.mark.parametrize('orig_size, fmt', [
+    ((4000, 3000), 'JPEG'),
+    ((1500, 2000), 'PNG'),
+    ((320, 200), 'PNG'),
+])
+def test_letterbox_boxes_round_trip_to_original(orig_size, fmt):
+    """レターボックス座標の枠を元画像座標に戻すと、元の位置と一致する"""
+    img, meta = load_for_inference(_encode(Image.new('RGB', orig_size), fmt), 640)
+    w, h = orig_size
+    original = np.array([[w * 0.25, h * 0.25, w * 0.75, h * 0.75]], dtype=np.float32)
+    boxed = original.copy()
+    boxed[:, [0, 2]] = boxed[:, [0, 2]] * meta.scale + meta.pad_x
+    boxed[:, [1, 3]] = boxed[:, [1, 3]] * meta.scale + meta.pad_y
+
+    assert img.size == (640, 640)
+    np.testing.assert_allclose(scale_boxes_to_original(boxed, meta), original, rtol=1e-4)
+
+
+def test_scale_boxes_clips_padding_to_image():
+    img, meta = letterbox(Image.new('RGB', (640, 320)), (1280, 640), 640)
+    assert (meta.pad_x, meta.pad_y, meta.scale) == (0, 160, 0.5)
+
+    boxes = scale_boxes_to_original([[-10, 0, 700, 640]], meta)
+
+    np.testing.assert_allclose(boxes, [[0, 0, 1280, 640]])
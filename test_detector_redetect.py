@@ -0,0 +1,82 @@
+"""
+古い検知結果の再検知（flask detector redetect-stale）のテスト
+
+``python -m pytest test_detector_redetect.py`` で実行します。
+"""
+
+import json
+import os
+
+import pytest
+from PIL import Image
+
+from apps.detector import routes
+from apps.models.model import UserImage, db
+
+
+@pytest.fixture
+def images(app, make_user, fake_model):
+    """検知済みの画像2件（その後で重みを更新し、結果を古くする）"""
+    user = make_user()
+    upload_dir = routes.ensure_upload_dirs()
+    ids = []
+    for i in range(2):
+        name = f'p{i}.jpg'
+        Image.new('RGB', (200 + i, 100), (i * 40, 80, 120)).save(os.path.join(upload_dir, name), 'JPEG')
+        image = UserImage(user_id=user.id, image_path=f'uploads/{name}', filename=name)
+        db.session.add(image)
+        db.session.commit()
+        routes.save_detection_results(image, routes.simulate_object_detection(name))
+        ids.append(image.id)
+    weights = os.path.join(app.config['DETECTOR_MODEL_DIR'], f'{routes.default_model_id()}.pt')
+    with open(weights, 'wb') as f:
+        f.write(b'weights-v2')
+    return ids
+
+
+def _redetect(app, tmp_path):
+    checkpoint = tmp_path / 'checkpoint.json'
+    result = app.test_cli_runner().invoke(args=['detector', 'redetect-stale', '--checkpoint', str(checkpoint)])
+    assert result.exit_code == 0, result.output
+    db.session.expire_all()
+    return json.loads(checkpoint.read_text(encoding='utf-8'))
+
+
+def _saved(image_id):
+    return routes.load_detection_results(db.session.get(UserImage, image_id))
+
+
+def test_redetect_updates_stale_results(app, tmp_path, images):
+    old = _saved(images[0])['model_fingerprint']
+
+    checkpoint = _redetect(app, tmp_path)
+
+    assert checkpoint['failed'] == []
+    assert {_saved(image_id)['model_fingerprint'] for image_id in images} == {routes.model_fingerprint()}
+    assert routes.model_fingerprint() != old
+
+
+def test_redetect_does_not_save_fallback_results(app, tmp_path, images, fake_model):
+    before = _saved(images[0])
+    fake_model.fail = True
+
+    checkpoint = _redetect(app, tmp_path)
+
+    assert sorted(checkpoint['failed']) == images
+    after = _saved(images[0])
+    assert after['model_fingerprint'] == before['model_fingerprint']
+    assert after['results'] == before['results']
+
+
+def test_redetect_records_missing_file_as_failed(app, tmp_path, images):
+    missing = db.session.get(UserImage, images[0])
+    before = _saved(missing.id)
+    os.remove(os.path.join(routes.ensure_upload_dirs(), missing.filename))
+
+    checkpoint = _redetect(app, tmp_path)
+
+    assert checkpoint['failed'] == [missing.id]
+    after = _saved(missing.id)
+    assert after['model_fingerprint'] == before['model_fingerprint']
+    assert after['count'] == 1
+    assert _saved(images[1])['model_fingerprint'] == routes.model_fingerprint()
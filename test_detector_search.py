@@ -0,0 +1,103 @@
+"""
+検知クラス索引による画像検索（/detector/api/search）のテスト
+
+``python -m pytest test_detector_search.py`` で実行します。
+"""
+
+import pytest
+
+from apps.detector import routes
+from apps.models.model import DetectionClassIndex, UserImage, db
+
+
+def _det(name, confidence):
+    return {'class': name, 'confidence': confidence, 'bbox': {'x': 0, 'y': 0, 'width': 10, 'height': 10}}
+
+
+@pytest.fixture
+def search(app, make_user, login):
+    """alice の画像3件（犬のみ / 犬と人 / 猫）と bob の犬画像を保存し、alice の検索関数を返す"""
+    alice, bob = make_user('alice'), make_user('bob')
+    contents = {
+        'dog': (alice, [_det('dog', 0.9), _det('dog', 0.4)]),
+        'dog_person': (alice, [_det('dog', 0.6), _det('person', 0.8)]),
+        'cat': (alice, [_det('cat', 0.95)]),
+        'bob_dog': (bob, [_det('dog', 0.99)]),
+    }
+    images = {}
+    for key, (user, results) in contents.items():
+        image = UserImage(user_id=user.id, image_path=f'uploads/{key}.jpg', filename=f'{key}.jpg')
+        db.session.add(image)
+        db.session.commit()
+        routes.save_detection_results(image, results)
+        images[key] = image
+    client = login(app.test_client(), alice)
+
+    def do(query):
+        response = client.get(f'/detector/api/search?{query}')
+        data = response.get_json()
+        if response.status_code != 200:
+            return response.status_code
+        return {item['image_id'] for item in data['items']}
+
+    do.images = images
+    do.client = client
+    return do
+
+
+def _ids(images, *keys):
+    return {images[k].id for k in keys}
+
+
+def test_match_all_and_any(search):
+    images = search.images
+    assert search('classes=dog') == _ids(images, 'dog', 'dog_person')
+    assert search('classes=dog,person') == _ids(images, 'dog_person')
+    assert search('classes=dog,person&match=any') == _ids(images, 'dog', 'dog_person')
+    assert search('classes=person,cat&match=any') == _ids(images, 'dog_person', 'cat')
+    assert search('classes=horse') == set()
+
+
+def test_min_confidence_uses_max_per_class(search):
+    images = search.images
+    # 画像内で最も信頼度の高い検出で判定する（dog.jpg は 0.9 と 0.4）
+    assert search('classes=dog&min_confidence=0.7') == _ids(images, 'dog')
+    assert search('classes=dog,person&min_confidence=0.7&match=any') == _ids(images, 'dog', 'dog_person')
+    assert search('classes=dog,person&min_confidence=0.7') == set()
+
+
+def test_invalid_criteria_are_400(search):
+    assert search('') == 400
+    assert search('classes=dog&min_confidence=2') == 400
+    assert search('classes=dog&match=some') == 400
+    assert search('classes=' + ','.join(f'c{i}' for i in range(11))) == 400
+
+
+def test_results_include_class_summary_and_paginate(search):
+    data = search.client.get('/detector/api/search?classes=dog&limit=1').get_json()
+    assert len(data['items']) == 1 and data['next_cursor']
+    first = data['items'][0]
+    rest = search.client.get(f"/detector/api/search?classes=dog&limit=1&after={data['next_cursor']}").get_json()
+    assert {first['image_id'], rest['items'][0]['image_id']} == _ids(search.images, 'dog', 'dog_person')
+    summary = {item['image_id']: item['classes'] for item in data['items'] + rest['items']}
+    assert summary[search.images['dog'].id] == {'dog': {'count': 2, 'max_confidence': 0.9}}
+
+
+def test_resave_replaces_index_entries(search):
+    image = search.images['dog_person']
+
+    routes.save_detection_results(image, [_det('cat', 0.7)])
+
+    entries = DetectionClassIndex.query.filter_by(image_id=image.id).all()
+    assert [(e.class_name, e.count, e.max_confidence) for e in entries] == [('cat', 1, pytest.approx(0.7))]
+    assert search('classes=person') == set()
+    assert search('classes=cat') == _ids(search.images, 'cat', 'dog_person')
+
+
+def test_deleted_images_are_not_found(search):
+    image = search.images['cat']
+    assert search.client.post(f'/detector/delete/{image.id}').status_code == 302
+
+    assert search('classes=cat') == set()
+    classes = search.client.get('/detector/api/classes').get_json()['classes']
+    assert {c['class']: c['images'] for c in classes} == {'dog': 2, 'person': 1}
@@ -0,0 +1,109 @@
+"""
+アップロード画像の配信（send_image / OwnershipCache）のテスト
+
+``python -m pytest test_detector_serving.py`` で実行します。
+"""
+
+import io
+
+import pytest
+from PIL import Image
+
+from apps.detector import routes
+from apps.detector.serving import OwnershipCache, get_ownership_cache
+from apps.models.model import UserImage
+
+
+@pytest.fixture
+def shared(app, make_user, login, monkeypatch):
+    """同じ内容の画像を alice と bob がアップロードした状態（実体は1ファイルを共有）"""
+    monkeypatch.setattr(routes, 'enqueue_detection', lambda user_image, model_id=None: None)
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 48), (10, 200, 90)).save(buf, 'PNG')
+    clients = {}
+    for name in ('alice', 'bob'):
+        clients[name] = login(app.test_client(), make_user(name))
+        response = clients[name].post('/detector/upload', data={'file': (io.BytesIO(buf.getvalue()), 'a.png')},
+                                      content_type='multipart/form-data')
+        assert response.status_code == 302
+    images = UserImage.query.order_by(UserImage.id).all()
+    assert images[0].filename == images[1].filename
+    return clients, images[0]
+
+
+def test_etag_and_conditional_requests(app, shared):
+    clients, image = shared
+    url = f'/detector/uploads/{image.filename}'
+
+    response = clients['alice'].get(url)
+    assert response.status_code == 200
+    assert response.headers['ETag'] == f'"{image.content_hash}"'
+    assert 'private' in response.headers['Cache-Control'] and 'immutable' in response.headers['Cache-Control']
+    body = response.data
+
+    # 同じ内容を持っていればファイルを開かずに 304
+    assert clients['alice'].get(url, headers={'If-None-Match': f'"{image.content_hash}"'}).status_code == 304
+
+    partial = clients['alice'].get(url, headers={'Range': 'bytes=0-9'})
+    assert partial.status_code == 206
+    assert partial.data == body[:10]
+    assert partial.headers['Content-Range'] == f'bytes 0-9/{len(body)}'
+
+
+def test_x_accel_redirect_mode(app, shared):
+    clients, image = shared
+    app.config.update(DETECTOR_IMAGE_SENDFILE_MODE='x-accel', DETECTOR_IMAGE_ACCEL_PREFIX='/_internal/img/')
+
+    response = clients['alice'].get(f'/detector/uploads/{image.filename}')
+
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == f'/_internal/img/{image.filename}'
+    assert response.mimetype == 'image/png' and response.data == b''
+
+
+def test_x_sendfile_mode(app, shared):
+    clients, image = shared
+    app.config['DETECTOR_IMAGE_SENDFILE_MODE'] = 'x-sendfile'
+
+    response = clients['alice'].get(f'/detector/uploads/{image.filename}')
+
+    assert response.status_code == 200
+    assert response.headers['X-Sendfile'].endswith(image.filename)
+    assert not app.config['USE_X_SENDFILE']
+
+
+def test_delete_invalidates_cached_ownership(app, make_user, login, shared):
+    clients, image = shared
+    url = f'/detector/uploads/{image.filename}'
+    assert clients['alice'].get(url).status_code == 200
+    assert get_ownership_cache(app).get(image.user_id, image.filename) is not None
+
+    assert clients['alice'].post(f'/detector/delete/{image.id}').status_code == 302
+
+    # 実体は bob が参照しているため残るが、削除した alice からは見えない
+    assert clients['alice'].get(url).status_code == 404
+    assert clients['bob'].get(url).status_code == 200
+    assert login(app.test_client(), make_user('carol')).get(url).status_code == 404
+
+
+def test_ownership_cache_ttl_and_lru(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('apps.detector.serving.time.monotonic', lambda: now[0])
+    cache = OwnershipCache(ttl=30, max_entries=2)
+    cache.put(1, 'a.jpg', 10, 'h1')
+    cache.put(1, 'b.jpg', 11, 'h2')
+    assert cache.get(1, 'a.jpg') == (10, 'h1')
+    cache.put(2, 'c.jpg', 12, 'h3')
+
+    # 最も古く使われた b.jpg が追い出される
+    assert cache.get(1, 'b.jpg') is None
+    now[0] += 31
+    assert cache.get(1, 'a.jpg') is None
+    assert cache.stats()['hits'] == 1
+
+    cache.put(2, 'd.jpg', 13, 'h4')
+    cache.invalidate(2)
+    assert cache.get(2, 'd.jpg') is None
+    disabled = OwnershipCache(ttl=0)
+    disabled.put(1, 'a.jpg', 10, 'h1')
+    assert disabled.get(1, 'a.jpg') is None
@@ -0,0 +1,101 @@
+"""
+同一検知の同時実行の集約（SingleFlight）のテスト
+
+``python -m pytest test_detector_singleflight.py`` で実行します。
+"""
+
+import threading
+import time
+
+import pytest
+
+from apps.detector.singleflight import SingleFlight
+
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, '条件を満たさないままタイムアウトしました'
+        time.sleep(0.005)
+
+
+def _run_concurrently(flight, key, fn, n):
+    """n スレッドから同じ key で do() を呼び、先頭が fn を実行し始めてから (スレッド, 結果リスト) を返す"""
+    outcomes = []
+
+    def call():
+        try:
+            outcomes.append(flight.do(key, fn))
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(n)]
+    for t in threads:
+        t.start()
+    _wait_until(lambda: flight.stats()['coalesced'] == n - 1)
+    return threads, outcomes
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(2)
+        return {'count': 3}
+
+    threads, outcomes = _run_concurrently(flight, ('image', 1), fn, 4)
+    stats = flight.stats()
+    assert stats['in_flight'] == 1 and stats['waiting'] == 3
+    release.set()
+    for t in threads:
+        t.join(2)
+
+    assert len(calls) == 1
+    assert all(result is outcomes[0][0] for result, _shared in outcomes)
+    assert sorted(shared for _result, shared in outcomes) == [False, True, True, True]
+    assert flight.stats() == {'in_flight': 0, 'waiting': 0, 'executed': 1, 'coalesced': 3}
+
+
+def test_leader_exception_is_raised_to_waiters():
+    flight = SingleFlight()
+    release = threading.Event()
+    error = RuntimeError('inference failed')
+
+    def fn():
+        release.wait(2)
+        raise error
+
+    threads, outcomes = _run_concurrently(flight, 'key', fn, 3)
+    release.set()
+    for t in threads:
+        t.join(2)
+
+    assert outcomes == [error, error, error]
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_waiters_count_drops_as_waiters_wake():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    threads, _outcomes = _run_concurrently(flight, 'key', lambda: release.wait(2), 3)
+    assert flight.stats()['waiting'] == 2
+    release.set()
+    for t in threads:
+        t.join(2)
+
+    assert flight.stats()['waiting'] == 0
+
+
+def test_completed_calls_are_not_cached():
+    flight = SingleFlight()
+    results = iter([1, 2])
+
+    assert flight.do('key', lambda: next(results)) == (1, False)
+    assert flight.do('key', lambda: next(results)) == (2, False)
+    with pytest.raises(KeyError):
+        flight.do('key', lambda: {}['missing'])
+    assert flight.stats()['executed'] == 3
@@ -0,0 +1,82 @@
+"""
+画像のコンテンツアドレス保存のテスト
+
+``python -m pytest test_detector_storage.py`` で実行します。
+"""
+
+import datetime
+import io
+import json
+import os
+
+from PIL import Image
+
+from apps.detector import routes
+from apps.detector.storage import is_blob_key
+from apps.models.model import ImageBlob, UserImage, db
+
+
+def _jpeg(color):
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+def _legacy_image(app, user, name, data, uploaded_at):
+    """旧形式（アップロード先直下のフラットなファイル名）の画像行"""
+    upload_dir = app.config['DETECTOR_UPLOAD_FOLDER']
+    os.makedirs(upload_dir, exist_ok=True)
+    with open(os.path.join(upload_dir, name), 'wb') as f:
+        f.write(data)
+    image = UserImage(user_id=user.id, image_path=f'uploads/{name}', filename=name, original_filename=name,
+                      image_format='JPEG', uploaded_at=uploaded_at)
+    db.session.add(image)
+    db.session.commit()
+    return image
+
+
+def test_migrate_storage_keeps_uploaded_at_and_shares_blobs(app, make_user):
+    alice, bob = make_user('alice'), make_user('bob')
+    data = _jpeg((200, 30, 30))
+    uploaded_at = datetime.datetime(2020, 1, 1, 12, 0, 0)
+    first = _legacy_image(app, alice, 'a.jpg', data, uploaded_at)
+    second = _legacy_image(app, bob, 'b.jpg', data, uploaded_at + datetime.timedelta(days=1))
+    # 旧形式のサイドカーJSON
+    with open(os.path.join(app.config['DETECTOR_UPLOAD_FOLDER'], 'a.jpg.det.json'), 'w', encoding='utf-8') as f:
+        json.dump({'results': [], 'count': 0}, f)
+    ids = [first.id, second.id]
+
+    result = app.test_cli_runner().invoke(args=['detector', 'migrate-storage'])
+
+    assert result.exit_code == 0, result.output
+    db.session.expire_all()
+    first, second = (db.session.get(UserImage, image_id) for image_id in ids)
+    assert first.uploaded_at == uploaded_at
+    assert second.uploaded_at == uploaded_at + datetime.timedelta(days=1)
+    assert is_blob_key(first.filename) and first.filename == second.filename
+    assert first.image_path == f'uploads/{first.filename}'
+    assert db.session.get(ImageBlob, first.content_hash).refcount == 2
+    upload_dir = app.config['DETECTOR_UPLOAD_FOLDER']
+    assert not os.path.exists(os.path.join(upload_dir, 'a.jpg'))
+    assert os.path.exists(os.path.join(upload_dir, first.filename))
+    assert os.path.exists(routes.result_json_path(first.filename, first.id))
+
+
+def test_results_are_per_image_for_shared_blob(app, make_user):
+    """同じ実体を共有する画像でも検知結果は画像ごとに別々に保存・取得する"""
+    alice, bob = make_user('alice'), make_user('bob')
+    key = 'ab/cd/' + 'abcd' * 16 + '.jpg'
+    images = [UserImage(user_id=user.id, image_path=f'uploads/{key}', filename=key) for user in (alice, bob)]
+    db.session.add_all(images)
+    db.session.commit()
+
+    def results(name):
+        return [{'class': name, 'confidence': 0.8, 'bbox': {'x': 0, 'y': 0, 'width': 1, 'height': 1}}]
+
+    routes.save_detection_results(images[0], results('dog'))
+    routes.save_detection_results(images[1], results('cat'))
+
+    assert [r['class'] for r in routes.load_detection_results(images[0])['results']] == ['dog']
+    assert [r['class'] for r in routes.load_detection_results(images[1])['results']] == ['cat']
+    paths = {routes.result_json_path(key, image.id) for image in images}
+    assert len(paths) == 2 and all(os.path.exists(path) for path in paths)
@@ -0,0 +1,51 @@
+"""
+タイル分割推論（検出枠の統合）のテスト
+
+``python -m pytest test_detector_tiling.py`` で実行します。
+"""
+
+import io
+
+import numpy as np
+from PIL import Image
+
+from apps.detector.tiling import merge_boxes, tiled_inference
+
+
+def test_merge_keeps_whole_box_over_contained_fragment():
+    """部分枠の方が信頼度が高くても、それを含む大きな枠の範囲を残す"""
+    xyxy = [[0, 0, 640, 600], [0, 0, 800, 600]]
+    boxes, conf, cls = merge_boxes(xyxy, [0.95, 0.9], [0, 0])
+    assert boxes.tolist() == [[0, 0, 800, 600]]
+    assert conf.tolist() == [np.float32(0.95)]
+
+
+def test_merge_keeps_separate_objects():
+    """重ならない同クラスの枠・別クラスの枠は残す"""
+    xyxy = [[0, 0, 100, 100], [200, 200, 300, 300], [0, 0, 90, 90]]
+    boxes, _conf, cls = merge_boxes(xyxy, [0.9, 0.8, 0.7], [0, 0, 1])
+    assert len(boxes) == 3
+
+
+def test_tiled_object_crossing_tile_boundary():
+    """タイル境界をまたぐ画像全体の物体が、1タイル分に切り詰められない"""
+    width, height = 800, 600
+    buf = io.BytesIO()
+    Image.new('RGB', (width, height), (50, 90, 200)).save(buf, 'PNG')
+    buf.seek(0)
+
+    def predict_many(images):
+        # 代替モデル: 各入力のうち物体（画像本体）が写っている範囲を返す。タイルは信頼度が高い
+        results = []
+        for image in images[:-1]:
+            results.append(([[0, 0, image.width, image.height]], [0.95], [0]))
+        # 全体推論はレターボックス画像（余白を除いた範囲が画像本体）
+        scale = 640 / max(width, height)
+        pad_y = (640 - round(height * scale)) // 2
+        results.append(([[0, pad_y, 640, 640 - pad_y]], [0.9], [0]))
+        return results
+
+    xyxy, conf, cls = tiled_inference(buf, predict_many, lambda r: r, tile=640, overlap=0.2, max_side=4096)
+    assert len(xyxy) == 1
+    x1, y1, x2, y2 = xyxy[0]
+    assert (round(float(x2 - x1)), round(float(y2 - y1))) == (width, height)
@@ -0,0 +1,89 @@
+"""
+検知パイプラインのステージ別計測（StageTimer / StageMetrics）のテスト
+
+``python -m pytest test_detector_timing.py`` で実行します。
+"""
+
+import time
+
+from apps.detector import routes
+from apps.detector.timing import StageMetrics, StageTimer, get_stage_metrics, span
+from apps.models.model import UserImage, db
+
+
+def test_stage_timer_sums_repeated_stages():
+    timer = StageTimer()
+    with timer.span('decode'):
+        time.sleep(0.01)
+    timer.add('inference', 4.0)
+    timer.add('inference', 1.5)
+    with span(None, 'ignored'):
+        pass
+
+    data = timer.to_dict()
+
+    assert data['decode'] >= 10
+    assert data['inference'] == 5.5
+    assert 'ignored' not in data
+    assert data['total'] >= data['decode']
+
+
+def test_stage_timer_records_time_when_block_raises():
+    timer = StageTimer()
+    try:
+        with timer.span('save'):
+            raise OSError('disk full')
+    except OSError:
+        pass
+    assert 'save' in timer.to_dict()
+
+
+def test_stage_metrics_histogram_and_quantiles():
+    metrics = StageMetrics()
+    for ms in [0.5] * 90 + [30] * 9 + [20000]:
+        metrics.observe({'inference': ms})
+
+    stage = metrics.to_dict()['stages']['inference']
+
+    assert stage['count'] == 100 and stage['max_ms'] == 20000
+    assert stage['buckets']['1'] == 90 and stage['buckets']['50'] == 9 and stage['buckets']['+Inf'] == 1
+    # 分位点は該当バケットの上限（最大値を超えない）
+    assert stage['p50_ms'] == 1
+    assert stage['p95_ms'] == 50
+    assert stage['p99_ms'] == 50
+    assert StageMetrics().to_dict()['stages'] == {}
+
+    metrics.reset()
+    assert metrics.to_dict()['stages'] == {}
+
+
+def test_saved_results_record_timings_and_metrics(app, make_user):
+    user = make_user()
+    image = UserImage(user_id=user.id, image_path='uploads/a.jpg', filename='a.jpg')
+    db.session.add(image)
+    db.session.commit()
+    timer = StageTimer()
+    timer.add('inference', 7.0)
+
+    payload = routes.save_detection_results(image, [], timer=timer)
+
+    assert payload['timings']['inference'] == 7.0
+    assert routes.load_detection_results(image)['timings']['inference'] == 7.0
+    stages = get_stage_metrics(app).to_dict()['stages']
+    assert stages['inference']['count'] == stages['save']['count'] == 1
+
+
+def test_metrics_endpoint_for_admin_only(app, make_user, login):
+    get_stage_metrics(app).observe({'inference': 12.0, 'total': 20.0})
+    user, admin = make_user('alice'), make_user('root')
+    admin.is_admin = True
+    db.session.commit()
+
+    assert login(app.test_client(), user).get('/admin/detector/metrics').status_code == 403
+    client = login(app.test_client(), admin)
+    data = client.get('/admin/detector/metrics').get_json()
+    assert data['stages']['inference']['count'] == 1
+
+    # POST でこのプロセスの集計をリセットする
+    assert client.post('/admin/detector/metrics').get_json()['stages'] == {}
+    assert get_stage_metrics(app).to_dict()['stages'] == {}